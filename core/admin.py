@@ -30,8 +30,8 @@ class ConnectionAdmin(admin.ModelAdmin):
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'receiver', 'timestamp', 'is_read')
-    list_filter = ('is_read', 'timestamp')
+    list_display = ('sender', 'receiver', 'timestamp')
+    list_filter = ('timestamp',)
 
 @admin.register(Like)
 class LikeAdmin(admin.ModelAdmin):
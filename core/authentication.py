@@ -0,0 +1,82 @@
+"""JWT authentication that resolves the user and profile once per token."""
+
+import copy
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .services import LocalLRUCache
+
+AUTH_CACHE_SIZE = 4096  # (user_id, jti) entries kept per process
+AUTH_CACHE_TIMEOUT = 30  # bounds staleness of users changed by other processes
+
+# (user_id, jti) -> (user with its profile loaded, monotonic load time)
+_users = LocalLRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TIMEOUT)
+# user_id -> monotonic time of the last local change; older entries are reloaded
+_changed = LocalLRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TIMEOUT)
+
+
+def forget_user(*user_ids):
+    """Makes this process reload the users on their next authenticated request."""
+    now = time.monotonic()
+    for user_id in user_ids:
+        _changed.set(str(user_id), now)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user together with `user.profile` in
+    one query and keeps both in a short-lived per-process cache keyed by
+    (user_id, jti).
+
+    Views read `request.user.profile` without another query, and repeat
+    requests with the same token skip the database entirely. Every request
+    gets its own copy of the cached objects, so in-memory edits never leak
+    into other requests. Saves in this process take effect on the next
+    request; other processes see them within AUTH_CACHE_TIMEOUT seconds.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        # Newer tokens carry the id as a string; normalise so forget_user matches
+        key = (str(user_id), validated_token.get(api_settings.JTI_CLAIM))
+        entry = _users.get(key) if key[1] else None
+        if entry is not None:
+            user, loaded_at = entry
+            changed_at = _changed.get(key[0])
+            if changed_at is None or changed_at < loaded_at:
+                return copy.deepcopy(user)
+
+        loaded_at = time.monotonic()
+        try:
+            user = self.user_model.objects.select_related('profile').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        if key[1]:
+            _users.set(key, (copy.deepcopy(user), loaded_at))
+        return user
+
+
+def user_from_token(token_str):
+    """The user for a raw access token string, or AnonymousUser if it is invalid."""
+    try:
+        return CachedJWTAuthentication().get_user(AccessToken(token_str))
+    except (TokenError, InvalidToken, AuthenticationFailed):
+        return AnonymousUser()
@@ -0,0 +1,191 @@
+"""
+Per-process write batching for chat messages sent over WebSocket.
+
+Instead of every `chat_message` frame taking a thread-pool slot for its own
+profile lookup, insert, notification insert and serialization, consumers
+hand messages to the process-wide `MessageBatcher`. It collects whatever
+arrives within a few milliseconds and persists the batch with `bulk_create`
+in one transaction, in one thread hop, before acking each sender.
+
+The pending buffer is bounded. When it is full `submit` raises
+`BatcherFull` right away, so clients get an explicit "slow down" instead of
+the server queueing unbounded work.
+"""
+
+import asyncio
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .executors import db_sync_to_async
+from .models import ChatMessage, Notification, Profile
+from .notifications import write_notifications
+from .serializers import ChatMessageSerializer
+from .services import ConversationService, PartnerService
+
+
+# persist_messages results for messages that were not saved
+BLOCKED = 'blocked'
+NOT_FOUND = 'not_found'
+
+
+class BatcherFull(Exception):
+    """The pending-message buffer is full; the client should retry later."""
+
+
+def _notification_for(message):
+    content = message.content
+    return Notification(
+        recipient=message.receiver,
+        sender=message.sender,
+        notification_type='MESSAGE',
+        title=f'New message from {message.sender.username}',
+        body=content[:50] + ('...' if len(content) > 50 else '')
+    )
+
+
+def _build_messages(items, indexes, expires_at):
+    return {
+        i: ChatMessage(sender=items[i][0], receiver=items[i][1], content=items[i][2], expires_at=expires_at)
+        for i in indexes
+    }
+
+
+def _insert(messages):
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create(messages)
+        # record_messages pushes the same receivers' badges once the batch commits
+        write_notifications([_notification_for(message) for message in messages], push=False)
+        ConversationService.record_messages(messages)
+
+
+def persist_messages(items):
+    """
+    Saves a batch of (sender_profile, receiver_profile, content) items.
+
+    Messages plus their notifications are inserted with two bulk_creates in
+    a single transaction, which also updates each pair's Conversation; block status comes from the cached blocklist, so
+    a steady-state batch runs no SELECTs. Returns, per item, the serialized
+    message, BLOCKED, or NOT_FOUND when the receiver no longer exists.
+    """
+    # One expiry for the whole batch
+    expires_at = timezone.now() + timedelta(days=7)
+    results = [None] * len(items)
+    allowed = []
+    for i, (sender, receiver, _) in enumerate(items):
+        if PartnerService.is_blocked(sender, receiver.id):
+            results[i] = BLOCKED
+        else:
+            allowed.append(i)
+
+    messages = _build_messages(items, allowed, expires_at)
+    if messages:
+        try:
+            _insert(list(messages.values()))
+        except IntegrityError:
+            # A cached receiver was deleted: find it, forget it, insert the rest
+            receiver_ids = {message.receiver_id for message in messages.values()}
+            existing = set(Profile.objects.filter(id__in=receiver_ids).values_list('id', flat=True))
+            PartnerService.forget(*(receiver_ids - existing))
+            for i, message in messages.items():
+                if message.receiver_id not in existing:
+                    results[i] = NOT_FOUND
+            messages = _build_messages(items, [i for i in messages if results[i] is None], expires_at)
+            if messages:
+                _insert(list(messages.values()))
+
+    data = ChatMessageSerializer(list(messages.values()), many=True).data
+    for i, item in zip(messages, data):
+        results[i] = item
+    return results
+
+
+class MessageBatcher:
+    """
+    Collects chat messages for `window` seconds (or until `max_batch` are
+    waiting) and persists them together with `persist_messages`.
+
+    One flusher task runs per event loop; it is started on first use and
+    restarted transparently if the loop changes (e.g. between test runs).
+    """
+
+    def __init__(self, window=None, max_batch=None, max_pending=None):
+        self.window = window if window is not None else settings.CHAT_BATCH_WINDOW_MS / 1000
+        self.max_batch = max_batch or settings.CHAT_BATCH_MAX_SIZE
+        self.max_pending = max_pending or settings.CHAT_BATCH_MAX_PENDING
+        self._loop = None
+        self._queue = None
+        self._flusher = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._flusher.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._flusher = loop.create_task(self._run())
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, sender, receiver, content):
+        """
+        Queues a message and waits until its batch is committed.
+
+        Returns what `persist_messages` produced for it.
+        Raises BatcherFull without waiting when the buffer is at capacity.
+        """
+        self._ensure_running()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((sender, receiver, content, future))
+        except asyncio.QueueFull:
+            raise BatcherFull(f"{self.max_pending} messages already pending")
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            futures = [item[3] for item in batch]
+            try:
+                results = await db_sync_to_async(persist_messages)([item[:3] for item in batch])
+            except Exception as exc:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for future, result in zip(futures, results):
+                # The sender may have disconnected while the batch was in flight
+                if not future.done():
+                    future.set_result(result)
+
+
+_batcher = None
+
+
+def get_batcher():
+    """Returns the process-wide MessageBatcher."""
+    global _batcher
+    if _batcher is None:
+        _batcher = MessageBatcher()
+    return _batcher
@@ -1,20 +1,42 @@
 """WebSocket consumers for real-time chat functionality."""
 
+import asyncio
+import heapq
 import json
+import logging
+import time
+from operator import itemgetter
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from .models import ChatMessage, Profile, Notification
-from .serializers import ChatMessageSerializer
+from django.db.models import Q
+from .batching import BLOCKED, NOT_FOUND, BatcherFull, get_batcher
+from .executors import db_sync_to_async
+from .delivery import clean_device_id, deliver, device_group, post_group, profile_group
+from .models import ChatMessage, Conversation, Notification, Post, Profile
+from .serializers import NotificationSerializer, serialize_messages
+from .services import (
+    LAST_ACTIVE_WRITE_INTERVAL, PARTNER_CACHE_TIMEOUT, PRESENCE_HEARTBEAT_INTERVAL,
+    ConversationService, FriendService, LocalLRUCache, PartnerService, PresenceService,
+)
+
+logger = logging.getLogger(__name__)
+
+PARTNER_CONNECTION_CACHE_SIZE = 32
+SYNC_BATCH_SIZE = 100  # max messages (and notifications) per sync_batch
+TYPING_THROTTLE_SECONDS = 3  # at most one typing event per receiver per interval
+MAX_POST_SUBSCRIPTIONS = 20  # collaborative posts one socket may follow
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """
     Handles real-time chat via WebSocket.
     
-    Each user gets their own channel group: 'chat_<profile_id>'
-    When a message is sent, it is saved to DB and broadcast to both
-    the sender's and receiver's groups for instant delivery.
+    Each socket joins its profile's group 'chat_<profile_id>' and its
+    device's group 'chat_<profile_id>.<device_id>' (device id from the
+    `?device=` query parameter, or generated). When a message is sent, it
+    is saved to DB and delivered to the receiver's devices and the sender's
+    other devices (see core.delivery).
     """
 
     async def connect(self):
@@ -29,14 +51,38 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Join user's personal channel group
-        self.group_name = f"chat_{self.profile.id}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # Recent conversation partners, checked before the process-wide cache
+        self.partners = LocalLRUCache(PARTNER_CONNECTION_CACHE_SIZE, PARTNER_CACHE_TIMEOUT)
+
+        # Join user's personal and per-device channel groups
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        self.device_id = clean_device_id(query.get("device", [None])[0])
+        self.group_name = profile_group(self.profile.id)
+        self.groups_joined = [self.group_name, device_group(self.profile.id, self.device_id)]
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.post_groups = set()
         await self.accept()
 
+        # Last typing event sent per receiver, and last presence/last_active writes
+        self.typing_sent = LocalLRUCache(PARTNER_CONNECTION_CACHE_SIZE, TYPING_THROTTLE_SECONDS)
+        self.presence_written_at = self.last_active_written_at = time.monotonic()
+        came_online = await db_sync_to_async(PresenceService.connect)(self.profile.id, self.device_id)
+        # Quiet clients send nothing, so the socket keeps its own presence alive
+        self.presence_task = asyncio.create_task(self.keep_presence())
+        if came_online:
+            await self.broadcast_presence(online=True)
+
     async def disconnect(self, close_code):
-        if hasattr(self, 'group_name'):
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'presence_task', None):
+            self.presence_task.cancel()
+        if hasattr(self, 'groups_joined'):
+            for group in [*self.groups_joined, *self.post_groups]:
+                await self.channel_layer.group_discard(group, self.channel_name)
+        if hasattr(self, 'presence_written_at'):
+            went_offline = await db_sync_to_async(PresenceService.disconnect)(self.profile.id, self.device_id)
+            if went_offline:
+                await self.broadcast_presence(online=False)
 
     async def receive(self, text_data):
         """Handle incoming messages from the WebSocket client."""
@@ -47,6 +93,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         msg_type = data.get("type", "chat_message")
+        # Any frame counts as a heartbeat; the presence task covers quiet sockets
+        await self.touch_presence()
 
         if msg_type == "chat_message":
             await self.handle_chat_message(data)
@@ -54,6 +102,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_mark_read(data)
         elif msg_type == "typing":
             await self.handle_typing(data)
+        elif msg_type == "sync":
+            await self.handle_sync(data)
+        elif msg_type == "sync_continue":
+            await self.handle_sync_continue(data)
+        elif msg_type == "subscribe_post":
+            await self.handle_subscribe_post(data)
+        elif msg_type == "unsubscribe_post":
+            await self.handle_unsubscribe_post(data)
 
     async def handle_chat_message(self, data):
         """Save a text message to DB and broadcast to both sender + receiver."""
@@ -64,20 +120,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({"error": "receiver_id and content are required"}))
             return
 
-        # Save to database
-        message_data = await self.save_message(receiver_id, content)
-        if not message_data:
-            await self.send(text_data=json.dumps({"error": "Failed to save message"}))
+        receiver = await self.get_partner(receiver_id)
+        if receiver is None:
+            await self.send(text_data=json.dumps({"error": "User not found"}))
             return
 
-        # Broadcast to receiver's channel group
-        receiver_group = f"chat_{receiver_id}"
-        await self.channel_layer.group_send(
-            receiver_group,
-            {
-                "type": "chat.message",
-                "message": message_data,
-            }
+        # Save to database, batched with other messages sent by this process
+        try:
+            message_data = await get_batcher().submit(self.profile, receiver, content)
+        except BatcherFull:
+            await self.send(text_data=json.dumps({
+                "type": "backpressure",
+                "error": "Server is busy, please retry shortly",
+            }))
+            return
+        if message_data == BLOCKED:
+            await self.send(text_data=json.dumps({"error": "You can't message this user"}))
+            return
+        if message_data == NOT_FOUND:
+            self.partners.pop(receiver.id)
+            await self.send(text_data=json.dumps({"error": "User not found"}))
+            return
+
+        # Deliver to the receiver's devices and the sender's other devices
+        await deliver(
+            [receiver.id, self.profile.id],
+            {"type": "chat.message", "message": message_data},
+            origin=(self.profile.id, self.channel_name),
+            layer=self.channel_layer,
         )
 
         # Also send confirmation back to sender
@@ -87,10 +157,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     async def handle_mark_read(self, data):
-        """Mark all messages from a sender as read."""
-        sender_id = data.get("sender_id")
+        """Mark messages from a sender as read: all of them, or up to message `up_to`."""
+        try:
+            sender_id = int(data.get("sender_id") or 0)
+            up_to = int(data["up_to"]) if data.get("up_to") else None
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({"error": "Invalid mark_read"}))
+            return
         if sender_id:
-            count = await self.mark_messages_read(sender_id)
+            count = await self.mark_messages_read(sender_id, up_to)
             await self.send(text_data=json.dumps({
                 "type": "messages_read",
                 "sender_id": sender_id,
@@ -98,23 +173,140 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }))
 
     async def handle_typing(self, data):
-        """Broadcast typing indicator to the other user."""
-        receiver_id = data.get("receiver_id")
-        if receiver_id:
-            receiver_group = f"chat_{receiver_id}"
-            await self.channel_layer.group_send(
-                receiver_group,
-                {
-                    "type": "chat.typing",
-                    "sender_id": self.profile.id,
-                    "sender_name": self.profile.username,
-                }
-            )
+        """
+        Broadcast typing indicator to the other user.
+
+        Clients send one event per keystroke; only the first per receiver in
+        every TYPING_THROTTLE_SECONDS reaches the channel layer, which is
+        enough for a "typing..." hint that clears itself after a few seconds.
+        """
+        try:
+            receiver_id = int(data.get("receiver_id"))
+        except (TypeError, ValueError):
+            return
+        if self.typing_sent.get(receiver_id) is not None:
+            return
+        self.typing_sent.set(receiver_id, True)
+        await deliver(
+            [receiver_id],
+            {
+                "type": "chat.typing",
+                "sender_id": self.profile.id,
+                "sender_name": self.profile.username,
+            },
+            layer=self.channel_layer,
+        )
+
+    async def handle_subscribe_post(self, data):
+        """Follow live updates of a collaborative post the user authors or contributes to."""
+        post_id = data.get("post_id")
+        if len(self.post_groups) >= MAX_POST_SUBSCRIPTIONS:
+            await self.send(text_data=json.dumps({"error": "Too many post subscriptions"}))
+            return
+        if not await self.can_follow_post(post_id):
+            await self.send(text_data=json.dumps({"error": "Post not found"}))
+            return
+        group = post_group(int(post_id))
+        if group not in self.post_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.post_groups.add(group)
+        await self.send(text_data=json.dumps({"type": "subscribed", "post_id": int(post_id)}))
+
+    async def handle_unsubscribe_post(self, data):
+        try:
+            group = post_group(int(data.get("post_id")))
+        except (TypeError, ValueError):
+            return
+        if group in self.post_groups:
+            self.post_groups.discard(group)
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def touch_presence(self, force=False):
+        """Refreshes the online key, folding heartbeats into one write per interval."""
+        now = time.monotonic()
+        if not force and now - self.presence_written_at < PRESENCE_HEARTBEAT_INTERVAL:
+            return
+        self.presence_written_at = now
+        write_last_active = now - self.last_active_written_at >= LAST_ACTIVE_WRITE_INTERVAL
+        if write_last_active:
+            self.last_active_written_at = now
+        await db_sync_to_async(PresenceService.heartbeat)(self.profile.id, write_last_active, self.device_id)
+
+    async def keep_presence(self):
+        """Refreshes presence every PRESENCE_HEARTBEAT_INTERVAL while the socket is open."""
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                await self.touch_presence(force=True)
+            except Exception:
+                # A cache or database hiccup must not end the heartbeat
+                logger.exception("Presence heartbeat failed for profile %s", self.profile.id)
+
+    async def broadcast_presence(self, online):
+        """Tells online friends that this profile came online or went offline."""
+        await deliver(
+            await self.get_friend_ids(),
+            {
+                "type": "chat.presence",
+                "profile_id": self.profile.id,
+                "online": online,
+            },
+            layer=self.channel_layer,
+        )
+
+    async def handle_sync(self, data):
+        """
+        Catches a reconnecting client up from the last message and
+        notification ids it has seen, instead of it re-fetching over REST.
+
+        Replies with one `sync_batch` (missed messages in both directions,
+        notifications, and read receipts for conversations changed since).
+        When `has_more` is set the client pulls the next batch with
+        `sync_continue`, so a slow client is never flooded. Live messages
+        can arrive during a sync; clients de-duplicate by id.
+        """
+        try:
+            self.sync_state = {
+                "last_message_id": int(data.get("last_message_id") or 0),
+                "last_notification_id": int(data.get("last_notification_id") or 0),
+                "batch_size": max(1, min(int(data.get("batch_size") or SYNC_BATCH_SIZE), SYNC_BATCH_SIZE)),
+            }
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({"error": "Invalid sync cursor"}))
+            return
+        await self.send_sync_batch(with_receipts=True)
+
+    async def handle_sync_continue(self, data):
+        if not getattr(self, "sync_state", None):
+            await self.send(text_data=json.dumps({"error": "No sync in progress"}))
+            return
+        await self.send_sync_batch(with_receipts=False)
+
+    async def send_sync_batch(self, with_receipts):
+        state = self.sync_state
+        batch = await self.load_sync_batch(
+            state["last_message_id"], state["last_notification_id"], state["batch_size"], with_receipts
+        )
+        if batch["messages"]:
+            state["last_message_id"] = batch["messages"][-1]["id"]
+        if batch["notifications"]:
+            state["last_notification_id"] = batch["notifications"][-1]["id"]
+        if not batch["has_more"]:
+            self.sync_state = None
+
+        await self.send(text_data=json.dumps({
+            "type": "sync_batch",
+            **batch,
+            "last_message_id": state["last_message_id"],
+            "last_notification_id": state["last_notification_id"],
+        }))
 
     # ─── Channel Layer Event Handlers ───
 
     async def chat_message(self, event):
         """Called when a message is received from the channel layer."""
+        if event.get("origin") == self.channel_name:
+            return  # this socket already got `message_sent`
         await self.send(text_data=json.dumps({
             "type": "new_message",
             "message": event["message"],
@@ -128,42 +320,105 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "sender_name": event["sender_name"],
         }))
 
-    # ─── Database Operations (sync → async) ───
+    async def chat_presence(self, event):
+        """Called when a friend comes online or goes offline."""
+        await self.send(text_data=json.dumps({
+            "type": "presence",
+            "profile_id": event["profile_id"],
+            "online": event["online"],
+        }))
+
+    async def post_updated(self, event):
+        """Called when a followed collaborative post changes."""
+        await self.send(text_data=json.dumps({
+            "type": "post_updated",
+            "post_id": event["post_id"],
+            "contributor_id": event["contributor_id"],
+        }))
+
+    async def badges(self, event):
+        """Called when this profile's unread counters change."""
+        await self.send(text_data=json.dumps({
+            "type": "badges",
+            "notifications": event["notifications"],
+            "messages": event["messages"],
+        }))
+
+    # ─── Database Operations ───
+    # Single-row lookups use the async ORM. Writes and multi-query work run
+    # on the CHAT_DB_THREADS pool (core.executors): in Django 5.2 the async
+    # ORM still funnels every query through one thread-sensitive executor.
+
+    async def get_profile(self, user):
+        # JWTAuthMiddleware loads the profile together with the user
+        if type(user).profile.is_cached(user):
+            return getattr(user, 'profile', None)
+        return await Profile.objects.filter(user=user).afirst()
 
-    @database_sync_to_async
-    def get_profile(self, user):
+    @db_sync_to_async
+    def get_friend_ids(self):
+        return FriendService.get_friend_ids(self.profile.id)
+
+    async def can_follow_post(self, post_id):
         try:
-            return user.profile
-        except Profile.DoesNotExist:
-            return None
+            post_id = int(post_id)
+        except (TypeError, ValueError):
+            return False
+        return await Post.objects.filter(
+            Q(author=self.profile) | Q(contributors=self.profile), pk=post_id, is_collaborative=True
+        ).aexists()
 
-    @database_sync_to_async
-    def save_message(self, receiver_id, content):
+    async def get_partner(self, receiver_id):
         try:
-            receiver = Profile.objects.get(pk=receiver_id)
-            message = ChatMessage.objects.create(
-                sender=self.profile,
-                receiver=receiver,
-                content=content,
-            )
-            # Create notification
-            preview = content[:50]
-            Notification.objects.create(
-                recipient=receiver,
-                sender=self.profile,
-                notification_type='MESSAGE',
-                title=f'New message from {self.profile.username}',
-                body=preview + ('...' if len(content) > 50 else '')
-            )
-            serializer = ChatMessageSerializer(message)
-            return serializer.data
-        except Profile.DoesNotExist:
+            receiver_id = int(receiver_id)
+        except (TypeError, ValueError):
             return None
+        receiver = self.partners.get(receiver_id)
+        if receiver is None:
+            receiver = await PartnerService.aget_partner(receiver_id)
+            if receiver is not None:
+                self.partners.set(receiver_id, receiver)
+        return receiver
+
+    @db_sync_to_async
+    def load_sync_batch(self, last_message_id, last_notification_id, limit, with_receipts):
+        profile = self.profile
+        # One capped index range scan per direction, merged by id
+        pages = [
+            serialize_messages(
+                ChatMessage.objects.with_read_state()
+                .filter(id__gt=last_message_id, **{field: profile}).order_by('id')[:limit + 1]
+            )
+            for field in ('sender', 'receiver')
+        ]
+        messages = list({m['id']: m for m in heapq.merge(*pages, key=itemgetter('id'))}.values())
+        notifications = NotificationSerializer(
+            Notification.objects.filter(recipient=profile, id__gt=last_notification_id).order_by('id')[:limit + 1],
+            many=True
+        ).data
+
+        receipts = []
+        if with_receipts:
+            # Partner-side read state for conversations touched since the client's last message
+            conversations = Conversation.objects.filter(Q(participant_a=profile) | Q(participant_b=profile))
+            since = ChatMessage.objects.filter(pk=last_message_id).values_list('timestamp', flat=True).first()
+            if since is not None:
+                conversations = conversations.filter(updated_at__gte=since)
+            for conversation in conversations:
+                partner_is_a = conversation.participant_a_id != profile.id
+                receipts.append({
+                    "partner_id": conversation.participant_a_id if partner_is_a else conversation.participant_b_id,
+                    "unread_by_partner": conversation.unread_a if partner_is_a else conversation.unread_b,
+                    "read_up_to": conversation.read_a if partner_is_a else conversation.read_b,
+                })
+
+        return {
+            "messages": messages[:limit],
+            "notifications": list(notifications[:limit]),
+            "read_receipts": receipts,
+            "has_more": len(messages) > limit or len(notifications) > limit,
+        }
 
-    @database_sync_to_async
-    def mark_messages_read(self, sender_id):
-        return ChatMessage.objects.filter(
-            sender_id=sender_id,
-            receiver=self.profile,
-            is_read=False,
-        ).update(is_read=True)
+    @db_sync_to_async
+    def mark_messages_read(self, sender_id, up_to=None):
+        return ConversationService.mark_read(self.profile.id, sender_id, up_to)
@@ -0,0 +1,96 @@
+"""
+Event delivery on top of the channel layer.
+
+Sockets join three kinds of groups:
+
+    chat_<profile_id>              every socket of a profile
+    chat_<profile_id>.<device_id>  the socket(s) of one device
+    post_<post_id>                 sockets following a collaborative post
+
+`deliver` fans an event out to profiles with one `group_send` each. It
+does not consult the presence keys first: a profile without sockets has
+an empty group, which costs the layer next to nothing, while a presence
+key that lapsed under a connected socket would silently drop its
+messages. Recipient sets that are known up front (a post's author and contributors) get their own group, so
+notifying all of them is a single `group_send`. Only the portable
+channel-layer API is used, so this works the same on InMemoryChannelLayer
+and on RedisChannelLayer, where groups are sharded across hosts by name.
+"""
+
+import asyncio
+import re
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .services import BadgeService
+
+DEVICE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,40}$')
+
+
+def profile_group(profile_id):
+    return f"chat_{profile_id}"
+
+
+def device_group(profile_id, device_id):
+    return f"chat_{profile_id}.{device_id}"
+
+
+def post_group(post_id):
+    return f"post_{post_id}"
+
+
+def clean_device_id(device_id):
+    """The client's device id if it is usable in a group name, otherwise a fresh one."""
+    if device_id and DEVICE_ID_RE.match(device_id):
+        return device_id
+    return uuid.uuid4().hex[:12]
+
+
+async def deliver(profile_ids, event, origin=None, layer=None):
+    """
+    Sends `event` to every socket of each profile in `profile_ids`.
+
+    `origin` is the channel_name of the socket that caused the event, given
+    as (profile_id, channel_name): the event is tagged with it so that
+    socket ignores its own copy while the profile's other devices get it.
+    Returns the ids the event was sent to.
+    """
+    layer = layer or get_channel_layer()
+    profile_ids = set(profile_ids)
+    if origin is not None:
+        event = {**event, "origin": origin[1]}
+    await asyncio.gather(*(layer.group_send(profile_group(pid), event) for pid in profile_ids))
+    return profile_ids
+
+
+async def deliver_to_device(profile_id, device_id, event, layer=None):
+    """Sends `event` to one device of a profile."""
+    layer = layer or get_channel_layer()
+    await layer.group_send(device_group(profile_id, device_id), event)
+
+
+async def deliver_to_post(post_id, event, layer=None):
+    """Sends `event` to every socket following the post, in one group_send."""
+    layer = layer or get_channel_layer()
+    await layer.group_send(post_group(post_id), event)
+
+
+def deliver_to_post_sync(post_id, event):
+    """`deliver_to_post` for synchronous views."""
+    async_to_sync(deliver_to_post)(post_id, event)
+
+
+async def deliver_badges(counts, layer=None):
+    """Sends each profile in {profile_id: counts} a `badges` event with its own counts."""
+    layer = layer or get_channel_layer()
+    await asyncio.gather(*(
+        layer.group_send(profile_group(pid), {"type": "badges", **values}) for pid, values in counts.items()
+    ))
+
+
+def push_badges(profile_ids):
+    """Pushes current unread counts to the sockets of `profile_ids`."""
+    if profile_ids:
+        async_to_sync(deliver_badges)(BadgeService.counts_many(sorted(set(profile_ids))))
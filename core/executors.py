@@ -0,0 +1,44 @@
+"""
+Executor for the synchronous database calls left in async code.
+
+`database_sync_to_async` runs every call on Django's single
+thread-sensitive executor, so a worker process runs one query at a time
+for all of its sockets. `db_sync_to_async` runs them on a pool of
+CHAT_DB_THREADS threads instead, each with its own connection. With
+CHAT_DB_THREADS = 0 it is plain `database_sync_to_async`.
+"""
+
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    """The shared pool for the configured size, or None for thread-sensitive mode."""
+    size = settings.CHAT_DB_THREADS
+    if size <= 0:
+        return None
+    with _lock:
+        executor = _executors.get(size)
+        if executor is None:
+            executor = _executors[size] = ThreadPoolExecutor(size, thread_name_prefix='chat-db')
+    return executor
+
+
+def db_sync_to_async(func):
+    """Like `database_sync_to_async`, but runs `func` on the CHAT_DB_THREADS pool."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        executor = get_executor()
+        if executor is None:
+            call = database_sync_to_async(func)
+        else:
+            call = database_sync_to_async(func, thread_sensitive=False, executor=executor)
+        return await call(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,272 @@
+"""
+Compact, read-only snapshots of the CONNECTED social graph.
+
+The graph is stored as a CSR (compressed sparse row) adjacency in three
+`.npy` files so discovery experiments (PageRank, community detection, ...)
+can run without touching the ORM:
+
+    nodes.npy    int64[n]      profile ids, sorted ascending
+    indptr.npy   int64[n + 1]  row offsets into `indices`
+    indices.npy  int32[2 * e]  neighbour positions (indexes into `nodes`)
+    meta.json    counts and creation time
+
+Files are written with the standard library only. They are valid NumPy
+arrays, so `numpy.load(path, mmap_mode='r')` works when NumPy is available,
+but `GraphSnapshot` memory-maps them without any extra dependency.
+"""
+
+import ast
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+
+from django.utils import timezone
+
+NPY_MAGIC = b'\x93NUMPY'
+NODES_FILE = 'nodes.npy'
+INDPTR_FILE = 'indptr.npy'
+INDICES_FILE = 'indices.npy'
+META_FILE = 'meta.json'
+SNAPSHOT_FILES = (NODES_FILE, INDPTR_FILE, INDICES_FILE, META_FILE)
+
+# array typecode -> (numpy descr, itemsize)
+_DTYPES = {
+    'q': ('<i8', 8),
+    'i': ('<i4', 4),
+}
+
+
+def _write_npy(path, values, typecode):
+    """Writes an `array` as a version 1.0 `.npy` file (little-endian, 1-D)."""
+    descr, itemsize = _DTYPES[typecode]
+    if values.itemsize != itemsize:
+        values = array(typecode, values)
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, len(values))
+    # Magic (6) + version (2) + header length (2) + header must align to 64 bytes
+    padding = 64 - (len(NPY_MAGIC) + 4 + len(header) + 1) % 64
+    header = header + ' ' * padding + '\n'
+
+    if sys.byteorder == 'big':
+        values = array(typecode, values)
+        values.byteswap()
+
+    with open(path, 'wb') as fh:
+        fh.write(NPY_MAGIC + b'\x01\x00')
+        fh.write(struct.pack('<H', len(header)))
+        fh.write(header.encode('latin1'))
+        values.tofile(fh)
+
+
+def _map_npy(path):
+    """
+    Memory-maps a 1-D `.npy` file.
+
+    Returns the mmap and the chain of memoryviews over it; the last one is the
+    typed view. All of them must be released before the mmap can be closed.
+    """
+    with open(path, 'rb') as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[:6] != NPY_MAGIC or mm[6] != 1:
+        mm.close()
+        raise ValueError(f"{path} is not a version 1.0 .npy file")
+    header_len = struct.unpack('<H', mm[8:10])[0]
+    header = ast.literal_eval(mm[10:10 + header_len].decode('latin1'))
+
+    typecode = next(
+        (code for code, (descr, _) in _DTYPES.items() if descr == header['descr']),
+        None
+    )
+    if typecode is None or header['fortran_order'] or len(header['shape']) != 1:
+        mm.close()
+        raise ValueError(f"{path} has an unsupported layout: {header}")
+    if sys.byteorder == 'big':
+        mm.close()
+        raise ValueError("Memory-mapped snapshots require a little-endian host")
+
+    offset = 10 + header_len
+    end = offset + header['shape'][0] * _DTYPES[typecode][1]
+    raw = memoryview(mm)
+    sliced = raw[offset:end]
+    return mm, (raw, sliced, sliced.cast(typecode))
+
+
+def build_csr(edges):
+    """
+    Builds an undirected CSR adjacency from an iterable of (a, b) profile ids.
+
+    Edges are buffered in compact `array`s rather than Python lists, so
+    memory stays proportional to 16 bytes per edge while building.
+    Returns (nodes, indptr, indices) as arrays.
+    """
+    src = array('q')
+    dst = array('q')
+    for a, b in edges:
+        if a == b:
+            continue
+        src.append(a)
+        dst.append(b)
+
+    nodes = array('q', sorted(set(src).union(dst)))
+    position = {node_id: i for i, node_id in enumerate(nodes)}
+
+    degree = array('q', bytes(8 * len(nodes)))
+    for a, b in zip(src, dst):
+        degree[position[a]] += 1
+        degree[position[b]] += 1
+
+    indptr = array('q', bytes(8 * (len(nodes) + 1)))
+    for i, d in enumerate(degree):
+        indptr[i + 1] = indptr[i] + d
+
+    indices = array('i', bytes(4 * indptr[-1]))
+    cursor = array('q', indptr[:-1])
+    for a, b in zip(src, dst):
+        pa, pb = position[a], position[b]
+        indices[cursor[pa]] = pb
+        cursor[pa] += 1
+        indices[cursor[pb]] = pa
+        cursor[pb] += 1
+
+    # Sorted neighbour lists make snapshots deterministic and allow bisect lookups
+    for i in range(len(nodes)):
+        start, end = indptr[i], indptr[i + 1]
+        if end - start > 1:
+            indices[start:end] = array('i', sorted(indices[start:end]))
+
+    return nodes, indptr, indices
+
+
+def _is_snapshot_dir(path, require_meta=True):
+    """Whether `path` holds nothing but snapshot files (a leftover may lack meta.json)."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return False
+    names = set(os.listdir(path))
+    return names <= set(SNAPSHOT_FILES) and (META_FILE in names or not require_meta)
+
+
+def _remove_snapshot_dir(path, require_meta=True):
+    """Deletes an earlier snapshot directory; refuses any other existing path."""
+    if not os.path.lexists(path):
+        return
+    if not _is_snapshot_dir(path, require_meta):
+        raise ValueError(f"{path} exists and is not a graph snapshot; refusing to replace it")
+    shutil.rmtree(path)
+
+
+def write_snapshot(output_dir, edges):
+    """
+    Writes a CSR snapshot of `edges` to `output_dir`.
+
+    Only a directory that holds an earlier snapshot is replaced; any other
+    existing path raises ValueError. Files are written to a sibling
+    temporary directory first, so readers never open a half-written
+    snapshot. The old snapshot is then renamed away and the new one into
+    place: between those two renames `output_dir` is briefly missing, and a
+    reader that finds it gone should retry.
+    Returns the metadata dict that was stored alongside the arrays.
+    """
+    output_dir = os.path.abspath(output_dir)
+    tmp_dir = output_dir + '.tmp'
+    old_dir = output_dir + '.old'
+    if os.path.lexists(output_dir) and not _is_snapshot_dir(output_dir):
+        raise ValueError(f"{output_dir} exists and is not a graph snapshot; refusing to replace it")
+    # Leftovers of an interrupted export
+    _remove_snapshot_dir(tmp_dir, require_meta=False)
+    _remove_snapshot_dir(old_dir, require_meta=False)
+
+    nodes, indptr, indices = build_csr(edges)
+    os.makedirs(tmp_dir)
+    _write_npy(os.path.join(tmp_dir, NODES_FILE), nodes, 'q')
+    _write_npy(os.path.join(tmp_dir, INDPTR_FILE), indptr, 'q')
+    _write_npy(os.path.join(tmp_dir, INDICES_FILE), indices, 'i')
+
+    meta = {
+        'nodes': len(nodes),
+        'edges': len(indices) // 2,
+        'created_at': timezone.now().isoformat(),
+    }
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as fh:
+        json.dump(meta, fh)
+
+    if os.path.lexists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+class GraphSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot written by `write_snapshot`.
+
+    Nothing is copied into Python objects on load, so opening even a large
+    graph is effectively instant; pages are faulted in by the OS on access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._maps = []
+        self.nodes = self._open(NODES_FILE)
+        self.indptr = self._open(INDPTR_FILE)
+        self.indices = self._open(INDICES_FILE)
+        with open(os.path.join(path, META_FILE)) as fh:
+            self.meta = json.load(fh)
+
+    @classmethod
+    def load(cls, path):
+        return cls(path)
+
+    def _open(self, name):
+        mm, views = _map_npy(os.path.join(self.path, name))
+        self._maps.append((mm, views))
+        return views[-1]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    def index_of(self, profile_id):
+        """Returns the dense position of `profile_id`, or None if absent."""
+        i = bisect.bisect_left(self.nodes, profile_id)
+        if i < len(self.nodes) and self.nodes[i] == profile_id:
+            return i
+        return None
+
+    def degree(self, profile_id):
+        i = self.index_of(profile_id)
+        if i is None:
+            return 0
+        return self.indptr[i + 1] - self.indptr[i]
+
+    def neighbor_positions(self, position):
+        """Neighbour positions of the node at dense `position` (a memoryview slice)."""
+        return self.indices[self.indptr[position]:self.indptr[position + 1]]
+
+    def neighbors(self, profile_id):
+        """Returns the profile ids connected to `profile_id`."""
+        i = self.index_of(profile_id)
+        if i is None:
+            return []
+        return [self.nodes[j] for j in self.neighbor_positions(i)]
+
+    def close(self):
+        for mm, views in self._maps:
+            for view in reversed(views):
+                view.release()
+            mm.close()
+        self._maps = []
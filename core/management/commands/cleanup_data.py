@@ -1,31 +1,48 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from core.models import ChatMessage, RecoveryRequest
+from core.retention import POLICIES, RetentionEngine
 
 class Command(BaseCommand):
-    help = 'Cleans up expired chat messages and recovery requests'
+    help = 'Applies data retention: expired chat messages, ephemeral posts, old notifications and recovery requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Rows removed per transaction (default RETENTION_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--pause-ms', type=int, default=None,
+            help='Sleep between batches (default RETENTION_PAUSE_MS)'
+        )
+        parser.add_argument(
+            '--max-seconds', type=int, default=None,
+            help='Stop starting batches after this long; the next run resumes (default RETENTION_MAX_SECONDS)'
+        )
+        parser.add_argument(
+            '--policy', action='append', choices=[policy.name for policy in POLICIES],
+            help='Only run these policies (repeatable)'
+        )
 
     def handle(self, *args, **options):
-        now = timezone.now()
-        
-        # 1. Delete expired chat messages
-        expired_messages = ChatMessage.objects.filter(expires_at__lt=now)
-        msg_count = expired_messages.count()
-        expired_messages.delete()
-        
-        # 2. Cleanup expired recovery requests
-        # We don't delete them immediately, we mark as EXPIRED first if not already
-        active_expired_reqs = RecoveryRequest.objects.filter(status='PENDING', expires_at__lt=now)
-        req_update_count = active_expired_reqs.update(status='EXPIRED')
-        
-        # 3. Physically delete requests older than 30 days
-        month_ago = now - timezone.timedelta(days=30)
-        old_reqs = RecoveryRequest.objects.filter(created_at__lt=month_ago)
-        old_req_count = old_reqs.count()
-        old_reqs.delete()
+        policies = [p for p in POLICIES if not options['policy'] or p.name in options['policy']]
+        engine = RetentionEngine(
+            policies=policies,
+            batch_size=options['batch_size'],
+            pause_ms=options['pause_ms'],
+            max_seconds=options['max_seconds'],
+        )
+        results = engine.run()
+        if results is None:
+            self.stdout.write(self.style.WARNING('Another cleanup run is in progress; skipping.'))
+            return
 
-        self.stdout.write(self.style.SUCCESS(
-            f'Successfully cleaned up: {msg_count} messages, '
-            f'{req_update_count} recovery requests expired, '
-            f'{old_req_count} old requests deleted.'
-        ))
+        # Stats per policy; an incomplete policy resumes from its checkpoint next run
+        for name, stats in results.items():
+            rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+            partitions = f", {stats['partitions']} partitions dropped" if stats['partitions'] else ''
+            self.stdout.write(
+                f"{name}: {stats['rows']} rows and {stats['files']} media files removed in "
+                f"{stats['batches']} batches{partitions}, {stats['seconds']:.2f}s ({rate:.0f} rows/s)"
+                f"{'' if stats['complete'] else ', resuming next run'}."
+            )
+        total = sum(stats['rows'] for stats in results.values())
+        self.stdout.write(self.style.SUCCESS(f'Successfully cleaned up: {total} rows.'))
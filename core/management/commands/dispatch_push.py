@@ -0,0 +1,47 @@
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from core.push import dispatch_batch, get_provider
+
+class Command(BaseCommand):
+    help = 'Sends queued push notifications from the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no pushes are due instead of waiting for more'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.PUSH_BATCH_SIZE,
+            help='Outbox rows claimed per round'
+        )
+        parser.add_argument(
+            '--idle-seconds', type=float, default=1.0,
+            help='Wait between polls while the outbox is empty'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            provider = get_provider()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        totals = {'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0}
+        started = time.monotonic()
+        try:
+            while True:
+                stats = dispatch_batch(provider, options['batch_size'])
+                for key in totals:
+                    totals[key] += stats[key]
+                if not stats['claimed']:
+                    if options['once']:
+                        break
+                    time.sleep(options['idle_seconds'])
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Pushes: {totals['sent']} sent, {totals['retried']} to retry, "
+            f"{totals['failed']} failed, {totals['dropped']} dropped in {elapsed:.2f}s."
+        ))
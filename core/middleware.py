@@ -1,11 +1,10 @@
 """JWT authentication middleware for Django Channels WebSocket connections."""
 
 from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.models import User
 from urllib.parse import parse_qs
+from .authentication import user_from_token
+from .executors import db_sync_to_async
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -27,11 +26,7 @@ class JWTAuthMiddleware(BaseMiddleware):
 
         return await super().__call__(scope, receive, send)
 
-    @database_sync_to_async
+    @db_sync_to_async
     def get_user_from_token(self, token_str):
-        try:
-            access_token = AccessToken(token_str)
-            user_id = access_token["user_id"]
-            return User.objects.get(id=user_id)
-        except Exception:
-            return AnonymousUser()
+        # Same cached user + profile resolution as the REST API
+        return user_from_token(token_str)
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def backfill_conversations(apps, schema_editor):
+    """Builds one summary row per existing chat pair."""
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    # Per direction: newest message id and how many the receiver hasn't read
+    directed = ChatMessage.objects.order_by().values('sender_id', 'receiver_id').annotate(
+        last_id=Max('id'), unread=Count('id', filter=Q(is_read=False))
+    )
+    pairs = {}
+    for row in directed:
+        a, b = sorted((row['sender_id'], row['receiver_id']))
+        pair = pairs.setdefault((a, b), {'last_id': 0, 'unread_a': 0, 'unread_b': 0})
+        pair['last_id'] = max(pair['last_id'], row['last_id'])
+        pair['unread_b' if row['receiver_id'] == b else 'unread_a'] += row['unread']
+
+    last_messages = ChatMessage.objects.in_bulk([pair['last_id'] for pair in pairs.values()])
+    conversations = []
+    for (a, b), pair in pairs.items():
+        if a == b:
+            continue
+        last = last_messages[pair['last_id']]
+        conversations.append(Conversation(
+            participant_a_id=a, participant_b_id=b,
+            last_message_id=last.id, last_message_preview=(last.content or '')[:255],
+            last_timestamp=last.timestamp, unread_a=pair['unread_a'], unread_b=pair['unread_b'],
+        ))
+    Conversation.objects.bulk_create(conversations, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_profile_latitude_profile_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, max_length=255)),
+                ('last_timestamp', models.DateTimeField()),
+                ('unread_a', models.PositiveIntegerField(default=0)),
+                ('unread_b', models.PositiveIntegerField(default=0)),
+                ('participant_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_a', to='core.profile')),
+                ('participant_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_b', to='core.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['participant_a', '-last_timestamp'], name='core_conver_partici_3da9d8_idx'), models.Index(fields=['participant_b', '-last_timestamp'], name='core_conver_partici_44e379_idx')],
+                'constraints': [models.UniqueConstraint(fields=('participant_a', 'participant_b'), name='unique_conversation_pair'), models.CheckConstraint(condition=models.Q(('participant_a__lt', models.F('participant_b'))), name='conversation_ordered_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
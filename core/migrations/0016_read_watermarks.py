@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _from_partner(ChatMessage, reader, sender):
+    return ChatMessage.objects.filter(receiver=OuterRef(reader), sender=OuterRef(sender)).order_by()
+
+
+def backfill_watermarks(apps, schema_editor):
+    """
+    Turns per-message is_read flags into per-side read watermarks: the
+    newest message each side has read. Unread counts are then recounted
+    above the watermark, which also folds in messages that were skipped.
+    """
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    def newest_read(reader, sender):
+        read = _from_partner(ChatMessage, reader, sender).filter(is_read=True)
+        return Coalesce(Subquery(read.order_by('-id').values('id')[:1]), 0)
+
+    def unread_above(reader, sender, watermark):
+        unread = _from_partner(ChatMessage, reader, sender).filter(id__gt=OuterRef(watermark))
+        return Coalesce(Subquery(unread.values('receiver').annotate(n=Count('id')).values('n')[:1]), 0)
+
+    Conversation.objects.update(
+        read_a=newest_read('participant_a', 'participant_b'),
+        read_b=newest_read('participant_b', 'participant_a'),
+    )
+    Conversation.objects.update(
+        unread_a=unread_above('participant_a', 'participant_b', 'read_a'),
+        unread_b=unread_above('participant_b', 'participant_a', 'read_b'),
+    )
+
+
+def restore_read_flags(apps, schema_editor):
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    Conversation = apps.get_model('core', 'Conversation')
+    for conversation in Conversation.objects.filter(models.Q(read_a__gt=0) | models.Q(read_b__gt=0)).iterator():
+        a, b = conversation.participant_a_id, conversation.participant_b_id
+        ChatMessage.objects.filter(sender_id=b, receiver_id=a, id__lte=conversation.read_a).update(is_read=True)
+        ChatMessage.objects.filter(sender_id=a, receiver_id=b, id__lte=conversation.read_b).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_chat_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='read_a',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='read_b',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, restore_read_flags),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='core_chatme_receive_ede677_idx',
+        ),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+    ]
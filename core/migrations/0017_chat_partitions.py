@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:39
+
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+TABLE = 'core_chatmessage'
+OLD_TABLE = 'core_chatmessage_old'
+EPOCH = date(2000, 1, 3)  # keep in step with core/partitions.py
+
+
+def backfill_expiry(apps, schema_editor):
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    ChatMessage.objects.filter(expires_at__isnull=True).update(expires_at=F('timestamp') + timedelta(days=7))
+
+
+def _bound(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc).isoformat(sep=' ')
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Recreates core_chatmessage as a table range-partitioned on expires_at
+    (or back as a plain table), keeping its rows, id sequence, foreign keys
+    and indexes. A partitioned table's primary key must include the
+    partition key, so it becomes (id, expires_at).
+    """
+    cursor = schema_editor.connection.cursor()
+    cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    cursor.execute(
+        "SELECT pg_get_constraintdef(oid), conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [OLD_TABLE],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [OLD_TABLE, OLD_TABLE],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+
+    partition_by = "PARTITION BY RANGE (expires_at)" if partitioned else ""
+    cursor.execute(f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY) {partition_by}")
+    if partitioned:
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+        days = settings.CHAT_PARTITION_DAYS
+        today = datetime.now(dt_timezone.utc).date()
+        start = today - timedelta(days=(today - EPOCH).days % days)
+        while start <= today + timedelta(days=settings.CHAT_PARTITIONS_AHEAD):
+            end = start + timedelta(days=days)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{start:%Y%m%d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{_bound(start)}') TO ('{_bound(end)}')"
+            )
+            start = end
+    cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+    )
+    cursor.execute(f"DROP TABLE {OLD_TABLE}")
+
+    primary_key = "id, expires_at" if partitioned else "id"
+    cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})")
+    for definition, name in foreign_keys:
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+    for definition in indexes:
+        cursor.execute(definition.replace(f"{OLD_TABLE} USING", f"{TABLE} USING"))
+
+
+def partition_messages(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_messages(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_expiry, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, default=core.models.chat_message_expiry),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['expires_at'], name='core_chatme_expires_7f0064_idx'),
+        ),
+        migrations.RunPython(partition_messages, unpartition_messages),
+    ]
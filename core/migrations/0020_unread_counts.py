@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_counts(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+    Notification = apps.get_model('core', 'Notification')
+    Conversation = apps.get_model('core', 'Conversation')
+    UnreadCounts = apps.get_model('core', 'UnreadCounts')
+
+    notifications = dict(
+        Notification.objects.filter(is_read=False).order_by().values('recipient')
+        .annotate(n=Count('id')).values_list('recipient', 'n')
+    )
+    messages = {}
+    for side in ('a', 'b'):
+        totals = Conversation.objects.filter(**{f'unread_{side}__gt': 0}).order_by()\
+            .values(f'participant_{side}').annotate(n=Sum(f'unread_{side}')).values_list(f'participant_{side}', 'n')
+        for profile_id, n in totals:
+            messages[profile_id] = messages.get(profile_id, 0) + n
+
+    UnreadCounts.objects.bulk_create((
+        UnreadCounts(profile_id=pk, notifications=notifications.get(pk, 0), messages=messages.get(pk, 0))
+        for pk in Profile.objects.values_list('pk', flat=True).iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_notification_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounts',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counts', serialize=False, to='core.profile')),
+                ('notifications', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
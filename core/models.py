@@ -1,5 +1,6 @@
 from django.db import models
 from django.db.models import Q
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
@@ -165,6 +166,29 @@ class Connection(models.Model):
             models.Index(fields=['receiver', 'status']),
         ]
 
+def chat_message_expiry():
+    return timezone.now() + timedelta(days=7)
+
+
+class ChatMessageQuerySet(models.QuerySet):
+    def with_read_state(self):
+        """
+        Annotates `is_read`: whether the message is at or below the
+        receiver's read watermark on the pair's Conversation.
+        """
+        # The receiver is participant_a of its pair when its id is the lower one
+        as_a = Conversation.objects.filter(
+            participant_a=models.OuterRef('receiver'), participant_b=models.OuterRef('sender')
+        ).values('read_a')[:1]
+        as_b = Conversation.objects.filter(
+            participant_a=models.OuterRef('sender'), participant_b=models.OuterRef('receiver')
+        ).values('read_b')[:1]
+        watermark = Coalesce(models.Subquery(as_a), models.Subquery(as_b), models.Value(0))
+        return self.annotate(
+            is_read=models.ExpressionWrapper(models.Q(id__lte=watermark), output_field=models.BooleanField())
+        )
+
+
 class ChatMessage(models.Model):
     sender = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='received_messages')
@@ -173,13 +197,12 @@ class ChatMessage(models.Model):
     video = models.FileField(upload_to='chat_videos/', null=True, blank=True)
     thumbnail = models.ImageField(upload_to='chat_thumbnails/', null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
-    expires_at = models.DateTimeField(null=True, blank=True)
+    # Also the partition key on PostgreSQL; see core/partitions.py
+    expires_at = models.DateTimeField(default=chat_message_expiry, blank=True)
 
-    def save(self, *args, **kwargs):
-        if not self.expires_at:
-            self.expires_at = timezone.now() + timedelta(days=7)
-        super().save(*args, **kwargs)
+    # Read state lives on Conversation as per-side watermarks; querysets
+    # that serialize `is_read` use `with_read_state()`
+    objects = ChatMessageQuerySet.as_manager()
 
     def __str__(self):
         return f"Msg from {self.sender.username} to {self.receiver.username}"
@@ -187,10 +210,54 @@ class ChatMessage(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['sender', 'receiver', '-timestamp']),
-            models.Index(fields=['receiver', 'is_read']),
+            # Reconnect sync: everything after the last id a client has seen
+            models.Index(fields=['sender', 'id']),
+            models.Index(fields=['receiver', 'id']),
+            models.Index(fields=['expires_at']),
         ]
 
 
+class Conversation(models.Model):
+    """
+    Inbox summary for one chat pair, maintained on send and on mark-read
+    (see ConversationService) so the inbox never scans ChatMessage.
+
+    participant_a always holds the lower profile id, so a pair has exactly
+    one row. read_a/read_b are each side's read watermark: the partner's
+    messages with an id up to it are read, so marking a chat read is one
+    small UPDATE here rather than one per message. unread_a/unread_b cache
+    how many of the partner's messages are above that side's watermark.
+    last_message_id is a plain id rather than a foreign key so messages can
+    be purged or archived without touching the summary.
+    """
+    participant_a = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='conversations_as_a')
+    participant_b = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='conversations_as_b')
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=255, blank=True)
+    last_timestamp = models.DateTimeField()
+    unread_a = models.PositiveIntegerField(default=0)
+    unread_b = models.PositiveIntegerField(default=0)
+    read_a = models.BigIntegerField(default=0)
+    read_b = models.BigIntegerField(default=0)
+    # Set explicitly by ConversationService (queryset updates skip auto_now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['participant_a', 'participant_b'], name='unique_conversation_pair'),
+            models.CheckConstraint(
+                condition=models.Q(participant_a__lt=models.F('participant_b')), name='conversation_ordered_pair'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['participant_a', '-last_timestamp']),
+            models.Index(fields=['participant_b', '-last_timestamp']),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.participant_a_id} <-> {self.participant_b_id}"
+
+
 class Report(models.Model):
     """User safety reports for content or account violations."""
     REASON_CHOICES = [
@@ -213,7 +280,11 @@ class Report(models.Model):
 
 
 class Notification(models.Model):
-    """Internal log of push notifications sent."""
+    """
+    Internal log of push notifications sent. Bursts from one sender are
+    merged into a single row (see core/notifications.py): `count` is how
+    many events it stands for and `created_at` the time of the newest.
+    """
     TYPE_CHOICES = [
         ('MESSAGE', 'New Message'),
         ('CONNECTION_REQUEST', 'Connection Request'),
@@ -229,11 +300,71 @@ class Notification(models.Model):
     title = models.CharField(max_length=100)
     body = models.TextField()
     is_read = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.notification_type} for {self.recipient.username}"
 
+    class Meta:
+        indexes = [
+            # Retention scans for notifications past NOTIFICATION_RETENTION_DAYS
+            models.Index(fields=['created_at']),
+            # Keyset pages of one recipient's list, newest first
+            models.Index(fields=['recipient', '-created_at', '-id']),
+            # Unread lookups: mark-all-read and badge rebuilds
+            models.Index(fields=['recipient', 'is_read']),
+        ]
+
+
+class PushOutbox(models.Model):
+    """
+    One push notification waiting to be sent (see core/push.py). Rows are
+    written with their notification and drained by `dispatch_push`; the
+    device token is read at send time, so re-registered devices get it.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed after retries'),
+        ('DROPPED', 'Dropped (no valid device token)'),
+    ]
+
+    recipient = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='push_outbox')
+    title = models.CharField(max_length=100)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The dispatcher's claim query
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Push to {self.recipient_id} ({self.status})"
+
+
+class UnreadCounts(models.Model):
+    """
+    Per-profile unread badge counters (see BadgeService): unread
+    Notification rows and unread chat messages across all conversations.
+    Kept in their own table so profile saves can never overwrite them.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name='unread_counts')
+    notifications = models.IntegerField(default=0)
+    messages = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Unread for {self.profile_id}: {self.notifications} notifications, {self.messages} messages"
+
 
 class RecoveryCode(models.Model):
     """Hashed one-time backup codes for password recovery."""
@@ -281,3 +412,16 @@ class RecoveryRequest(models.Model):
     def is_active(self):
         return self.status == 'PENDING' and timezone.now() < self.expires_at
 
+
+class RetentionCheckpoint(models.Model):
+    """
+    Progress of one retention policy (see core/retention.py): the last
+    primary key handled, so an interrupted cleanup run resumes there.
+    0 means the next run starts from the beginning.
+    """
+    policy = models.CharField(max_length=50, primary_key=True)
+    last_pk = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.policy} @ {self.last_pk}"
@@ -0,0 +1,140 @@
+"""
+Coalesced notification writes.
+
+Views hand new notifications to `notify`, which buffers them for the rest
+of the request; they are written once the response has been sent, when
+Django fires `request_finished`. Outside a request (the chat batcher,
+management commands) `write_notifications` is called directly.
+
+A write merges each notification into the recipient's newest unread row
+with the same sender and type from the last NOTIFICATION_COALESCE_SECONDS
+("5 new messages from X"), so a burst costs one row. The merged row is
+deleted and re-inserted with the summed `count` and latest body rather
+than updated in place: its new id and `created_at` put it after
+everything the client has seen, so the reconnect sync (`id > last seen`)
+and the newest-first list pick it up. All rows are inserted with a single
+bulk_create, and the recipients' unread badges move by the rows that did
+not replace an unread one. Each written row queues one push (core/push.py)
+in the same transaction.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Notification
+from .push import queue_pushes
+from .services import BadgeService
+
+logger = logging.getLogger(__name__)
+
+# Titles for merged rows; other types keep the title of their latest event
+DIGEST_TITLES = {
+    'MESSAGE': '{count} new messages from {sender}',
+    'COMMENT': '{count} new comments from {sender}',
+    'CONNECTION_REQUEST': '{count} connection requests from {sender}',
+}
+
+_local = threading.local()
+
+
+def _key(notification):
+    return notification.recipient_id, notification.sender_id, notification.notification_type
+
+
+def _title(notification, count):
+    template = DIGEST_TITLES.get(notification.notification_type)
+    if count > 1 and template and notification.sender_id:
+        return template.format(count=count, sender=notification.sender.username)
+    return notification.title
+
+
+def write_notifications(notifications, push=True):
+    """
+    Writes unsaved Notification instances, merged with each other and with
+    recent unread rows that share recipient, sender and type. Returns the
+    number of rows that did not replace an existing one. `push=False` leaves pushing the recipients'
+    badges to the caller.
+    """
+    merged = {}
+    for notification in notifications:
+        first = merged.setdefault(_key(notification), notification)
+        if first is not notification:
+            first.count += notification.count
+            first.title, first.body = notification.title, notification.body
+    if not merged:
+        return 0
+
+    now = timezone.now()
+    recent = Notification.objects.filter(
+        recipient_id__in={key[0] for key in merged},
+        notification_type__in={key[2] for key in merged},
+        is_read=False,
+        created_at__gte=now - timedelta(seconds=settings.NOTIFICATION_COALESCE_SECONDS),
+    ).order_by('created_at', 'id').values_list('id', 'recipient_id', 'sender_id', 'notification_type', 'count')
+    # Later rows overwrite earlier ones, leaving the newest per key
+    existing = {(recipient, sender, kind): (pk, count) for pk, recipient, sender, kind, count in recent}
+
+    new = []
+    with transaction.atomic():
+        for key, notification in merged.items():
+            # Only the writer whose DELETE removed the row takes over its
+            # count, so concurrent merges never count an event twice
+            if key in existing and Notification.objects.filter(pk=existing[key][0], is_read=False).delete()[0]:
+                notification.count += existing[key][1]
+            else:
+                new.append(notification)
+            notification.title = _title(notification, notification.count)
+        Notification.objects.bulk_create(merged.values())
+        queue_pushes(merged.values())
+        # A replaced row was already unread; only new rows move the badge
+        added = {}
+        for notification in new:
+            added[notification.recipient_id] = added.get(notification.recipient_id, 0) + 1
+        BadgeService.add('notifications', added, push=push)
+    return len(new)
+
+
+def notify(*notifications):
+    """
+    Queues unsaved Notification instances. Inside a request they are
+    written together after the response is sent; elsewhere immediately.
+    """
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        write_notifications(notifications)
+    else:
+        pending.extend(notifications)
+
+
+@receiver(request_started)
+def start_notification_buffer(sender, **kwargs):
+    # Keep a buffer another request on this thread has not flushed yet
+    if getattr(_local, 'pending', None) is None:
+        _local.pending = []
+
+
+def flush_notifications(sender, **kwargs):
+    pending, _local.pending = getattr(_local, 'pending', None), None
+    if not pending:
+        return
+    try:
+        write_notifications(pending)
+    except Exception:
+        # The response is already out; a failed write must not break the worker
+        logger.exception("Could not write %d notifications", len(pending))
+
+
+# Receivers run in the order they were connected, and Django's own
+# close_old_connections was connected first. Flushing ahead of it lets the
+# request's connection cleanup also close the connection the write used,
+# instead of leaving it open until this thread's next request.
+request_finished.disconnect(close_old_connections)
+request_finished.connect(flush_notifications)
+request_finished.connect(close_old_connections)
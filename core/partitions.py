@@ -0,0 +1,143 @@
+"""
+Time partitioning for chat messages.
+
+Messages expire a fixed time after they are sent. On PostgreSQL
+core_chatmessage is range-partitioned on expires_at (migration 0017), one
+partition per CHAT_PARTITION_DAYS, so once a partition's upper bound has
+passed it holds nothing but expired rows and is retired with DETACH +
+DROP: no row-by-row DELETE and no bloat left for vacuum. A message
+therefore outlives its expires_at by at most one partition width.
+
+DETACH runs without CONCURRENTLY (which cannot run inside a transaction
+block), so it takes an ACCESS EXCLUSIVE lock on core_chatmessage until
+the drop commits. The statements only change the catalog, so the lock is
+brief, but chat reads and writes queue behind it, and it has to wait for
+queries already running against the table.
+
+The retention engine (core/retention.py) drops expired partitions and then
+deletes, in batches, only what is left below the current partition: rows
+that landed in the default partition because no partition existed for
+their expiry yet. Other databases have no partitioning, and every expired
+row goes through the batched delete.
+"""
+
+import logging
+import re
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+TABLE = ChatMessage._meta.db_table
+MEDIA_FIELDS = ('image', 'video', 'thumbnail')
+# Partitions are aligned to this date so weekly partitions keep stable bounds
+EPOCH = date(2000, 1, 3)  # a Monday
+BOUNDS_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def partition_bounds(day, days=None):
+    """The [start, end) dates of the partition that holds `day`."""
+    days = days or settings.CHAT_PARTITION_DAYS
+    start = day - timedelta(days=(day - EPOCH).days % days)
+    return start, start + timedelta(days=days)
+
+
+def partition_name(start):
+    return f"{TABLE}_p{start:%Y%m%d}"
+
+
+def _midnight(day):
+    return datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def _bound(day):
+    return _midnight(day).isoformat(sep=' ')
+
+
+def current_partition_start(now=None):
+    """Lower bound of the partition `now` falls in; everything below it is expired."""
+    now = now or timezone.now()
+    return _midnight(partition_bounds(now.astimezone(dt_timezone.utc).date())[0])
+
+
+def ensure_partitions(today=None, ahead=None):
+    """
+    Creates the partitions covering `today` through `ahead` days out and
+    returns the names that were created. A partition whose range already
+    has rows in the default partition cannot be created: it is skipped
+    with a warning and retried on the next run, and its rows stay in the
+    default partition until they expire and the batched delete purges
+    them.
+    """
+    if not is_partitioned():
+        return []
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    ahead = settings.CHAT_PARTITIONS_AHEAD if ahead is None else ahead
+    qn = connection.ops.quote_name
+    created = []
+    start, end = partition_bounds(today)
+    while start <= today + timedelta(days=ahead):
+        name = partition_name(start)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NULL", [name])
+                if cursor.fetchone()[0]:
+                    cursor.execute(
+                        f"CREATE TABLE {qn(name)} PARTITION OF {qn(TABLE)} "
+                        f"FOR VALUES FROM ('{_bound(start)}') TO ('{_bound(end)}')"
+                    )
+                    created.append(name)
+        except DatabaseError:
+            logger.warning("Could not create chat partition %s", name, exc_info=True)
+        start, end = end, end + (end - start)
+    return created
+
+
+def expired_partitions(now=None):
+    """(name, start, end) of the partitions whose upper bound is at or before `now`."""
+    if not is_partitioned():
+        return []
+    now = now or timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    expired = []
+    for name, bound in rows:
+        match = BOUNDS_RE.search(bound or '')
+        if match and parse_datetime(match.group(2)) <= now:
+            expired.append((name, parse_datetime(match.group(1)), parse_datetime(match.group(2))))
+    return sorted(expired)
+
+
+def drop_partition(name):
+    """
+    Detaches and drops one partition. Returns its row count and the
+    (field, file name) pairs of its media, for the caller to delete.
+    Holds an ACCESS EXCLUSIVE lock on the parent table until the
+    caller's transaction commits.
+    """
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(field) for field in MEDIA_FIELDS)
+    media_filter = ' OR '.join(f"{qn(field)} <> ''" for field in MEDIA_FIELDS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {qn(name)}")
+        rows = cursor.fetchone()[0]
+        cursor.execute(f"SELECT {columns} FROM {qn(name)} WHERE {media_filter}")
+        media = [(field, name) for row in cursor.fetchall() for field, name in zip(MEDIA_FIELDS, row) if name]
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+        cursor.execute(f"DROP TABLE {qn(name)}")
+    return rows, media
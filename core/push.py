@@ -0,0 +1,259 @@
+"""
+Push notification delivery.
+
+`write_notifications` queues a PushOutbox row for every notification it
+writes, in the same transaction, so API requests never wait on a push
+provider. `manage.py dispatch_push` drains the outbox:
+
+1. Claim up to PUSH_BATCH_SIZE due rows by pushing their next_attempt_at
+   PUSH_LEASE_SECONDS ahead (SKIP LOCKED on PostgreSQL lets several
+   workers share the queue). A worker that dies mid-send releases its
+   rows when the lease runs out.
+2. Read the recipients' current device tokens in one query and send the
+   batch through the provider, `max_batch` messages per call.
+3. Record outcomes with one UPDATE per distinct outcome: SENT; retried
+   with exponential backoff until PUSH_MAX_ATTEMPTS, then FAILED; or
+   DROPPED when the recipient has no token or the provider rejects it, in
+   which case the token is cleared from the profile.
+
+Providers are looked up from PUSH_PROVIDER. FCMPushProvider uses the FCM
+HTTP v1 API; FakePushProvider records what it would send and is only for
+tests. With no provider configured nothing is dispatched and rows stay
+PENDING.
+"""
+
+import json
+import logging
+import random
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Profile, PushOutbox
+
+try:
+    import google.auth
+    import google.auth.transport.requests
+except ImportError:  # pragma: no cover - only needed for FCM without FCM_ACCESS_TOKEN
+    google = None
+
+logger = logging.getLogger(__name__)
+
+# Provider outcomes, one per message
+OK = 'ok'
+RETRY = 'retry'
+INVALID_TOKEN = 'invalid_token'
+FAILED = 'failed'
+
+
+def queue_pushes(notifications):
+    """Queues a push for each written Notification; call in the same transaction."""
+    PushOutbox.objects.bulk_create([
+        PushOutbox(
+            recipient_id=notification.recipient_id,
+            title=notification.title,
+            body=notification.body,
+            data={'notification_id': notification.pk, 'type': notification.notification_type},
+        )
+        for notification in notifications
+    ])
+
+
+class PushProvider:
+    """
+    Sends push messages. `send` takes dicts with token, title, body and
+    data, and returns one (outcome, error) pair per message.
+    """
+    max_batch = 100
+
+    def send(self, messages):
+        raise NotImplementedError
+
+
+class FakePushProvider(PushProvider):
+    """
+    Records messages instead of sending them; tests only, selected with
+    override_settings. Tests set `outcomes` per token.
+    """
+    sent = []
+    outcomes = {}
+
+    def send(self, messages):
+        results = []
+        for message in messages:
+            outcome = self.outcomes.get(message['token'], OK)
+            if outcome == OK:
+                self.sent.append(message)
+            results.append((outcome, '' if outcome == OK else f'fake {outcome}'))
+        return results
+
+
+class FCMPushProvider(PushProvider):
+    """
+    Firebase Cloud Messaging over the HTTP v1 API with the standard library.
+
+    HTTP v1 takes one message per request (FCM's multicast endpoint was
+    retired), so a batch is sent over a small thread pool. Authenticates
+    with FCM_ACCESS_TOKEN, or with google-auth application default
+    credentials when it is installed.
+    """
+    max_batch = 100
+    workers = 10
+    timeout = 10
+    url = 'https://fcm.googleapis.com/v1/projects/{project}/messages:send'
+    scope = 'https://www.googleapis.com/auth/firebase.messaging'
+
+    def __init__(self):
+        self.endpoint = self.url.format(project=settings.FCM_PROJECT_ID)
+        self.credentials = None
+
+    def access_token(self):
+        if settings.FCM_ACCESS_TOKEN:
+            return settings.FCM_ACCESS_TOKEN
+        if google is None:
+            raise RuntimeError('FCM needs FCM_ACCESS_TOKEN or the google-auth package')
+        if self.credentials is None:
+            self.credentials, _ = google.auth.default(scopes=[self.scope])
+        if not self.credentials.valid:
+            self.credentials.refresh(google.auth.transport.requests.Request())
+        return self.credentials.token
+
+    def send(self, messages):
+        token = self.access_token()
+        with ThreadPoolExecutor(min(self.workers, len(messages)) or 1) as pool:
+            return list(pool.map(lambda message: self.send_one(message, token), messages))
+
+    def send_one(self, message, access_token):
+        payload = {'message': {
+            'token': message['token'],
+            'notification': {'title': message['title'], 'body': message['body']},
+            # FCM data values must be strings
+            'data': {key: str(value) for key, value in message['data'].items()},
+        }}
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode(),
+            headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                return OK, ''
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode(errors='replace')[:200]
+            if e.code == 404 or 'UNREGISTERED' in detail or 'registration token' in detail:
+                return INVALID_TOKEN, detail
+            if e.code == 429 or e.code >= 500 or e.code in (401, 403):
+                return RETRY, f'{e.code} {detail}'
+            return FAILED, f'{e.code} {detail}'
+        except (urllib.error.URLError, OSError) as e:
+            return RETRY, str(e)[:200]
+
+
+def get_provider():
+    if not settings.PUSH_PROVIDER:
+        raise ImproperlyConfigured('No push provider: set FCM_PROJECT_ID or PUSH_PROVIDER')
+    return import_string(settings.PUSH_PROVIDER)()
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter after `attempts` tries, capped at an hour."""
+    delay = min(settings.PUSH_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(size, now):
+    """Leases up to `size` due rows to this worker and returns them."""
+    with transaction.atomic():
+        rows = list(
+            PushOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:size]
+        )
+        if rows:
+            PushOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+                attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=settings.PUSH_LEASE_SECONDS),
+            )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def _drop_tokens(invalid):
+    """Clears rejected (profile_id, token) pairs, unless the device re-registered since."""
+    for profile in Profile.objects.filter(id__in={profile_id for profile_id, _ in invalid}):
+        if (profile.id, profile.fcm_token) in invalid:
+            profile.fcm_token = None
+            profile.save(update_fields=['fcm_token'])
+
+
+def dispatch_batch(provider=None, size=None, now=None):
+    """
+    Claims and sends one batch. Returns counts per outcome (sent, retried,
+    failed, dropped); all zero when nothing was due.
+    """
+    provider = provider or get_provider()
+    now = now or timezone.now()
+    rows = claim_batch(size or settings.PUSH_BATCH_SIZE, now)
+    stats = {'claimed': len(rows), 'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0}
+    if not rows:
+        return stats
+
+    tokens = dict(
+        Profile.objects.filter(id__in={row.recipient_id for row in rows})
+        .exclude(fcm_token__isnull=True).exclude(fcm_token='')
+        .values_list('id', 'fcm_token')
+    )
+    outcomes = {}  # row -> (outcome, error)
+    sendable = []
+    for row in rows:
+        if row.recipient_id in tokens:
+            sendable.append(row)
+        else:
+            outcomes[row] = (INVALID_TOKEN, 'no device token')
+
+    for start in range(0, len(sendable), provider.max_batch):
+        chunk = sendable[start:start + provider.max_batch]
+        messages = [
+            {'token': tokens[row.recipient_id], 'title': row.title, 'body': row.body, 'data': row.data}
+            for row in chunk
+        ]
+        try:
+            results = provider.send(messages)
+        except Exception as e:
+            logger.exception("Push provider failed for %d messages", len(chunk))
+            results = [(RETRY, str(e)[:200])] * len(chunk)
+        outcomes.update(zip(chunk, results))
+
+    invalid = set()
+    delays = {}  # one jittered backoff per attempt count, so retries share an UPDATE
+    updates = {}  # (stats key, fields) -> row ids
+    for row, (outcome, error) in outcomes.items():
+        error = error[:255]
+        if outcome == OK:
+            key, fields = 'sent', (('status', 'SENT'), ('sent_at', now), ('last_error', ''))
+        elif outcome == INVALID_TOKEN:
+            key, fields = 'dropped', (('status', 'DROPPED'), ('last_error', error))
+            if row.recipient_id in tokens:
+                invalid.add((row.recipient_id, tokens[row.recipient_id]))
+        elif outcome == RETRY and row.attempts < settings.PUSH_MAX_ATTEMPTS:
+            delay = delays.setdefault(row.attempts, retry_delay(row.attempts))
+            key, fields = 'retried', (('next_attempt_at', now + delay), ('last_error', error))
+        else:
+            key, fields = 'failed', (('status', 'FAILED'), ('last_error', error))
+        updates.setdefault((key, fields), []).append(row.id)
+
+    for (key, fields), ids in updates.items():
+        PushOutbox.objects.filter(id__in=ids).update(**dict(fields))
+        stats[key] += len(ids)
+    if invalid:
+        _drop_tokens(invalid)
+    return stats
@@ -0,0 +1,74 @@
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+from rest_framework.renderers import JSONRenderer
+
+
+# Exact types that can never hide a float; nearly every value is one of these
+_SCALARS = frozenset({str, int, bool, type(None)})
+
+
+def _plain_floats(data):
+    """
+    Whether every float in `data` is finite and printed without an exponent
+    by json. This walk is the price of the orjson path: it visits every
+    value, so it is kept to an exact-type test per scalar (see
+    scripts/bench_serialization.py for its cost next to the encode).
+    """
+    stack = [[data]]
+    while stack:
+        container = stack.pop()
+        if isinstance(container, dict):
+            # OPT_NON_STR_KEYS lets float keys through, so check those too
+            if any(type(key) is not str for key in container):
+                stack.append(list(container))
+            container = container.values()
+        for value in container:
+            kind = type(value)
+            if kind in _SCALARS:
+                continue
+            if kind is float or isinstance(value, float):
+                # repr() switches to exponents outside [1e-4, 1e16); NaN fails both tests
+                if not (value == 0 or 1e-4 <= abs(value) < 1e16):
+                    return False
+            elif isinstance(value, (dict, list, tuple)):
+                stack.append(value)
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson when it is installed.
+
+    Compact, non-ASCII-escaped output (DRF's defaults) comes out byte for
+    byte the same as JSONRenderer: datetimes and other non-native types are
+    handed back to DRF's encoder, and U+2028/U+2029 are escaped the same way.
+    orjson spells floats that need an exponent differently (`1e16`, not
+    `1e+16`) and writes NaN/Infinity as null where JSONRenderer raises, so
+    data holding such floats goes through the stdlib path, as do indented
+    (browsable or `; indent=` requests) and ASCII-only output and anything
+    orjson refuses.
+    """
+
+    if orjson is not None:
+        options = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) or not _plain_floats(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping JSONRenderer applies, for JavaScript (JSONP) consumers
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,293 @@
+"""
+Data retention engine behind `cleanup_data`.
+
+Each RetentionPolicy names the rows of one model that have outlived their
+retention and what to do with them (delete, or for recovery requests mark
+them EXPIRED). A run walks each policy in primary-key order,
+RETENTION_BATCH_SIZE rows per short transaction, pausing RETENTION_PAUSE_MS
+between batches so concurrent writers and replicas keep up. Cascades are
+collected for one batch at a time, never for the whole backlog.
+
+After every batch the policy's last primary key is stored in its
+RetentionCheckpoint, in the same transaction, so a run that is killed or
+runs out of time resumes where it stopped. A policy that reaches the end
+resets its checkpoint and starts from the beginning on the next run.
+
+A run stops starting batches after RETENTION_MAX_SECONDS and holds a
+lease on a RetentionCheckpoint row while it works; the lease is taken
+with a conditional UPDATE, so it holds across processes and hosts
+without Redis, and the command can be scheduled every minute without
+runs overlapping. Every batch and dropped partition renews the lease in
+its own transaction, so a run that outlives the lease (and may have been
+taken over) rolls that step back and stops instead of purging twice.
+"""
+
+import logging
+import secrets
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ChatMessage, Notification, Post, PushOutbox, RecoveryRequest, RetentionCheckpoint
+from .partitions import current_partition_start, drop_partition, ensure_partitions, expired_partitions, is_partitioned
+from .services import BadgeService, ConversationService
+from .signals import deferred_gravity_refresh
+
+logger = logging.getLogger(__name__)
+
+# RetentionCheckpoint row used as the run lock: last_pk is the holder's
+# token (0 when free) and updated_at when the lease was last renewed
+LOCK = '__lock__'
+
+
+class LeaseLost(Exception):
+    """Another run took over the lock; this one must stop writing."""
+
+
+def delete_media(model, names):
+    """Deletes (field name, file name) pairs from the model fields' storage; returns how many."""
+    deleted = 0
+    for field, name in names:
+        try:
+            model._meta.get_field(field).storage.delete(name)
+            deleted += 1
+        except Exception:
+            logger.warning("Could not delete %s media %s", model._meta.label, name, exc_info=True)
+    return deleted
+
+
+class RetentionPolicy:
+    """Deletes the rows of `model` returned by `expired(now)`, with their media files."""
+    name = None
+    model = None
+    media_fields = ()
+
+    def expired(self, now):
+        raise NotImplementedError
+
+    def prepare(self, now, stats, renew_lease):
+        """
+        Runs once per run before the batches. Each transaction it commits
+        calls `renew_lease()` first, which raises LeaseLost once another
+        run holds the lock.
+        """
+
+    def media(self, batch):
+        """(field name, file name) pairs of the media referenced by `batch`."""
+        if not self.media_fields:
+            return []
+        return [
+            (field, name)
+            for row in batch.values_list(*self.media_fields)
+            for field, name in zip(self.media_fields, row)
+            if name
+        ]
+
+    def apply(self, batch):
+        """Removes one batch; returns the number of rows affected."""
+        return batch.delete()[1].get(self.model._meta.label, 0)
+
+
+class ChatMessagePolicy(RetentionPolicy):
+    """
+    Expired chat messages. On PostgreSQL whole expired partitions are
+    dropped first; batches then only see rows below the current partition,
+    which can only be left in the default partition. Either way the purged
+    messages leave unread counts, badges and inbox previews first.
+    """
+    name = 'chat_messages'
+    model = ChatMessage
+    media_fields = ('image', 'video', 'thumbnail')
+
+    def expired(self, now):
+        cutoff = current_partition_start(now) if is_partitioned() else now
+        return ChatMessage.objects.filter(expires_at__lt=cutoff)
+
+    def prepare(self, now, stats, renew_lease):
+        if not is_partitioned():
+            return
+        for name, start, end in expired_partitions(now):
+            with transaction.atomic():
+                renew_lease()
+                # The default partition cannot hold rows of this range, so this is the partition's content
+                ConversationService.forget_messages(ChatMessage.objects.filter(expires_at__gte=start, expires_at__lt=end))
+                rows, media = drop_partition(name)
+            stats['rows'] += rows
+            stats['files'] += delete_media(ChatMessage, media)
+            stats['partitions'] += 1
+        # New partitions ahead of the writes, so little reaches the default one
+        ensure_partitions()
+
+    def apply(self, batch):
+        ConversationService.forget_messages(batch)
+        return super().apply(batch)
+
+
+class EphemeralPostPolicy(RetentionPolicy):
+    """Expired EPHEMERAL posts, with their likes, comments and reports."""
+    name = 'ephemeral_posts'
+    model = Post
+    media_fields = ('image', 'video', 'thumbnail')
+
+    def expired(self, now):
+        return Post.objects.filter(post_type='EPHEMERAL', expires_at__lt=now)
+
+    def apply(self, batch):
+        # One gravity refresh per author per batch instead of one per post
+        with deferred_gravity_refresh():
+            return super().apply(batch)
+
+
+class NotificationPolicy(RetentionPolicy):
+    """Notifications older than NOTIFICATION_RETENTION_DAYS."""
+    name = 'notifications'
+    model = Notification
+
+    def expired(self, now):
+        cutoff = now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+        return Notification.objects.filter(created_at__lt=cutoff)
+
+    def apply(self, batch):
+        # Unread rows leave the recipients' badges with them
+        unread = dict(
+            batch.filter(is_read=False).order_by().values('recipient').annotate(n=Count('id')).values_list('recipient', 'n')
+        )
+        deleted = super().apply(batch)
+        BadgeService.add('notifications', {pid: -n for pid, n in unread.items()})
+        return deleted
+
+
+class ExpireRecoveryRequestPolicy(RetentionPolicy):
+    """PENDING recovery requests past expires_at are marked EXPIRED, not deleted."""
+    name = 'expire_recovery_requests'
+    model = RecoveryRequest
+
+    def expired(self, now):
+        return RecoveryRequest.objects.filter(status='PENDING', expires_at__lt=now)
+
+    def apply(self, batch):
+        return batch.update(status='EXPIRED')
+
+
+class RecoveryRequestPolicy(RetentionPolicy):
+    """Recovery requests older than RECOVERY_REQUEST_RETENTION_DAYS, in any status."""
+    name = 'recovery_requests'
+    model = RecoveryRequest
+
+    def expired(self, now):
+        cutoff = now - timedelta(days=settings.RECOVERY_REQUEST_RETENTION_DAYS)
+        return RecoveryRequest.objects.filter(created_at__lt=cutoff)
+
+
+class PushOutboxPolicy(RetentionPolicy):
+    """
+    Push outbox rows older than PUSH_OUTBOX_RETENTION_DAYS, including ones
+    still PENDING: a push that late is stale, and without a provider
+    nothing else ever moves them out of PENDING.
+    """
+    name = 'push_outbox'
+    model = PushOutbox
+
+    def expired(self, now):
+        cutoff = now - timedelta(days=settings.PUSH_OUTBOX_RETENTION_DAYS)
+        return PushOutbox.objects.filter(created_at__lt=cutoff)
+
+
+POLICIES = [
+    ChatMessagePolicy(),
+    EphemeralPostPolicy(),
+    NotificationPolicy(),
+    ExpireRecoveryRequestPolicy(),
+    RecoveryRequestPolicy(),
+    PushOutboxPolicy(),
+]
+
+
+class RetentionEngine:
+    """
+    Runs retention policies in bounded batches. `run()` returns per-policy
+    stats (rows, files, partitions, batches, seconds, complete), or None
+    when another run holds the lock. A run that loses its lease stops and
+    returns the stats of the policies it finished.
+    """
+
+    def __init__(self, policies=None, batch_size=None, pause_ms=None, max_seconds=None):
+        self.policies = POLICIES if policies is None else policies
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.pause = (settings.RETENTION_PAUSE_MS if pause_ms is None else pause_ms) / 1000
+        self.max_seconds = max_seconds or settings.RETENTION_MAX_SECONDS
+        self.token = None
+
+    def run(self, now=None):
+        self.token = self.acquire_lock()
+        if self.token is None:
+            return None
+        results = {}
+        try:
+            now = now or timezone.now()
+            deadline = time.monotonic() + self.max_seconds
+            for policy in self.policies:
+                results[policy.name] = self.run_policy(policy, now, deadline)
+        except LeaseLost:
+            logger.warning("Retention lease lost; another run took over after %s", list(results))
+        finally:
+            RetentionCheckpoint.objects.filter(pk=LOCK, last_pk=self.token).update(last_pk=0)
+        return results
+
+    def acquire_lock(self):
+        """Takes the run lock; returns its token, or None while another run holds it."""
+        token = secrets.randbelow(2 ** 62) + 1
+        now = timezone.now()
+        RetentionCheckpoint.objects.get_or_create(policy=LOCK)
+        # A lease older than a full run frees the lock of a run that died without releasing it
+        stale = now - timedelta(seconds=self.max_seconds + 60)
+        taken = RetentionCheckpoint.objects.filter(Q(last_pk=0) | Q(updated_at__lt=stale), pk=LOCK).update(
+            last_pk=token, updated_at=now
+        )
+        return token if taken else None
+
+    def renew_lease(self):
+        """Moves the lease forward; raises LeaseLost if this run no longer holds it."""
+        if not RetentionCheckpoint.objects.filter(pk=LOCK, last_pk=self.token).update(updated_at=timezone.now()):
+            raise LeaseLost
+
+    def run_policy(self, policy, now, deadline):
+        started = time.monotonic()
+        stats = {'rows': 0, 'files': 0, 'partitions': 0, 'batches': 0, 'seconds': 0.0, 'complete': False}
+        policy.prepare(now, stats, self.renew_lease)
+        checkpoint, _ = RetentionCheckpoint.objects.get_or_create(policy=policy.name)
+        last_pk = checkpoint.last_pk
+        expired = policy.expired(now)
+
+        while time.monotonic() < deadline:
+            ids = list(
+                expired.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:self.batch_size]
+            )
+            done = len(ids) < self.batch_size
+            if ids:
+                with transaction.atomic():
+                    self.renew_lease()
+                    # Re-applying the policy filter keeps rows that changed since the scan
+                    batch = expired.filter(pk__in=ids)
+                    media = policy.media(batch)
+                    stats['rows'] += policy.apply(batch)
+                    last_pk = 0 if done else ids[-1]
+                    RetentionCheckpoint.objects.filter(pk=policy.name).update(last_pk=last_pk, updated_at=timezone.now())
+                stats['files'] += delete_media(policy.model, media)
+                stats['batches'] += 1
+            elif last_pk:
+                last_pk = 0
+                RetentionCheckpoint.objects.filter(pk=policy.name).update(last_pk=0, updated_at=timezone.now())
+            if done:
+                stats['complete'] = True
+                break
+            time.sleep(self.pause)
+
+        stats['seconds'] = time.monotonic() - started
+        logger.info("Retention %s: %s", policy.name, stats)
+        return stats
+
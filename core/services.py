@@ -1,8 +1,25 @@
 import math
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
 from django.utils import timezone
-from .models import Profile, LocationRoom, Post, Connection, Streak
+from .models import Profile, LocationRoom, Post, Connection, Streak, Conversation, ChatMessage, Notification, UnreadCounts
+from django.db import IntegrityError, transaction
 from django.db import models
-from django.db.models import Count, Q
+from django.db.models import Count, Q, F, Case, Exists, OuterRef, When, Window, Sum
+from django.db.models.functions import Greatest, RowNumber
+
+BLOCKLIST_CACHE_TIMEOUT = 60 * 60  # 1 hour; invalidated on every block change
+FRIENDS_CACHE_TIMEOUT = 60 * 60  # 1 hour; invalidated on every connection change
+MUTUAL_PREVIEW_LIMIT = 3
+PROFILE_CARD_TIMEOUT = 60 * 60 * 24  # 1 day; rewritten on every profile save
+PROFILE_CARD_VERSION = 1  # bump when the cached card layout changes
+PARTNER_CACHE_SIZE = 2048  # chat receivers kept per process
+PARTNER_CACHE_TIMEOUT = 5 * 60  # bounds staleness across processes
+PRESENCE_TTL = 90  # seconds a profile stays online without a heartbeat
+PRESENCE_HEARTBEAT_INTERVAL = 30  # heartbeats are folded into one write per interval
+LAST_ACTIVE_WRITE_INTERVAL = 5 * 60  # at most one last_active UPDATE per interval
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
@@ -42,25 +59,561 @@ def get_interest_rarity_weights():
             
     return rarity
 
+class BlocklistService:
+    """
+    Cached set of profile ids blocked by *or* blocking a profile.
+
+    Read paths test membership against a frozenset (O(1), no SQL on a cache
+    hit) instead of adding a blocked-user subquery to every feed query.
+    Entries are dropped whenever a BLOCKED connection is saved or deleted.
+    """
+
+    @staticmethod
+    def cache_key(profile_id):
+        return f'blocklist:{profile_id}'
+
+    @staticmethod
+    def get_blocked_ids(profile):
+        profile_id = profile if isinstance(profile, int) else profile.id
+        key = BlocklistService.cache_key(profile_id)
+        blocked = cache.get(key)
+        if blocked is None:
+            rows = Connection.objects.filter(
+                Q(sender_id=profile_id) | Q(receiver_id=profile_id),
+                status='BLOCKED'
+            ).values_list('sender_id', 'receiver_id')
+            blocked = frozenset(s_id if s_id != profile_id else r_id for s_id, r_id in rows)
+            cache.set(key, blocked, BLOCKLIST_CACHE_TIMEOUT)
+        return blocked
+
+    @staticmethod
+    def invalidate(*profile_ids):
+        cache.delete_many([BlocklistService.cache_key(pid) for pid in profile_ids])
+
+class FriendService:
+    """Cached set of CONNECTED profile ids per profile."""
+
+    @staticmethod
+    def cache_key(profile_id):
+        return f'friends:{profile_id}'
+
+    @staticmethod
+    def get_friend_ids(profile):
+        profile_id = profile if isinstance(profile, int) else profile.id
+        key = FriendService.cache_key(profile_id)
+        friends = cache.get(key)
+        if friends is None:
+            rows = Connection.objects.filter(
+                Q(sender_id=profile_id) | Q(receiver_id=profile_id),
+                status='CONNECTED'
+            ).values_list('sender_id', 'receiver_id')
+            friends = frozenset(s_id if s_id != profile_id else r_id for s_id, r_id in rows)
+            cache.set(key, friends, FRIENDS_CACHE_TIMEOUT)
+        return friends
+
+    @staticmethod
+    def invalidate(*profile_ids):
+        cache.delete_many([FriendService.cache_key(pid) for pid in profile_ids])
+
+class MutualFriendService:
+    @staticmethod
+    def get_previews(viewer, candidate_ids, limit=MUTUAL_PREVIEW_LIMIT):
+        """
+        Returns {candidate_id: [(friend_id, picture_path), ...]} for mutual
+        friends of `viewer` that have a profile picture, at most `limit` each.
+
+        The query is driven by the page's candidates: their CONNECTED rows
+        are matched against the viewer's own connections with a correlated
+        EXISTS, so the viewer's friend set is never sent as parameters. The
+        per-candidate cap is applied in SQL with a ROW_NUMBER() window and
+        only three columns are selected, so the work is bounded by the page
+        of candidates rather than by how many friends anyone has.
+        """
+        viewer_id = viewer if isinstance(viewer, int) else viewer.id
+        candidate_ids = set(candidate_ids)
+        # The cached set only decides whether there is anything to look up
+        if not candidate_ids or not FriendService.get_friend_ids(viewer_id):
+            return {}
+
+        def viewer_knows(column):
+            return Exists(Connection.objects.filter(
+                Q(sender_id=viewer_id, receiver_id=OuterRef(column))
+                | Q(receiver_id=viewer_id, sender_id=OuterRef(column)),
+                status='CONNECTED'
+            ))
+
+        candidate_is_sender = Q(sender_id__in=candidate_ids) & viewer_knows('receiver_id')
+        rows = Connection.objects.filter(
+            candidate_is_sender | (Q(receiver_id__in=candidate_ids) & viewer_knows('sender_id')),
+            status='CONNECTED'
+        ).annotate(
+            candidate_id=Case(When(candidate_is_sender, then=F('sender_id')), default=F('receiver_id')),
+            friend_id=Case(When(candidate_is_sender, then=F('receiver_id')), default=F('sender_id')),
+            picture=Case(
+                When(candidate_is_sender, then=F('receiver__profile_picture')),
+                default=F('sender__profile_picture')
+            ),
+        ).exclude(
+            Q(picture__isnull=True) | Q(picture='')
+        ).annotate(
+            rank=Window(RowNumber(), partition_by=[F('candidate_id')], order_by=F('id').asc())
+        ).filter(rank__lte=limit).values_list('candidate_id', 'friend_id', 'picture')
+
+        previews = {}
+        for candidate_id, friend_id, picture in rows:
+            previews.setdefault(candidate_id, []).append((friend_id, picture))
+        return previews
+
+    @staticmethod
+    def picture_url(path):
+        return Profile._meta.get_field('profile_picture').storage.url(path)
+
+class ProfileCardService:
+    """
+    Cached, viewer-independent profile card fragments.
+
+    A card holds what every viewer sees the same: username, picture path,
+    gravity, counts and last_active (so is_active is judged at render time).
+    Full profile saves write the new card through; partial saves such as
+    `refresh_gravity` drop it, since the in-memory instance may not match
+    the row. Viewer-specific fields are merged in by the caller.
+    """
+
+    FIELDS = ('id', 'username', 'profile_picture', 'social_gravity', 'posts_count', 'connections_count', 'last_active')
+
+    @staticmethod
+    def cache_key(profile_id):
+        return f'profile_card:v{PROFILE_CARD_VERSION}:{profile_id}'
+
+    @staticmethod
+    def build(profile):
+        card = {field: getattr(profile, field) for field in ProfileCardService.FIELDS}
+        card['profile_picture'] = profile.profile_picture.name or None
+        return card
+
+    @staticmethod
+    def store(profile):
+        cache.set(ProfileCardService.cache_key(profile.id), ProfileCardService.build(profile), PROFILE_CARD_TIMEOUT)
+
+    @staticmethod
+    def get_cards(profile_ids):
+        """Returns {profile_id: card}; misses are loaded in one query and cached."""
+        keys = {ProfileCardService.cache_key(pid): pid for pid in profile_ids}
+        cards = {keys[key]: card for key, card in cache.get_many(keys).items()}
+        missing = [pid for pid in keys.values() if pid not in cards]
+        if missing:
+            loaded = {}
+            for row in Profile.objects.filter(id__in=missing).values(*ProfileCardService.FIELDS):
+                row['profile_picture'] = row['profile_picture'] or None
+                loaded[row['id']] = row
+            cache.set_many(
+                {ProfileCardService.cache_key(pid): card for pid, card in loaded.items()},
+                PROFILE_CARD_TIMEOUT
+            )
+            cards.update(loaded)
+        return cards
+
+    @staticmethod
+    def invalidate(*profile_ids):
+        cache.delete_many([ProfileCardService.cache_key(pid) for pid in profile_ids])
+
+class LocalLRUCache:
+    """
+    Bounded, thread-safe, process-local LRU with a per-entry TTL.
+
+    For hot lookups where even a shared-cache round trip is too much.
+    Every process holds its own copy, so entries must either tolerate
+    `ttl` seconds of staleness or be validated by the caller.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class PartnerService:
+    """
+    Chat receivers resolved from a per-process LRU instead of a query per send.
+
+    Cached receivers are validated optimistically: a receiver deleted since
+    it was cached makes the message INSERT fail its foreign key, and the
+    caller drops it with `forget`. Block status is read from
+    BlocklistService on every send, so it is never stale.
+    """
+
+    _profiles = LocalLRUCache(PARTNER_CACHE_SIZE, PARTNER_CACHE_TIMEOUT)
+
+    @staticmethod
+    def get_partner(receiver_id):
+        """Returns the receiver Profile, or None if it doesn't exist."""
+        try:
+            receiver_id = int(receiver_id)
+        except (TypeError, ValueError):
+            return None
+        receiver = PartnerService._profiles.get(receiver_id)
+        if receiver is None:
+            receiver = Profile.objects.filter(pk=receiver_id).first()
+            if receiver is not None:
+                PartnerService._profiles.set(receiver_id, receiver)
+        return receiver
+
+    @staticmethod
+    async def aget_partner(receiver_id):
+        """Async version of `get_partner`."""
+        try:
+            receiver_id = int(receiver_id)
+        except (TypeError, ValueError):
+            return None
+        receiver = PartnerService._profiles.get(receiver_id)
+        if receiver is None:
+            receiver = await Profile.objects.filter(pk=receiver_id).afirst()
+            if receiver is not None:
+                PartnerService._profiles.set(receiver_id, receiver)
+        return receiver
+
+    @staticmethod
+    def is_blocked(sender, receiver_id):
+        return receiver_id in BlocklistService.get_blocked_ids(sender)
+
+    @staticmethod
+    def forget(*profile_ids):
+        for profile_id in profile_ids:
+            PartnerService._profiles.pop(profile_id)
+
+class ConversationService:
+    """Keeps the per-pair Conversation inbox rows in step with ChatMessage writes."""
+
+    @staticmethod
+    def pair(profile_id, other_id):
+        """(participant_a_id, participant_b_id) for two profiles, lower id first."""
+        return (profile_id, other_id) if profile_id < other_id else (other_id, profile_id)
+
+    @staticmethod
+    def unread_field(pair, reader_id):
+        return 'unread_a' if reader_id == pair[0] else 'unread_b'
+
+    @staticmethod
+    def read_field(pair, reader_id):
+        return 'read_a' if reader_id == pair[0] else 'read_b'
+
+    @staticmethod
+    def record_messages(messages):
+        """
+        Folds newly saved messages into their pairs' summaries: one UPDATE per
+        pair touched (an INSERT the first time two people talk). Call inside
+        the transaction that saved the messages.
+        """
+        by_pair = {}
+        for message in messages:
+            pair = ConversationService.pair(message.sender_id, message.receiver_id)
+            entry = by_pair.setdefault(pair, {'last': message, 'unread_a': 0, 'unread_b': 0})
+            if (message.timestamp, message.id) >= (entry['last'].timestamp, entry['last'].id):
+                entry['last'] = message
+            entry[ConversationService.unread_field(pair, message.receiver_id)] += 1
+
+        received = {}
+        for message in messages:
+            received[message.receiver_id] = received.get(message.receiver_id, 0) + 1
+        BadgeService.add('messages', received)
+
+        now = timezone.now()
+        for (a, b), entry in by_pair.items():
+            last = entry['last']
+            summary = {
+                'last_message_id': last.id,
+                'last_message_preview': (last.content or '')[:255],
+                'last_timestamp': last.timestamp,
+                'updated_at': now,
+            }
+            updates = dict(
+                summary,
+                unread_a=F('unread_a') + entry['unread_a'],
+                unread_b=F('unread_b') + entry['unread_b'],
+            )
+            if Conversation.objects.filter(participant_a_id=a, participant_b_id=b).update(**updates):
+                continue
+            try:
+                with transaction.atomic():
+                    Conversation.objects.create(
+                        participant_a_id=a, participant_b_id=b,
+                        unread_a=entry['unread_a'], unread_b=entry['unread_b'], **summary
+                    )
+            except IntegrityError:
+                # Another writer created the row first
+                Conversation.objects.filter(participant_a_id=a, participant_b_id=b).update(**updates)
+
+    @staticmethod
+    def mark_read(reader_id, partner_id, up_to=None):
+        """
+        Moves the reader's read watermark for the conversation with partner
+        up to message id `up_to` (the latest message when None, and never
+        beyond it): one UPDATE
+        of the Conversation row, however many messages it covers.
+
+        The unread count drops by the partner's messages between the old and
+        new watermark, counted on the (sender, id) index. Returns that number.
+        """
+        pair = ConversationService.pair(reader_id, partner_id)
+        read_field = ConversationService.read_field(pair, reader_id)
+        unread_field = ConversationService.unread_field(pair, reader_id)
+        conversation = Conversation.objects.filter(participant_a_id=pair[0], participant_b_id=pair[1])
+        while True:
+            row = conversation.values(read_field, 'last_message_id').first()
+            if row is None:
+                return 0
+            watermark = row[read_field]
+            # Never past the newest message, or later messages would be born read
+            target = row['last_message_id'] if up_to is None else min(up_to, row['last_message_id'] or 0)
+            if not target or target <= watermark:
+                return 0
+            marked = ChatMessage.objects.filter(
+                sender_id=partner_id, receiver_id=reader_id, id__gt=watermark, id__lte=target
+            ).count()
+            # Compare-and-set, so concurrent readers never subtract the same messages twice
+            if conversation.filter(**{read_field: watermark}).update(**{
+                read_field: target,
+                unread_field: Greatest(F(unread_field) - marked, 0),
+                'updated_at': timezone.now(),
+            }):
+                BadgeService.add('messages', {reader_id: -marked})
+                return marked
+
+    @staticmethod
+    def forget_messages(messages):
+        """
+        Takes a ChatMessage queryset that is about to be deleted out of its
+        pairs' summaries: unread messages leave the receivers' unread counts
+        and badges, and a pair whose last message goes loses its preview.
+        Call inside the deleting transaction.
+        """
+        unread = (
+            messages.with_read_state().filter(is_read=False).order_by()
+            .values('sender', 'receiver').annotate(n=Count('id')).values_list('sender', 'receiver', 'n')
+        )
+        received = {}
+        for sender_id, receiver_id, n in unread:
+            pair = ConversationService.pair(sender_id, receiver_id)
+            field = ConversationService.unread_field(pair, receiver_id)
+            Conversation.objects.filter(participant_a_id=pair[0], participant_b_id=pair[1]).update(
+                **{field: Greatest(F(field) - n, 0)}
+            )
+            received[receiver_id] = received.get(receiver_id, 0) - n
+        BadgeService.add('messages', received)
+        Conversation.objects.filter(last_message_id__in=messages.values('id')).update(last_message_preview='')
+
+    @staticmethod
+    def inbox(profile):
+        """The profile's conversations, most recent first, without blocked partners."""
+        blocked_ids = BlocklistService.get_blocked_ids(profile)
+        return Conversation.objects.filter(
+            Q(participant_a=profile) | Q(participant_b=profile)
+        ).exclude(participant_a_id__in=blocked_ids).exclude(participant_b_id__in=blocked_ids)\
+            .order_by('-last_timestamp', '-id')
+
+class BadgeService:
+    """
+    Unread badge counters kept in UnreadCounts, so badges are a primary-key
+    read instead of a count over notifications and conversations.
+
+    Writers adjust them with `add` in the same transaction as the change
+    they count; once it commits, online profiles get the new values pushed
+    over their sockets (core/delivery.py). A profile without a row yet is
+    counted from the tables on its first read.
+    """
+
+    FIELDS = ('notifications', 'messages')
+
+    @staticmethod
+    def add(field, deltas, push=True):
+        """
+        Adds {profile_id: delta} to one counter; never goes below zero. With
+        `push`, the profiles get their counts after the transaction commits.
+        """
+        by_delta = {}
+        for profile_id, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(profile_id)
+        for delta, profile_ids in by_delta.items():
+            UnreadCounts.objects.filter(profile_id__in=profile_ids).update(**{field: Greatest(F(field) + delta, 0)})
+        if by_delta and push:
+            transaction.on_commit(lambda: BadgeService.push(list(deltas)))
+
+    @staticmethod
+    def counts(profile_id):
+        """{'notifications': n, 'messages': m} for one profile."""
+        return BadgeService.counts_many([profile_id])[profile_id]
+
+    @staticmethod
+    def counts_many(profile_ids):
+        rows = {
+            row['profile_id']: row
+            for row in UnreadCounts.objects.filter(profile_id__in=profile_ids).values('profile_id', *BadgeService.FIELDS)
+        }
+        result = {}
+        for profile_id in profile_ids:
+            row = rows.get(profile_id) or BadgeService.rebuild(profile_id)
+            result[profile_id] = {field: row[field] for field in BadgeService.FIELDS}
+        return result
+
+    @staticmethod
+    def rebuild(profile_id):
+        """Recounts one profile's badges from the tables and stores them."""
+        as_a = Conversation.objects.filter(participant_a_id=profile_id).aggregate(n=Sum('unread_a'))['n']
+        as_b = Conversation.objects.filter(participant_b_id=profile_id).aggregate(n=Sum('unread_b'))['n']
+        counts = {
+            'notifications': Notification.objects.filter(recipient_id=profile_id, is_read=False).count(),
+            'messages': (as_a or 0) + (as_b or 0),
+        }
+        UnreadCounts.objects.update_or_create(profile_id=profile_id, defaults=counts)
+        return counts
+
+    @staticmethod
+    def push(profile_ids):
+        # delivery imports this module
+        from .delivery import push_badges
+        push_badges(profile_ids)
+
+
+class PresenceService:
+    """
+    Online set kept in the shared cache by WebSocket connections.
+
+    `presence:<id>` exists while a profile has a live socket. Each open
+    socket refreshes it every PRESENCE_HEARTBEAT_INTERVAL from a server-side
+    timer, whether or not the client sends anything; it expires PRESENCE_TTL
+    seconds after the last heartbeat, so crashed workers can't leave anyone
+    online forever. `presence_conns:<id>`
+    counts open sockets so a second device disconnecting doesn't flip the
+    profile offline, and `presence_devices:<id>` maps each connected device
+    id to when its session expires.
+    """
+
+    @staticmethod
+    def cache_key(profile_id):
+        return f'presence:{profile_id}'
+
+    @staticmethod
+    def connections_key(profile_id):
+        return f'presence_conns:{profile_id}'
+
+    @staticmethod
+    def devices_key(profile_id):
+        return f'presence_devices:{profile_id}'
+
+    @staticmethod
+    def _touch_device(profile_id, device_id, remove=False):
+        # Read-modify-write: a concurrent update can drop a device, which
+        # its next heartbeat re-adds
+        key = PresenceService.devices_key(profile_id)
+        now = time.time()
+        devices = {d: exp for d, exp in (cache.get(key) or {}).items() if exp > now}
+        if remove:
+            devices.pop(device_id, None)
+        else:
+            devices[device_id] = now + PRESENCE_TTL
+        if devices:
+            cache.set(key, devices, PRESENCE_TTL)
+        else:
+            cache.delete(key)
+
+    @staticmethod
+    def connect(profile_id, device_id=None):
+        """Registers a socket; returns True if the profile just came online."""
+        key = PresenceService.connections_key(profile_id)
+        cache.add(key, 0, PRESENCE_TTL)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(key, 1, PRESENCE_TTL)
+            count = 1
+        cache.set(PresenceService.cache_key(profile_id), True, PRESENCE_TTL)
+        if device_id:
+            PresenceService._touch_device(profile_id, device_id)
+        return count == 1
+
+    @staticmethod
+    def heartbeat(profile_id, write_last_active=False, device_id=None):
+        """Keeps the profile online for another PRESENCE_TTL seconds."""
+        cache.set(PresenceService.cache_key(profile_id), True, PRESENCE_TTL)
+        if not cache.touch(PresenceService.connections_key(profile_id), PRESENCE_TTL):
+            # The count expired while this socket was open; it is at least this one
+            cache.add(PresenceService.connections_key(profile_id), 1, PRESENCE_TTL)
+        if device_id:
+            PresenceService._touch_device(profile_id, device_id)
+        if write_last_active:
+            Profile.objects.filter(pk=profile_id).update(last_active=timezone.now())
+            # update() skips the save signals that keep the card fresh
+            ProfileCardService.invalidate(profile_id)
+
+    @staticmethod
+    def disconnect(profile_id, device_id=None):
+        """Unregisters a socket; returns True if it was the profile's last one."""
+        if device_id:
+            PresenceService._touch_device(profile_id, device_id, remove=True)
+        key = PresenceService.connections_key(profile_id)
+        try:
+            remaining = cache.decr(key)
+        except ValueError:
+            remaining = 0
+        if remaining > 0:
+            return False
+        cache.delete_many([key, PresenceService.cache_key(profile_id), PresenceService.devices_key(profile_id)])
+        return True
+
+    @staticmethod
+    def devices(profile_id):
+        """Ids of the profile's connected devices."""
+        now = time.time()
+        return sorted(d for d, exp in (cache.get(PresenceService.devices_key(profile_id)) or {}).items() if exp > now)
+
+    @staticmethod
+    def online_ids(profile_ids):
+        """The subset of `profile_ids` with a live socket (one cache round trip)."""
+        keys = {PresenceService.cache_key(pid): pid for pid in profile_ids}
+        return {keys[key] for key in cache.get_many(keys)}
+
 class MatchService:
     @staticmethod
     def get_suggested_people(user_profile, limit=10):
         """
         Optimized version: Fetches candidates and connection data in bulk to avoid N+1 queries.
         """
-        # 1. Identity blocked and already connected users in one go
-        connections = Connection.objects.filter(
-            Q(sender=user_profile) | Q(receiver=user_profile)
-        ).values('sender_id', 'receiver_id', 'status')
-        
-        blocked_ids = set()
-        connected_ids = set()
-        for conn in connections:
-            other_id = conn['sender_id'] if conn['sender_id'] != user_profile.id else conn['receiver_id']
-            if conn['status'] == 'BLOCKED':
-                blocked_ids.add(other_id)
-            elif conn['status'] == 'CONNECTED':
-                connected_ids.add(other_id)
+        # 1. Identify blocked (cached) and already connected users
+        blocked_ids = BlocklistService.get_blocked_ids(user_profile)
+        user_friend_ids = FriendService.get_friend_ids(user_profile)
         
         exclude_ids = blocked_ids | {user_profile.id}
         
@@ -164,6 +717,7 @@ class FeedService:
         """
         offset = (page - 1) * page_size
         now = timezone.now()
+        blocked_ids = BlocklistService.get_blocked_ids(user_profile)
         
         # 1. Fetch a pool for scoring — larger pool when shuffling for more variety
         pool_size = 200 if shuffle else 50
@@ -180,6 +734,8 @@ class FeedService:
         
         scored_posts = []
         for post in posts:
+            if post.author_id in blocked_ids:
+                continue
             score = 0
             # ... (scoring logic same as before) ...
             if user_loc and post.location:
@@ -213,12 +769,14 @@ class FeedService:
         return Post.objects.filter(author=profile).order_by('-created_at')[:limit]
 
     @staticmethod
-    def get_trending_feed(page=1, page_size=20, shuffle=False):
+    def get_trending_feed(page=1, page_size=20, shuffle=False, user_profile=None):
         """
         Returns trending posts globally with engagement and freshness.
+        Posts by users blocked by/blocking `user_profile` are left out.
         """
         offset = (page - 1) * page_size
         now = timezone.now()
+        blocked_ids = BlocklistService.get_blocked_ids(user_profile) if user_profile else frozenset()
         pool_size = 200 if shuffle else 50
         posts = Post.objects.filter(Q(expires_at__gt=now) | Q(expires_at__isnull=True))\
             .select_related('author', 'location')\
@@ -229,6 +787,8 @@ class FeedService:
         
         scored_posts = []
         for post in posts:
+            if post.author_id in blocked_ids:
+                continue
             score = 0
             score += post.likes_count * 5 
             score += post.comments_count * 10
@@ -276,11 +836,11 @@ class ProximityService:
         
         if best_room:
             user_profile.current_location = best_room
-            user_profile.save()
+            user_profile.save(update_fields=['current_location', 'last_active'])
             return best_room
         
         user_profile.current_location = None
-        user_profile.save()
+        user_profile.save(update_fields=['current_location', 'last_active'])
         return None
 
 class StreakService:
@@ -1,16 +1,106 @@
+import threading
+from contextlib import contextmanager
 from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Post, Connection
+from .authentication import forget_user
+from .models import Post, Connection, Profile
+from .services import BlocklistService, FriendService, PartnerService, ProfileCardService
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_gravity_refresh():
+    """
+    Collects gravity refreshes triggered inside the block and runs them once
+    per affected profile on exit, instead of once per saved/deleted row.
+    Bulk writes (bulk_create/bulk_update) skip signals, so callers register
+    those profiles with `mark_for_gravity_refresh`.
+    """
+    outer = getattr(_deferred, 'profile_ids', None)
+    if outer is not None:
+        # Nested block: let the outermost one do the work
+        yield
+        return
+
+    _deferred.profile_ids = set()
+    try:
+        yield
+        profile_ids = _deferred.profile_ids
+    finally:
+        _deferred.profile_ids = None
+
+    for profile in Profile.objects.filter(id__in=profile_ids):
+        profile.refresh_gravity()
+
+
+def mark_for_gravity_refresh(*profile_ids):
+    """Schedules a gravity refresh for profile ids, now or at the end of a deferred block."""
+    pending = getattr(_deferred, 'profile_ids', None)
+    if pending is not None:
+        pending.update(profile_ids)
+        return
+    for profile in Profile.objects.filter(id__in=profile_ids):
+        profile.refresh_gravity()
+
+
+def _refresh_related_profiles(instance, *fields):
+    pending = getattr(_deferred, 'profile_ids', None)
+    if pending is not None:
+        pending.update(getattr(instance, f'{field}_id') for field in fields)
+        return
+    # Refresh through the related instances so in-memory objects stay current
+    for field in fields:
+        getattr(instance, field).refresh_gravity()
+
 
 @receiver(post_save, sender=Post)
 @receiver(post_delete, sender=Post)
 def update_profile_on_post_change(sender, instance, **kwargs):
     """Update profile metrics when a post is created or deleted."""
-    instance.author.refresh_gravity()
+    _refresh_related_profiles(instance, 'author')
 
 @receiver(post_save, sender=Connection)
 @receiver(post_delete, sender=Connection)
 def update_profile_on_connection_change(sender, instance, **kwargs):
     """Update profile metrics when a connection status changes."""
-    instance.sender.refresh_gravity()
-    instance.receiver.refresh_gravity()
+    _refresh_related_profiles(instance, 'sender', 'receiver')
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def invalidate_graph_caches_on_connection_change(sender, instance, **kwargs):
+    """Drop cached friend sets, and blocklists when a block is added or lifted."""
+    FriendService.invalidate(instance.sender_id, instance.receiver_id)
+    if instance.status == 'BLOCKED':
+        BlocklistService.invalidate(instance.sender_id, instance.receiver_id)
+
+@receiver(post_save, sender=Profile)
+def write_through_profile_card(sender, instance, update_fields=None, **kwargs):
+    """Store the fresh profile card; partial saves only drop the stale one."""
+    if update_fields is None:
+        ProfileCardService.store(instance)
+    else:
+        ProfileCardService.invalidate(instance.id)
+
+@receiver(post_delete, sender=Profile)
+def drop_profile_card(sender, instance, **kwargs):
+    ProfileCardService.invalidate(instance.id)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_chat_partner(sender, instance, update_fields=None, **kwargs):
+    """Drop this process's cached receiver; other processes expire it or catch the failed insert."""
+    if update_fields is None:
+        PartnerService.forget(instance.id)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_authenticated_user(sender, instance, **kwargs):
+    """Reload the cached request user (and profile) after the user changes."""
+    forget_user(instance.id)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_authenticated_profile(sender, instance, **kwargs):
+    forget_user(instance.user_id)
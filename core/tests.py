@@ -2,11 +2,50 @@
 Core App Tests - Beta Readiness Suite
 Tests for critical authentication, profile, and connection flows.
 """
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+import asyncio
+import importlib
+from decimal import Decimal
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.db import close_old_connections, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import Profile, Interest, Connection, Post, Notification
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import (
+    Profile, Interest, Connection, Post, Notification, Comment, ChatMessage, Like, Conversation,
+    PushOutbox, RecoveryRequest, RetentionCheckpoint, UnreadCounts,
+)
+from .serializers import CommentSerializer, ProfileSerializer, PostSerializer, ChatMessageSerializer, RowPlan
+from .renderers import FastJSONRenderer
+from .authentication import _users, user_from_token
+from .batching import BLOCKED, NOT_FOUND, BatcherFull, MessageBatcher, persist_messages
+from .consumers import ChatConsumer
+from .delivery import deliver_to_device, deliver_to_post
+from .executors import db_sync_to_async
+from .graph import GraphSnapshot
+from .notifications import flush_notifications, write_notifications
+from .partitions import partition_bounds, partition_name
+from .push import INVALID_TOKEN, RETRY, FakePushProvider, claim_batch, dispatch_batch
+from .retention import NotificationPolicy, PushOutboxPolicy, RetentionEngine
+from .services import BadgeService, ConversationService, MutualFriendService, PartnerService, PresenceService, ProfileCardService
 
 
 class AuthenticationTests(APITestCase):
@@ -131,6 +170,1217 @@ class ConnectionTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class BulkConnectionTests(APITestCase):
+    """Test the batched connection request/accept/reject endpoints."""
+
+    def setUp(self):
+        self.users = []
+        self.profiles = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'bulkuser{i}', password='pass123')
+            self.users.append(user)
+            self.profiles.append(Profile.objects.create(user=user, username=f'bulkuser{i}'))
+        self.client = APIClient()
+
+    def test_bulk_send_skips_self_missing_and_existing(self):
+        me, a, b, c = self.profiles
+        Connection.objects.create(sender=c, receiver=me, status='PENDING')
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/connections/bulk/request/', {
+            'profile_ids': [a.id, b.id, c.id, me.id, 99999]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(response.data['sent']), sorted([a.id, b.id]))
+        self.assertEqual(response.data['skipped'], {c.id: 'PENDING', me.id: 'SELF', 99999: 'NOT_FOUND'})
+        self.assertEqual(Connection.objects.filter(sender=me, status='PENDING').count(), 2)
+        self.assertEqual(Notification.objects.filter(notification_type='CONNECTION_REQUEST').count(), 2)
+
+    def test_bulk_send_does_not_notify_requests_a_racing_call_created(self):
+        me, a, b, c = self.profiles
+        lock = Profile.objects.select_for_update
+
+        def race_then_lock(*args, **kwargs):
+            # A concurrent request for `a` commits after this one's existence check
+            Connection.objects.create(sender=me, receiver=a, status='PENDING')
+            return lock(*args, **kwargs)
+
+        self.client.force_authenticate(user=self.users[0])
+        with mock.patch.object(Profile.objects, 'select_for_update', race_then_lock):
+            response = self.client.post('/api/connections/bulk/request/', {'profile_ids': [a.id, b.id]}, format='json')
+        self.assertEqual(response.data['sent'], [b.id])
+        self.assertEqual(response.data['skipped'], {a.id: 'PENDING'})
+        self.assertEqual(
+            list(Notification.objects.filter(notification_type='CONNECTION_REQUEST').values_list('recipient_id', flat=True)),
+            [b.id]
+        )
+
+    def test_bulk_accept_refreshes_gravity_once(self):
+        me, a, b, c = self.profiles
+        for sender in (a, b):
+            Connection.objects.create(sender=sender, receiver=me, status='PENDING')
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/connections/bulk/accept/', {
+            'profile_ids': [a.id, b.id, c.id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['accepted']), sorted([a.id, b.id]))
+        self.assertEqual(response.data['skipped'], {c.id: 'NOT_FOUND'})
+        me.refresh_from_db()
+        self.assertEqual(me.connections_count, 2)
+
+    def test_bulk_reject(self):
+        me, a, b, c = self.profiles
+        Connection.objects.create(sender=a, receiver=me, status='PENDING')
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/connections/bulk/reject/', {'profile_ids': [a.id]}, format='json')
+        self.assertEqual(response.data['rejected'], [a.id])
+        self.assertFalse(Connection.objects.filter(sender=a, receiver=me).exists())
+
+    def test_bulk_requires_list(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/connections/bulk/request/', {'profile_ids': 'nope'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BlocklistTests(APITestCase):
+    """Test that blocked users are filtered from read paths."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='blocker', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='blocker')
+        other_user = User.objects.create_user(username='blocked', password='pass123')
+        self.other = Profile.objects.create(user=other_user, username='blocked')
+        self.post = Post.objects.create(author=self.other, content_text='Hidden soon')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_block_hides_posts_and_comments_until_unblocked(self):
+        Post.objects.create(author=self.profile, content_text='Mine').comments.create(
+            user=self.other, content='Hi'
+        )
+        my_post = Post.objects.get(author=self.profile)
+
+        self.assertEqual(len(self.client.get('/api/feed/').data['results']), 2)
+        self.client.post(f'/api/users/{self.other.id}/block/')
+
+        feed_ids = [p['id'] for p in self.client.get('/api/feed/').data['results']]
+        self.assertNotIn(self.post.id, feed_ids)
+        trending_ids = [p['id'] for p in self.client.get('/api/feed/trending/').data['results']]
+        self.assertNotIn(self.post.id, trending_ids)
+        self.assertEqual(self.client.get(f'/api/posts/{my_post.id}/comments/').data, [])
+
+        self.client.delete(f'/api/users/{self.other.id}/block/')
+        feed_ids = [p['id'] for p in self.client.get('/api/feed/').data['results']]
+        self.assertIn(self.post.id, feed_ids)
+
+    def test_block_applies_in_both_directions(self):
+        third_user = User.objects.create_user(username='bystander', password='pass123')
+        third = Profile.objects.create(user=third_user, username='bystander')
+        Connection.objects.create(sender=self.other, receiver=self.profile, status='BLOCKED')
+        response = self.client.get('/api/suggested/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        suggested_ids = [p['id'] for p in response.data['results']]
+        self.assertNotIn(self.other.id, suggested_ids)
+        self.assertIn(third.id, suggested_ids)
+
+
+    def test_block_hides_profile_and_their_posts(self):
+        collab = Post.objects.create(author=self.other, content_text='Together', is_collaborative=True)
+        collab.contributors.add(self.profile)
+        self.assertEqual(len(self.client.get(f'/api/posts/me/?user_id={self.other.id}').data), 2)
+        self.assertEqual(len(self.client.get('/api/posts/collaborative/').data), 1)
+
+        # Blocked by them: the viewer no longer sees their profile or posts
+        Connection.objects.create(sender=self.other, receiver=self.profile, status='BLOCKED')
+        self.assertEqual(self.client.get(f'/api/profile/{self.other.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/posts/me/?user_id={self.other.id}').data, [])
+        self.assertEqual(self.client.get('/api/posts/collaborative/').data, [])
+
+
+class MutualFriendPreviewTests(APITestCase):
+    """Test the capped mutual-friend picture previews."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='pass123')
+        self.viewer = Profile.objects.create(user=self.user, username='viewer')
+        cand_user = User.objects.create_user(username='candidate', password='pass123')
+        self.candidate = Profile.objects.create(user=cand_user, username='candidate', social_gravity=5.0)
+        for i in range(5):
+            user = User.objects.create_user(username=f'mutual{i}', password='pass123')
+            friend = Profile.objects.create(
+                user=user, username=f'mutual{i}',
+                profile_picture=f'profiles/mutual{i}.jpg' if i else None
+            )
+            Connection.objects.create(sender=self.viewer, receiver=friend, status='CONNECTED')
+            Connection.objects.create(sender=friend, receiver=self.candidate, status='CONNECTED')
+
+    def test_previews_are_capped_and_skip_missing_pictures(self):
+        previews = MutualFriendService.get_previews(self.viewer, [self.candidate.id])
+        paths = [path for _, path in previews[self.candidate.id]]
+        self.assertEqual(len(paths), 3)
+        self.assertNotIn('', paths)
+
+    def test_query_does_not_grow_with_friend_count(self):
+        def preview_sql():
+            with CaptureQueriesContext(connection) as queries:
+                MutualFriendService.get_previews(self.viewer, [self.candidate.id])
+            return queries.captured_queries[-1]['sql']
+
+        before = preview_sql()
+        for i in range(40):
+            user = User.objects.create_user(username=f'extra{i}', password='pass123')
+            Connection.objects.create(sender=self.viewer, receiver=Profile.objects.create(user=user, username=user.username), status='CONNECTED')
+        self.assertEqual(preview_sql(), before)
+
+    def test_serialized_profiles_include_picture_urls(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/leaderboard/')
+        candidate = next(p for p in response.data if p['id'] == self.candidate.id)
+        self.assertEqual(len(candidate['mutual_friend_pics']), 3)
+        self.assertTrue(all(url.startswith('/media/profiles/') for url in candidate['mutual_friend_pics']))
+
+
+class BatchLoaderTests(APITestCase):
+    """Test that list endpoints run a fixed number of queries per page."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='batcher', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='batcher')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def count_queries(self, url):
+        self.client.get(url)  # Warm per-user caches
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def add_commenters(self, post, count, offset=0):
+        for i in range(offset, offset + count):
+            user = User.objects.create_user(username=f'commenter{i}', password='pass123')
+            commenter = Profile.objects.create(user=user, username=f'commenter{i}')
+            comment = Comment.objects.create(user=commenter, post=post, content=f'Comment {i}')
+            comment.likes.add(self.profile)
+            Comment.objects.create(user=commenter, post=post, content='Reply', parent=comment)
+
+    def test_comment_list_query_count_is_constant(self):
+        post = Post.objects.create(author=self.profile, content_text='Busy post')
+        url = f'/api/posts/{post.id}/comments/'
+        self.add_commenters(post, 2)
+        small = self.count_queries(url)
+        self.add_commenters(post, 6, offset=2)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_comment_counts_match_single_serialization(self):
+        post = Post.objects.create(author=self.profile, content_text='Post')
+        self.add_commenters(post, 2)
+        listed = {c['id']: c for c in self.client.get(f'/api/posts/{post.id}/comments/').data}
+        for comment in Comment.objects.all():
+            single = CommentSerializer(comment, context={'request': self._request()}).data
+            self.assertEqual(listed[comment.id]['replies_count'], single['replies_count'])
+            self.assertEqual(listed[comment.id]['likes_count'], single['likes_count'])
+            self.assertEqual(listed[comment.id]['is_liked'], single['is_liked'])
+
+    def test_user_posts_query_count_is_constant(self):
+        for i in range(2):
+            Post.objects.create(author=self.profile, content_text=f'Post {i}')
+        small = self.count_queries('/api/posts/me/')
+        for i in range(6):
+            Post.objects.create(author=self.profile, content_text=f'More {i}')
+        self.assertEqual(self.count_queries('/api/posts/me/'), small)
+
+    def _request(self):
+        return SimpleNamespace(user=self.user)
+
+    def add_profiles(self, count, offset=0):
+        music, _ = Interest.objects.get_or_create(name='Music')
+        self.profile.interests.add(music)
+        for i in range(offset, offset + count):
+            user = User.objects.create_user(username=f'candidate{i}', password='pass123')
+            candidate = Profile.objects.create(user=user, username=f'candidate{i}')
+            candidate.interests.add(music)
+
+    def test_leaderboard_query_count_is_constant(self):
+        self.add_profiles(3)
+        small = self.count_queries('/api/leaderboard/')
+        self.add_profiles(6, offset=3)
+        self.assertEqual(self.count_queries('/api/leaderboard/'), small)
+
+    def test_suggestions_query_count_is_constant(self):
+        self.add_profiles(3)
+        small = self.count_queries('/api/suggested/')
+        self.add_profiles(6, offset=3)
+        self.assertEqual(self.count_queries('/api/suggested/'), small)
+
+    def test_smart_snippet_matches_single_serialization(self):
+        self.add_profiles(2)
+        User.objects.filter(username__startswith='candidate').update(
+            date_joined=timezone.now() - timedelta(days=5)
+        )
+        listed = self.client.get('/api/leaderboard/').data
+        for item in listed:
+            if item['id'] == self.profile.id:
+                continue
+            single = ProfileSerializer(
+                Profile.objects.get(pk=item['id']), context={'request': self._request()}
+            ).data
+            self.assertEqual(item['smart_snippet'], single['smart_snippet'])
+            self.assertEqual(item['smart_snippet'], 'Both into Music')
+
+
+class SparseFieldsTests(APITestCase):
+    """Test ?fields= trimming on list endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sparse', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='sparse', fcm_token='secret')
+        other = User.objects.create_user(username='sparse2', password='pass123')
+        self.other = Profile.objects.create(user=other, username='sparse2')
+        Post.objects.create(author=self.other, content_text='Card me')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_named_card_view(self):
+        response = self.client.get('/api/leaderboard/?fields=card')
+        self.assertEqual(set(response.data[0]), set(ProfileSerializer.Meta.field_views['card']))
+        self.assertNotIn('fcm_token', response.data[0])
+
+    def test_explicit_field_list_skips_bulk_loads(self):
+        self.client.get('/api/leaderboard/')
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/api/leaderboard/')
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get('/api/leaderboard/?fields=id,username,bogus')
+        self.assertEqual(set(response.data[0]), {'id', 'username'})
+        self.assertEqual(len(sparse.captured_queries), 1)
+        self.assertLess(len(sparse.captured_queries), len(full.captured_queries))
+
+    def test_feed_card_and_default_full(self):
+        card = self.client.get('/api/feed/?fields=card').data['results'][0]
+        self.assertNotIn('contributors', card)
+        self.assertIn('likes_count', card)
+        full = self.client.get('/api/feed/').data['results'][0]
+        self.assertIn('contributors', full)
+
+
+class FastSerializationTests(APITestCase):
+    """Snapshot tests: the RowPlan path and FastJSONRenderer must match DRF byte for byte."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='fast', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='fast', profile_picture='avatars/f.jpg')
+        other = User.objects.create_user(username='fast2', password='pass123')
+        self.other = Profile.objects.create(user=other, username='fäst\u2028two')
+        post = Post.objects.create(author=self.other, content_text='Snap 📸 "quoted"', image='posts/a.jpg')
+        post.contributors.add(self.profile)
+        Post.objects.create(author=self.profile, content_text='Plain', post_type='TEXT')
+        Like.objects.create(user=self.profile, post=post)
+        for i in range(3):
+            ChatMessage.objects.create(sender=self.other, receiver=self.profile, content=f'hi {i}', image='chat_images/c.jpg')
+            ChatMessage.objects.create(sender=self.profile, receiver=self.other, content=f'yo {i} ñ')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_both(self, url):
+        self.client.get(url)  # settle read receipts before comparing
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get(url)
+        with override_settings(FAST_SERIALIZATION=True):
+            fast = self.client.get(url)
+        self.assertEqual(slow.status_code, status.HTTP_200_OK)
+        return slow.content, fast.content
+
+    def test_feed_output_is_identical(self):
+        for url in ('/api/feed/', '/api/feed/?fields=card', '/api/feed/trending/'):
+            slow, fast = self.get_both(url)
+            self.assertEqual(slow, fast, url)
+        self.assertIn(b'http://testserver/media/posts/a.jpg', fast)
+
+    def test_chat_output_is_identical(self):
+        slow, fast = self.get_both(f'/api/chat/{self.other.id}/')
+        self.assertEqual(slow, fast)
+        self.assertIn(b'"/media/chat_images/c.jpg"', fast)
+
+    def test_plans_compile_for_hot_serializers(self):
+        plan = RowPlan.for_serializer(ChatMessageSerializer())
+        self.assertIn('sender__username', plan.columns)
+        # Method fields, m2m pks and nested serializers need instances
+        self.assertIsNone(RowPlan.for_serializer(PostSerializer()))
+        self.assertIsNone(RowPlan.for_serializer(ProfileSerializer()))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'when': timezone.now(),
+            'day': timezone.now().date(),
+            'amount': Decimal('1.50'),
+            'text': 'line\u2028sep\u2029 é 📸',
+            'nested': [1, 2.5, None, True, {'a': []}],
+            5: 'int key',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2')
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_renderer_matches_json_renderer_for_exponent_floats(self):
+        for value in (1e16, 1.5e-7, -2.5e300):
+            data = {'nested': [{'x': value}], 'y': 0.0}
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'x': [value]})
+
+
+class ProfileCardTests(APITestCase):
+    """Test the write-through profile card cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='viewer')
+        self.others = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'card{i}', password='pass123')
+            self.others.append(Profile.objects.create(
+                user=user, username=f'card{i}', profile_picture=f'avatars/{i}.jpg' if i else ''
+            ))
+        Connection.objects.create(sender=self.profile, receiver=self.others[0], status='PENDING')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_cards_match_serializer_output(self):
+        response = self.client.get('/api/leaderboard/?fields=card')
+        request = SimpleNamespace(user=self.user, build_absolute_uri=lambda url: f'http://testserver{url}')
+        profiles = Profile.objects.order_by('-social_gravity')[:10]
+        expected = ProfileSerializer(profiles, many=True, context={'request': request}, fields='card').data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+        statuses = {card['id']: card['connection_status'] for card in response.data}
+        self.assertEqual(statuses[self.others[0].id], 'PENDING')
+
+    def test_repeat_render_skips_profile_queries(self):
+        self.client.get('/api/leaderboard/?fields=card')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/leaderboard/?fields=card')
+        # Leaderboard ids and the viewer's connection statuses; no profile rows
+        self.assertEqual(len(queries.captured_queries), 2)
+
+    def test_save_writes_through_and_partial_save_invalidates(self):
+        key = ProfileCardService.cache_key(self.others[1].id)
+        profile = Profile.objects.get(pk=self.others[1].id)
+        profile.username = 'renamed'
+        profile.save()
+        self.assertEqual(cache.get(key)['username'], 'renamed')
+        profile.refresh_gravity()
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(ProfileCardService.get_cards([profile.id])[profile.id]['username'], 'renamed')
+
+    def test_presence_heartbeat_refreshes_last_active_on_the_card(self):
+        pid = self.others[1].id
+        Profile.objects.filter(pk=pid).update(last_active=timezone.now() - timedelta(hours=1))
+        stale = ProfileCardService.get_cards([pid])[pid]['last_active']
+        PresenceService.heartbeat(pid, write_last_active=True)
+        self.assertGreater(ProfileCardService.get_cards([pid])[pid]['last_active'], stale)
+
+    def test_comment_authors_come_from_cards(self):
+        post = Post.objects.create(author=self.profile, content_text='Cards')
+        for other in self.others:
+            Comment.objects.create(user=other, post=post, content='hello')
+        listed = self.client.get(f'/api/posts/{post.id}/comments/').data
+        request = SimpleNamespace(user=self.user, build_absolute_uri=lambda url: f'http://testserver{url}')
+        for item in listed:
+            single = CommentSerializer(Comment.objects.get(pk=item['id']), context={'request': request}).data
+            self.assertEqual(item['author_name'], single['author_name'])
+            self.assertEqual(item['author_pic'], single['author_pic'])
+
+
+class MessageBatchingTests(TransactionTestCase):
+    """Test batched persistence of WebSocket chat messages."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.sender = Profile.objects.create(
+            user=User.objects.create_user(username='batcher', password='pass123'), username='batcher'
+        )
+        self.receiver = Profile.objects.create(
+            user=User.objects.create_user(username='batchee', password='pass123'), username='batchee'
+        )
+
+    def test_persist_messages_bulk_inserts_batch(self):
+        items = [(self.sender, self.receiver, 'one'), (self.sender, self.receiver, 'x' * 60)]
+        with CaptureQueriesContext(connection) as queries:
+            results = persist_messages(items)
+        self.assertEqual([r['content'] for r in results], ['one', 'x' * 60])
+        self.assertEqual(results[0]['sender_name'], 'batcher')
+        self.assertEqual(ChatMessage.objects.filter(expires_at__isnull=False).count(), 2)
+        # Both messages coalesce into one notification carrying the latest preview
+        notification = Notification.objects.get()
+        self.assertEqual((notification.count, notification.title), (2, '2 new messages from batcher'))
+        self.assertTrue(notification.body.endswith('...'))
+        # Cold blocklist lookup, message insert, unread-notification lookup and
+        # insert, its push outbox row, the receiver's badge counters, the
+        # pair's summary (created on first contact), then the post-commit badge
+        # push, which rebuilds the receiver's counters row on first use
+        statements = [q['sql'].split()[0] for q in queries.captured_queries]
+        self.assertEqual(
+            [s for s in statements if s in ('SELECT', 'INSERT', 'UPDATE')],
+            ['SELECT', 'INSERT', 'SELECT', 'INSERT', 'INSERT', 'UPDATE', 'UPDATE', 'UPDATE', 'INSERT',
+             'SELECT', 'SELECT', 'SELECT', 'SELECT', 'SELECT', 'INSERT']
+        )
+
+    def test_persist_messages_skips_blocked_and_deleted_receivers(self):
+        self.assertEqual(persist_messages([(self.sender, self.receiver, 'warm')])[0]['content'], 'warm')
+        gone = Profile.objects.create(user=User.objects.create_user(username='gone', password='pass123'), username='gone')
+        gone_id = gone.id
+        gone.delete()
+        # As if another process still had the deleted receiver cached
+        gone.id = gone_id
+        PartnerService._profiles.set(gone_id, gone)
+        Connection.objects.create(sender=self.receiver, receiver=self.sender, status='BLOCKED')
+        results = persist_messages([(self.sender, self.receiver, 'hi'), (self.sender, gone, 'hello?')])
+        self.assertEqual(results, [BLOCKED, NOT_FOUND])
+        self.assertIsNone(PartnerService._profiles.get(gone_id))
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    async def test_full_buffer_raises_backpressure(self):
+        batcher = MessageBatcher(window=0.01, max_batch=10, max_pending=2)
+        tasks = [asyncio.create_task(batcher.submit(self.sender, self.receiver, f'm{i}')) for i in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertIsInstance(results[2], BatcherFull)
+        self.assertEqual([r['content'] for r in results[:2]], ['m0', 'm1'])
+        self.assertEqual(await ChatMessage.objects.acount(), 2)
+
+    async def test_consumer_acks_after_batch_commit(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{self.sender.id}/')
+        communicator.scope['user'] = await User.objects.aget(username='batcher')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for text in ('hello', 'again'):
+            await communicator.send_json_to({'type': 'chat_message', 'receiver_id': self.receiver.id, 'content': text})
+        acks = [await communicator.receive_json_from(timeout=5) for _ in range(2)]
+        await communicator.disconnect()
+        self.assertEqual([a['type'] for a in acks], ['message_sent', 'message_sent'])
+        self.assertEqual(await ChatMessage.objects.filter(sender=self.sender).acount(), 2)
+
+
+class ChatPartnerCacheTests(APITestCase):
+    """Test receiver caching and block checks on chat sends."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.user = User.objects.create_user(username='texter', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='texter')
+        self.other = Profile.objects.create(
+            user=User.objects.create_user(username='textee', password='pass123'), username='textee'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_repeat_sends_skip_receiver_lookup(self):
+        url = f'/api/chat/{self.other.id}/send/'
+        self.client.post(url, {'content': 'first'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'content': 'second'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['receiver_name'], 'textee')
+        # The only read is the notification coalescer's, run after the response
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertIn('FROM "core_notification"', selects[0])
+
+    def test_send_to_blocker_is_refused(self):
+        Connection.objects.create(sender=self.other, receiver=self.profile, status='BLOCKED')
+        response = self.client.post(f'/api/chat/{self.other.id}/send/', {'content': 'hey'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_profile_save_drops_cached_partner(self):
+        PartnerService.get_partner(self.other.id)
+        self.other.username = 'renamed'
+        self.other.save()
+        self.assertEqual(PartnerService.get_partner(self.other.id).username, 'renamed')
+
+
+class ConversationInboxTests(APITestCase):
+    """Test the maintained Conversation summaries behind the chat inbox."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.user = User.objects.create_user(username='inbox', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='inbox')
+        self.partners = [
+            Profile.objects.create(user=User.objects.create_user(username=f'pal{i}', password='pass123'), username=f'pal{i}')
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def send(self, sender, receiver, content):
+        self.client.force_authenticate(user=sender.user)
+        self.client.post(f'/api/chat/{receiver.id}/send/', {'content': content})
+        self.client.force_authenticate(user=self.user)
+
+    def test_inbox_orders_by_activity_with_per_side_unread(self):
+        self.send(self.profile, self.partners[0], 'hi pal0')
+        self.send(self.partners[1], self.profile, 'from pal1')
+        self.send(self.partners[1], self.profile, 'again pal1')
+        self.send(self.partners[0], self.profile, 'reply pal0')
+
+        inbox = self.client.get('/api/chat/conversations/').data
+        self.assertEqual([c['partner_name'] for c in inbox], ['pal0', 'pal1'])
+        self.assertEqual(inbox[0]['last_message'], 'reply pal0')
+        self.assertEqual([c['unread_count'] for c in inbox], [1, 2])
+
+        self.client.force_authenticate(user=self.partners[0].user)
+        theirs = self.client.get('/api/chat/conversations/').data
+        self.assertEqual(theirs[0]['unread_count'], 1)
+
+    def test_reading_a_chat_clears_only_my_side(self):
+        self.send(self.partners[0], self.profile, 'read me')
+        self.send(self.profile, self.partners[0], 'unread by pal0')
+        self.client.get(f'/api/chat/{self.partners[0].id}/')
+        conversation = Conversation.objects.get()
+        mine, theirs = ('unread_a', 'unread_b') if self.profile.id < self.partners[0].id else ('unread_b', 'unread_a')
+        self.assertEqual(getattr(conversation, mine), 0)
+        self.assertEqual(getattr(conversation, theirs), 1)
+
+    def test_paginated_inbox_is_one_query(self):
+        for partner in self.partners:
+            self.send(partner, self.profile, f'hello from {partner.username}')
+        self.client.get('/api/chat/conversations/?page=1')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/chat/conversations/?page=1')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertFalse(response.data['has_next'])
+        self.assertEqual(len(queries.captured_queries), 1)
+
+    def test_batched_sends_update_summary(self):
+        persist_messages([(self.partners[2], self.profile, 'one'), (self.partners[2], self.profile, 'two')])
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_preview, 'two')
+        self.assertEqual(conversation.unread_a + conversation.unread_b, 2)
+
+
+class ChatMigrationTests(TransactionTestCase):
+    """Test the Conversation backfill and the is_read -> read watermark migration."""
+
+    before = [('core', '0015_chat_sync')]
+    after = [('core', '0016_read_watermarks')]
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_read_flags_become_watermarks(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old_apps = executor.loader.project_state(self.before).apps
+        OldUser, OldProfile = old_apps.get_model('auth', 'User'), old_apps.get_model('core', 'Profile')
+        OldMessage = old_apps.get_model('core', 'ChatMessage')
+        me, pal0, pal1 = [
+            OldProfile.objects.create(user=OldUser.objects.create(username=name), username=name)
+            for name in ('inbox', 'pal0', 'pal1')
+        ]
+        OldMessage.objects.create(sender=me, receiver=pal0, content='old one')
+        OldMessage.objects.create(sender=pal0, receiver=me, content='old two')
+        skipped = OldMessage.objects.create(sender=pal1, receiver=me, content='skipped')
+        read = OldMessage.objects.create(sender=pal1, receiver=me, content='read', is_read=True)
+        importlib.import_module('core.migrations.0014_conversation').backfill_conversations(old_apps, None)
+
+        OldConversation = old_apps.get_model('core', 'Conversation')
+        summaries = [
+            (c.participant_b.username, c.last_message_preview, c.unread_a)
+            for c in OldConversation.objects.filter(participant_a=me).order_by('-last_timestamp')
+        ]
+        self.assertEqual(summaries, [('pal1', 'read', 1), ('pal0', 'old two', 1)])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        # The watermark covers the message read out of order too
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(username='inbox'))
+        inbox = client.get('/api/chat/conversations/').data
+        self.assertEqual([c['partner_name'] for c in inbox], ['pal1', 'pal0'])
+        self.assertEqual([c['unread_count'] for c in inbox], [0, 1])
+        states = dict(ChatMessage.objects.with_read_state().values_list('id', 'is_read'))
+        self.assertTrue(states[read.id] and states[skipped.id])
+        self.assertEqual(sum(states.values()), 2)
+
+
+class ChatHistoryCursorTests(APITestCase):
+    """Test before_id/after_id cursors on chat history."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='history', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='history')
+        self.other = Profile.objects.create(
+            user=User.objects.create_user(username='historian', password='pass123'), username='historian'
+        )
+        messages = []
+        for i in range(45):
+            sender, receiver = (self.other, self.profile) if i % 2 else (self.profile, self.other)
+            messages.append(ChatMessage.objects.create(sender=sender, receiver=receiver, content=f'm{i}'))
+        ConversationService.record_messages(messages)
+        self.ids = [m.id for m in messages]
+        self.url = f'/api/chat/{self.other.id}/'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_walk_back_through_history(self):
+        seen = []
+        data = self.client.get(self.url).data
+        while True:
+            seen = [m['id'] for m in data['results']] + seen
+            if not data['has_next']:
+                break
+            data = self.client.get(f"{self.url}?before_id={data['oldest_id']}").data
+        self.assertEqual(seen, self.ids)
+
+    def test_after_id_returns_delta(self):
+        data = self.client.get(f'{self.url}?after_id={self.ids[40]}').data
+        self.assertEqual([m['id'] for m in data['results']], self.ids[41:])
+        self.assertFalse(data['has_next'])
+        data = self.client.get(f'{self.url}?after_id={self.ids[0]}').data
+        self.assertEqual([m['id'] for m in data['results']], self.ids[1:21])
+        self.assertTrue(data['has_next'])
+
+    def test_reading_moves_watermark_in_one_update(self):
+        self.assertFalse(ChatMessage.objects.with_read_state().filter(is_read=True).exists())
+        self.assertEqual(self.client.get('/api/chat/conversations/').data[0]['unread_count'], 22)
+
+        with CaptureQueriesContext(connection) as queries:
+            latest = self.client.get(self.url).data['results']
+        self.assertTrue(all(m['is_read'] for m in latest if m['sender'] == self.other.id))
+        # One UPDATE for the watermark, one for the reader's unread badge
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('"core_conversation"', updates[0])
+        self.assertIn('"core_unreadcounts"', updates[1])
+
+        # Everything up to the newest message shown is read, including unshown older ones
+        self.assertEqual(self.client.get('/api/chat/conversations/').data[0]['unread_count'], 0)
+        older = self.client.get(f'{self.url}?before_id={self.ids[25]}').data['results']
+        self.assertTrue(all(m['is_read'] for m in older if m['sender'] == self.other.id))
+        # Watermarks never move backwards
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id, up_to=self.ids[1]), 0)
+
+    def test_partial_mark_read_counts_from_watermark(self):
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id, up_to=self.ids[9]), 5)
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id), 22 - 5)
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id), 0)
+
+    def test_mark_read_stops_at_newest_message(self):
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id, up_to=10**9), 22)
+        pair = ConversationService.pair(self.profile.id, self.other.id)
+        conversation = Conversation.objects.get(participant_a_id=pair[0], participant_b_id=pair[1])
+        self.assertEqual(getattr(conversation, ConversationService.read_field(pair, self.profile.id)), self.ids[-1])
+        # Messages sent afterwards are still unread, and reading them clears the count
+        later = ChatMessage.objects.create(sender=self.other, receiver=self.profile, content='later')
+        ConversationService.record_messages([later])
+        self.assertFalse(ChatMessage.objects.with_read_state().get(pk=later.pk).is_read)
+        self.assertEqual(ConversationService.mark_read(self.profile.id, self.other.id, up_to=10**9), 1)
+        self.assertEqual(BadgeService.counts(self.profile.id)['messages'], 0)
+
+    def test_cursor_pages_avoid_offset(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{self.url}?before_id={self.ids[30]}')
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('LIMIT 21', sql)
+
+    def test_fast_and_serializer_paths_agree(self):
+        url = f'{self.url}?before_id={self.ids[30]}'
+        self.client.get(url)
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get(url).content
+        self.assertEqual(self.client.get(url).content, slow)
+
+
+class ReconnectSyncTests(TransactionTestCase):
+    """Test the WebSocket `sync` catch-up protocol."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.me = Profile.objects.create(user=User.objects.create_user(username='syncer', password='pass123'), username='syncer')
+        self.pal = Profile.objects.create(user=User.objects.create_user(username='synced', password='pass123'), username='synced')
+        messages = [
+            ChatMessage.objects.create(sender=self.pal if i % 2 else self.me, receiver=self.me if i % 2 else self.pal, content=f's{i}')
+            for i in range(5)
+        ]
+        ConversationService.record_messages(messages)
+        self.message_ids = [m.id for m in messages]
+        self.notification_ids = [
+            Notification.objects.create(recipient=self.me, notification_type='MESSAGE', title=f'n{i}', body='').id
+            for i in range(3)
+        ]
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{self.me.id}/')
+        communicator.scope['user'] = await User.objects.aget(username='syncer')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_sync_streams_batches_on_demand(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'sync_continue'})
+        self.assertEqual((await communicator.receive_json_from())['error'], 'No sync in progress')
+
+        await communicator.send_json_to({
+            'type': 'sync', 'last_message_id': self.message_ids[1],
+            'last_notification_id': self.notification_ids[0], 'batch_size': 2,
+        })
+        first = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(first['type'], 'sync_batch')
+        self.assertEqual([m['id'] for m in first['messages']], self.message_ids[2:4])
+        self.assertEqual([n['id'] for n in first['notifications']], self.notification_ids[1:3])
+        self.assertEqual(first['read_receipts'], [{'partner_id': self.pal.id, 'unread_by_partner': 3, 'read_up_to': 0}])
+        self.assertTrue(first['has_more'])
+        # Flow control: nothing more arrives until the client asks
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+
+        await communicator.send_json_to({'type': 'sync_continue'})
+        second = await communicator.receive_json_from(timeout=5)
+        self.assertEqual([m['id'] for m in second['messages']], self.message_ids[4:])
+        self.assertEqual(second['notifications'], [])
+        self.assertEqual(second['read_receipts'], [])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(second['last_message_id'], self.message_ids[-1])
+        await communicator.disconnect()
+
+
+    async def test_mark_read_rejects_bad_ids(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'mark_read', 'sender_id': self.pal.id, 'up_to': 'latest'})
+        self.assertEqual((await communicator.receive_json_from())['error'], 'Invalid mark_read')
+        await communicator.send_json_to({'type': 'mark_read', 'sender_id': str(self.pal.id)})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'messages_read', 'sender_id': self.pal.id, 'count': 2})
+        await communicator.disconnect()
+
+
+class PresenceTests(TransactionTestCase):
+    """Test the online set, presence fan-out and typing throttling."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.me = Profile.objects.create(user=User.objects.create_user(username='present', password='pass123'), username='present')
+        self.pal = Profile.objects.create(user=User.objects.create_user(username='watcher', password='pass123'), username='watcher')
+        Connection.objects.create(sender=self.me, receiver=self.pal, status='CONNECTED')
+        # Long idle by last_active, so only the online set can make them active
+        Profile.objects.update(last_active=timezone.now() - timedelta(hours=1))
+
+    async def connect(self, profile):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{profile.id}/')
+        communicator.scope['user'] = await User.objects.aget(username=profile.username)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_online_set_drives_is_active(self):
+        self.assertFalse(ProfileSerializer(Profile.objects.get(id=self.me.id)).data['is_active'])
+        self.assertTrue(PresenceService.connect(self.me.id))
+        self.assertFalse(PresenceService.connect(self.me.id))  # second device
+        self.assertEqual(PresenceService.online_ids([self.me.id, self.pal.id]), {self.me.id})
+
+        self.assertTrue(ProfileSerializer(Profile.objects.get(id=self.me.id)).data['is_active'])
+        many = ProfileSerializer(Profile.objects.order_by('id'), many=True, fields='card').data
+        self.assertEqual([p['is_active'] for p in many], [True, False])
+        cards = ProfileSerializer.render_cards([self.me.id, self.pal.id], {})
+        self.assertEqual([c['is_active'] for c in cards], [True, False])
+
+        # Offline only once the last socket closes
+        self.assertFalse(PresenceService.disconnect(self.me.id))
+        self.assertTrue(PresenceService.disconnect(self.me.id))
+        self.assertEqual(PresenceService.online_ids([self.me.id]), set())
+
+    async def test_presence_is_pushed_to_online_friends(self):
+        watcher = await self.connect(self.pal)
+        me = await self.connect(self.me)
+        self.assertEqual(await watcher.receive_json_from(), {'type': 'presence', 'profile_id': self.me.id, 'online': True})
+        # Heartbeats within the interval are folded away
+        await me.send_json_to({'type': 'heartbeat'})
+        self.assertTrue(await watcher.receive_nothing(timeout=0.1))
+
+        await me.disconnect()
+        self.assertEqual(await watcher.receive_json_from(), {'type': 'presence', 'profile_id': self.me.id, 'online': False})
+        await watcher.disconnect()
+
+    async def test_quiet_sockets_stay_online(self):
+        with mock.patch('core.services.PRESENCE_TTL', 1), mock.patch('core.consumers.PRESENCE_HEARTBEAT_INTERVAL', 0.2):
+            phone = await self.connect(self.me)
+            laptop = await self.connect(self.me)
+            # Well past the TTL without a single client frame
+            await asyncio.sleep(1.5)
+            self.assertEqual(PresenceService.online_ids([self.me.id]), {self.me.id})
+            await phone.disconnect()
+            # The other device still counts
+            self.assertEqual(PresenceService.online_ids([self.me.id]), {self.me.id})
+            await laptop.disconnect()
+            self.assertEqual(PresenceService.online_ids([self.me.id]), set())
+
+    async def test_typing_is_throttled_per_receiver(self):
+        watcher = await self.connect(self.pal)
+        me = await self.connect(self.me)
+        await watcher.receive_json_from()  # presence
+        for _ in range(10):
+            await me.send_json_to({'type': 'typing', 'receiver_id': self.pal.id})
+        event = await watcher.receive_json_from()
+        self.assertEqual(event, {'type': 'typing', 'sender_id': self.me.id, 'sender_name': 'present'})
+        self.assertTrue(await watcher.receive_nothing(timeout=0.2))
+        await me.disconnect()
+        await watcher.disconnect()
+
+
+class CachedAuthenticationTests(APITestCase):
+    """Test that JWT requests resolve the user and profile once per token."""
+
+    def setUp(self):
+        _users.clear()
+        self.user = User.objects.create_user(username='tokened', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='tokened')
+        self.token = str(AccessToken.for_user(self.user))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def user_lookups(self, queries):
+        return [q['sql'] for q in queries if 'FROM "auth_user"' in q['sql']]
+
+    def test_repeat_requests_skip_user_and_profile_queries(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get('/api/notifications/').status_code, 200)
+        lookups = self.user_lookups(first.captured_queries)
+        # One query for the user with its profile joined; views reuse request.user.profile
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('"core_profile"', lookups[0])
+        self.assertFalse([q for q in first.captured_queries if q['sql'].startswith('SELECT') and 'FROM "core_profile" WHERE "core_profile"."user_id"' in q['sql']])
+
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get('/api/notifications/').status_code, 200)
+        self.assertEqual(self.user_lookups(second.captured_queries), [])
+
+    def test_profile_update_keeps_changes_made_since_caching(self):
+        self.client.get('/api/notifications/')
+        # Another process changes the row while this one holds the cached profile
+        Profile.objects.filter(pk=self.profile.pk).update(posts_count=7, fcm_token='device-2')
+        response = self.client.put('/api/profile/update/', {'age': 30}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['posts_count'], 7)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.age, self.profile.posts_count, self.profile.fcm_token), (30, 7, 'device-2'))
+
+    def test_profile_changes_are_seen_on_next_request(self):
+        self.client.get('/api/notifications/')
+        self.client.post('/api/notifications/register-device/', {'fcm_token': 'device-1'}, format='json')
+        with CaptureQueriesContext(connection) as reload:
+            self.client.get('/api/notifications/')
+        self.assertEqual(len(self.user_lookups(reload.captured_queries)), 1)
+        user = user_from_token(self.token)
+        self.assertEqual(user.profile.fcm_token, 'device-1')
+
+    def test_websocket_token_resolution(self):
+        user = user_from_token(self.token)
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.id, self.profile.id)
+        self.assertTrue(user_from_token('not-a-token').is_anonymous)
+
+
+class DeliveryTests(TransactionTestCase):
+    """Test per-device groups, multi-device delivery and post groups."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.me = Profile.objects.create(user=User.objects.create_user(username='multi', password='pass123'), username='multi')
+        self.pal = Profile.objects.create(user=User.objects.create_user(username='single', password='pass123'), username='single')
+        self.stranger = Profile.objects.create(user=User.objects.create_user(username='outsider', password='pass123'), username='outsider')
+        self.post = Post.objects.create(author=self.me, content_text='together', is_collaborative=True)
+        self.post.contributors.add(self.pal)
+
+    async def connect(self, profile, device=None):
+        path = f'/ws/chat/{profile.id}/' + (f'?device={device}' if device else '')
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path)
+        communicator.scope['user'] = await User.objects.aget(username=profile.username)
+        communicator.scope['query_string'] = f'device={device}'.encode() if device else b''
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_messages_reach_receiver_and_senders_other_devices(self):
+        phone = await self.connect(self.me, 'phone')
+        laptop = await self.connect(self.me, 'laptop')
+        pal = await self.connect(self.pal)
+        self.assertEqual(PresenceService.devices(self.me.id), ['laptop', 'phone'])
+
+        await phone.send_json_to({'type': 'chat_message', 'receiver_id': self.pal.id, 'content': 'hi'})
+        sent = await phone.receive_json_from(timeout=5)
+        self.assertEqual(sent['type'], 'message_sent')
+        # The receiver's unread badges are pushed as the batch commits
+        received = await pal.receive_json_from(timeout=5)
+        while received['type'] == 'badges':
+            received = await pal.receive_json_from(timeout=5)
+        self.assertEqual(received['message']['id'], sent['message']['id'])
+        self.assertEqual((await laptop.receive_json_from(timeout=5))['message']['id'], sent['message']['id'])
+        self.assertTrue(await phone.receive_nothing(timeout=0.2))
+
+        # Device routing
+        await deliver_to_device(self.me.id, 'laptop', {'type': 'chat.presence', 'profile_id': 0, 'online': True})
+        self.assertEqual((await laptop.receive_json_from())['profile_id'], 0)
+        self.assertTrue(await phone.receive_nothing(timeout=0.1))
+
+        await phone.disconnect()
+        self.assertEqual(PresenceService.devices(self.me.id), ['laptop'])
+        for communicator in (laptop, pal):
+            await communicator.disconnect()
+
+    async def test_idle_receiver_past_presence_ttl_still_gets_messages(self):
+        # No client frames and no server heartbeat before the presence keys lapse
+        with mock.patch('core.services.PRESENCE_TTL', 1), mock.patch('core.consumers.PRESENCE_HEARTBEAT_INTERVAL', 60):
+            me = await self.connect(self.me)
+            pal = await self.connect(self.pal)
+            await asyncio.sleep(1.5)
+            self.assertEqual(PresenceService.online_ids([self.pal.id]), set())
+
+            await me.send_json_to({'type': 'chat_message', 'receiver_id': self.pal.id, 'content': 'still there?'})
+            sent = await me.receive_json_from(timeout=5)
+            received = await pal.receive_json_from(timeout=5)
+            while received['type'] == 'badges':
+                received = await pal.receive_json_from(timeout=5)
+            self.assertEqual(received['message']['id'], sent['message']['id'])
+            for communicator in (me, pal):
+                await communicator.disconnect()
+
+    async def test_post_followers_share_one_group(self):
+        author = await self.connect(self.me)
+        contributor = await self.connect(self.pal)
+        outsider = await self.connect(self.stranger)
+        for communicator in (author, contributor, outsider):
+            await communicator.send_json_to({'type': 'subscribe_post', 'post_id': self.post.id})
+        self.assertEqual((await author.receive_json_from())['type'], 'subscribed')
+        self.assertEqual((await contributor.receive_json_from())['type'], 'subscribed')
+        self.assertEqual((await outsider.receive_json_from())['error'], 'Post not found')
+
+        await deliver_to_post(self.post.id, {'type': 'post.updated', 'post_id': self.post.id, 'contributor_id': self.pal.id})
+        for communicator in (author, contributor):
+            self.assertEqual(await communicator.receive_json_from(), {
+                'type': 'post_updated', 'post_id': self.post.id, 'contributor_id': self.pal.id,
+            })
+        self.assertTrue(await outsider.receive_nothing(timeout=0.1))
+        for communicator in (author, contributor, outsider):
+            await communicator.disconnect()
+
+
+class DatabaseExecutorTests(TestCase):
+    """Test the configurable pool for synchronous DB calls from async code."""
+
+    def blocking_call(self):
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    async def run_pair(self):
+        started = asyncio.get_running_loop().time()
+        names = await asyncio.gather(db_sync_to_async(self.blocking_call)(), db_sync_to_async(self.blocking_call)())
+        return names, asyncio.get_running_loop().time() - started
+
+    @override_settings(CHAT_DB_THREADS=2)
+    async def test_pool_runs_calls_concurrently(self):
+        names, elapsed = await self.run_pair()
+        self.assertTrue(all(name.startswith('chat-db') for name in names))
+        self.assertLess(elapsed, 0.35)
+
+    @override_settings(CHAT_DB_THREADS=0)
+    async def test_zero_threads_keeps_thread_sensitive_mode(self):
+        names, elapsed = await self.run_pair()
+        self.assertFalse(any(name.startswith('chat-db') for name in names))
+        self.assertGreaterEqual(elapsed, 0.4)
+
+
+class ChatRetentionTests(TestCase):
+    """Test expired chat message purging and partition bounds."""
+
+    def setUp(self):
+        users = [User.objects.create_user(username=f'retain{i}', password='pass123') for i in range(2)]
+        self.a, self.b = [Profile.objects.create(user=u, username=u.username) for u in users]
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+
+    def message(self, expires_at, image=''):
+        if image:
+            path = os.path.join(self.media.name, image)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'img')
+        return ChatMessage.objects.create(sender=self.a, receiver=self.b, content='x', image=image, expires_at=expires_at)
+
+    def test_cleanup_purges_expired_messages_in_chunks_with_media(self):
+        now = timezone.now()
+        for i in range(5):
+            self.message(now - timedelta(hours=i + 1), image=f'chat_images/old{i}.jpg' if i < 2 else '')
+        kept = self.message(now + timedelta(days=1), image='chat_images/new.jpg')
+        out = io.StringIO()
+        with override_settings(MEDIA_ROOT=self.media.name):
+            with CaptureQueriesContext(connection) as queries:
+                call_command('cleanup_data', batch_size=2, pause_ms=0, stdout=out)
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(os.listdir(os.path.join(self.media.name, 'chat_images')), ['new.jpg'])
+        self.assertEqual(sum('DELETE FROM "core_chatmessage"' in q['sql'] for q in queries.captured_queries), 3)
+        self.assertIn('chat_messages: 5 rows and 2 media files removed in 3 batches', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_purge_releases_unread_counts_and_preview(self):
+        now = timezone.now()
+        old = [self.message(now - timedelta(hours=1)) for _ in range(3)]
+        ConversationService.record_messages(old)
+        ConversationService.mark_read(self.b.id, self.a.id, up_to=old[0].id)
+        self.assertEqual(BadgeService.counts(self.b.id)['messages'], 2)
+        call_command('cleanup_data', pause_ms=0, stdout=io.StringIO())
+
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.unread_a, conversation.unread_b), (0, 0))
+        self.assertEqual(conversation.last_message_preview, '')
+        self.assertEqual(BadgeService.counts(self.b.id)['messages'], 0)
+        # New messages are counted from zero again
+        fresh = self.message(now + timedelta(days=1))
+        ConversationService.record_messages([fresh])
+        self.assertEqual(ConversationService.mark_read(self.b.id, self.a.id), 1)
+        self.assertEqual(BadgeService.counts(self.b.id)['messages'], 0)
+
+    def test_new_messages_default_to_seven_day_expiry(self):
+        ChatMessage.objects.bulk_create([ChatMessage(sender=self.a, receiver=self.b, content='bulk')])
+        expires_at = ChatMessage.objects.get().expires_at
+        self.assertAlmostEqual(expires_at, timezone.now() + timedelta(days=7), delta=timedelta(minutes=1))
+
+    def test_partition_bounds_are_aligned(self):
+        self.assertEqual(partition_bounds(date(2026, 10, 19), days=1), (date(2026, 10, 19), date(2026, 10, 20)))
+        # Weekly partitions start on Mondays, whatever day they are asked for
+        self.assertEqual(partition_bounds(date(2026, 10, 22), days=7), (date(2026, 10, 19), date(2026, 10, 26)))
+        self.assertEqual(partition_name(date(2026, 10, 19)), 'core_chatmessage_p20261019')
+
+
+class RetentionEngineTests(TestCase):
+    """Test the batched, checkpointed retention policies behind cleanup_data."""
+
+    def setUp(self):
+        cache.clear()
+        users = [User.objects.create_user(username=f'keep{i}', password='pass123') for i in range(2)]
+        self.a, self.b = [Profile.objects.create(user=u, username=u.username) for u in users]
+        self.now = timezone.now()
+
+    def notifications(self, count, age_days):
+        Notification.objects.bulk_create([
+            Notification(recipient=self.a, notification_type='COMMENT', title='t', body='b') for _ in range(count)
+        ])
+        # created_at is auto_now_add, so age rows after inserting them
+        ids = Notification.objects.order_by('-id').values_list('id', flat=True)[:count]
+        Notification.objects.filter(id__in=list(ids)).update(created_at=self.now - timedelta(days=age_days))
+
+    def test_policies_cover_posts_notifications_and_recovery_requests(self):
+        expired = Post.objects.create(author=self.a, content_text='gone', expires_at=self.now - timedelta(hours=1))
+        Like.objects.create(user=self.b, post=expired)
+        live = Post.objects.create(author=self.a, content_text='live')
+        persistent = Post.objects.create(author=self.a, content_text='kept', post_type='PERSISTENT')
+        self.notifications(3, age_days=40)
+        self.notifications(2, age_days=1)
+        pending = RecoveryRequest.objects.create(profile=self.a, token='111111', expires_at=self.now - timedelta(hours=1))
+        old = RecoveryRequest.objects.create(profile=self.b, token='222222', expires_at=self.now)
+        RecoveryRequest.objects.filter(id=old.id).update(created_at=self.now - timedelta(days=31))
+
+        results = RetentionEngine(batch_size=2, pause_ms=0).run()
+
+        self.assertEqual(set(Post.objects.values_list('id', flat=True)), {live.id, persistent.id})
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(RecoveryRequest.objects.get().status, 'EXPIRED')
+        self.assertEqual(results['notifications']['rows'], 3)
+        self.assertEqual(results['notifications']['batches'], 2)
+        self.assertTrue(all(stats['complete'] for stats in results.values()))
+        self.assertFalse(RetentionCheckpoint.objects.exclude(last_pk=0).exists())
+        self.assertEqual(pending.id, RecoveryRequest.objects.get().id)
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        self.notifications(5, age_days=40)
+        first, second = Notification.objects.order_by('id').values_list('id', flat=True)[:2]
+        policy = NotificationPolicy()
+        original = NotificationPolicy.apply
+        calls = []
+
+        def crash_on_second_batch(self, batch):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('killed')
+            return original(self, batch)
+
+        with mock.patch.object(NotificationPolicy, 'apply', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                RetentionEngine(policies=[policy], batch_size=2, pause_ms=0).run()
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='notifications').last_pk, second)
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='__lock__').last_pk, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            results = RetentionEngine(policies=[policy], batch_size=2, pause_ms=0).run()
+        self.assertEqual(results['notifications']['rows'], 3)
+        self.assertFalse(Notification.objects.exists())
+        self.assertTrue(any(f'"id" > {second}' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='notifications').last_pk, 0)
+
+    def test_overlapping_run_is_skipped(self):
+        # Held by another process: the lock lives in the database, not the local cache
+        RetentionCheckpoint.objects.create(policy='__lock__', last_pk=1)
+        out = io.StringIO()
+        call_command('cleanup_data', stdout=out)
+        self.assertIn('Another cleanup run is in progress', out.getvalue())
+
+        # A lease older than a full run belonged to a run that died
+        RetentionCheckpoint.objects.filter(policy='__lock__').update(updated_at=self.now - timedelta(hours=1))
+        self.assertIsNotNone(RetentionEngine(policies=[]).run())
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='__lock__').last_pk, 0)
+
+    def test_run_stops_once_its_lease_is_taken_over(self):
+        self.notifications(5, age_days=40)
+        second = Notification.objects.order_by('id').values_list('id', flat=True)[1]
+        original = NotificationPolicy.apply
+
+        def taken_over_after_first_batch(self, batch):
+            deleted = original(self, batch)
+            # As if this run stalled past the lease and another run took the lock
+            RetentionCheckpoint.objects.filter(policy='__lock__').update(last_pk=42)
+            return deleted
+
+        with mock.patch.object(NotificationPolicy, 'apply', taken_over_after_first_batch):
+            results = RetentionEngine(policies=[NotificationPolicy()], batch_size=2, pause_ms=0).run()
+        self.assertEqual(results, {})
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='notifications').last_pk, second)
+        # The new holder's lease is left alone
+        self.assertEqual(RetentionCheckpoint.objects.get(policy='__lock__').last_pk, 42)
+
+    def test_time_budget_stops_between_batches(self):
+        self.notifications(5, age_days=40)
+        # Clock reads: deadline, policy start, first batch check, second batch check, policy end
+        clock = SimpleNamespace(monotonic=mock.Mock(side_effect=[0, 0, 0, 100, 100]), sleep=mock.Mock())
+        with mock.patch('core.retention.time', clock):
+            results = RetentionEngine(policies=[NotificationPolicy()], batch_size=2, pause_ms=0, max_seconds=10).run()
+        self.assertEqual(results['notifications']['rows'], 2)
+        self.assertFalse(results['notifications']['complete'])
+        self.assertEqual(Notification.objects.count(), 3)
+
+
 class PostTests(APITestCase):
     """Test post creation and interactions."""
     
@@ -199,6 +1449,280 @@ class NotificationTests(APITestCase):
         self.assertTrue(notif.is_read)
 
 
+class NotificationPaginationTests(APITestCase):
+    """Test cursor paging of the notification list."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='pager', password='pass123')
+        self.profile = Profile.objects.create(user=self.user, username='pager')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Notification.objects.bulk_create([
+            Notification(recipient=self.profile, notification_type='COMMENT', title='t', body=f'n{i}')
+            for i in range(25)
+        ])
+        # Pairs of rows share a timestamp, so the id has to break ties
+        base = timezone.now()
+        for i, pk in enumerate(Notification.objects.order_by('id').values_list('id', flat=True)):
+            Notification.objects.filter(pk=pk).update(created_at=base - timedelta(minutes=25 - i // 2))
+        self.expected = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_walks_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            url = '/api/notifications/?page_size=7' + (f'&cursor={cursor}' if cursor else '')
+            data = self.client.get(url).data
+            seen += [n['id'] for n in data['results']]
+            cursor = data['next_cursor']
+            self.assertEqual(data['has_next'], cursor is not None)
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_cursor_pages_avoid_offset(self):
+        cursor = self.client.get('/api/notifications/?page_size=10').data['next_cursor']
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(f'/api/notifications/?page_size=10&cursor={cursor}').data
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('LIMIT 11', sql)
+        self.assertEqual([n['id'] for n in data['results']], self.expected[10:20])
+
+    def test_page_numbers_still_work(self):
+        data = self.client.get('/api/notifications/?page=3&page_size=10').data
+        self.assertEqual([n['id'] for n in data['results']], self.expected[20:])
+        self.assertFalse(data['has_next'])
+
+    def test_out_of_range_paging_is_clamped(self):
+        for query in ('page_size=0', 'page_size=-5', 'page=0&page_size=1', 'page=-2&page_size=1'):
+            response = self.client.get(f'/api/notifications/?{query}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, query)
+            self.assertEqual([n['id'] for n in response.data['results']], self.expected[:1], query)
+            self.assertTrue(response.data['next_cursor'])
+        data = self.client.get('/api/notifications/?page_size=1000').data
+        self.assertEqual(len(data['results']), 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/notifications/?cursor=nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NotificationCoalescingTests(APITestCase):
+    """Test that notification bursts are merged and written after the response."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.users = [User.objects.create_user(username=f'burst{i}', password='pass123') for i in range(3)]
+        self.profiles = [Profile.objects.create(user=u, username=u.username) for u in self.users]
+        self.client = APIClient()
+
+    def send(self, sender, receiver, content):
+        self.client.force_authenticate(user=sender.user)
+        return self.client.post(f'/api/chat/{receiver.id}/send/', {'content': content}, format='multipart')
+
+    def test_message_burst_becomes_one_counted_row(self):
+        me, a, b = self.profiles
+        for i in range(5):
+            self.assertEqual(self.send(a, me, f'hi {i}').status_code, status.HTTP_201_CREATED)
+        self.send(b, me, 'hello')
+        rows = {n.sender_id: n for n in Notification.objects.filter(recipient=me)}
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[a.id].count, 5)
+        self.assertEqual(rows[a.id].title, '5 new messages from burst1')
+        self.assertEqual(rows[a.id].body, 'hi 4')
+        self.assertEqual((rows[b.id].count, rows[b.id].title), (1, 'New message from burst2'))
+
+    def test_merged_rows_move_past_the_sync_cursor(self):
+        me, a, _ = self.profiles
+        self.send(a, me, 'first')
+        seen = Notification.objects.get().id
+        self.send(a, me, 'second')
+        # A reconnecting client that saw the first row gets the digest again
+        merged = Notification.objects.get(recipient=me, id__gt=seen)
+        self.assertEqual((merged.count, merged.body), (2, 'second'))
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(BadgeService.counts(me.id)['notifications'], 1)
+
+    def test_flush_runs_before_connection_cleanup(self):
+        receivers = [ref() for _, ref, *rest in request_finished.receivers]
+        self.assertLess(receivers.index(flush_notifications), receivers.index(close_old_connections))
+
+    def test_read_or_stale_rows_are_not_merged(self):
+        me, a, _ = self.profiles
+        self.send(a, me, 'first')
+        Notification.objects.update(is_read=True)
+        self.send(a, me, 'second')
+        Notification.objects.filter(is_read=False).update(created_at=timezone.now() - timedelta(hours=1))
+        self.send(a, me, 'third')
+        self.assertEqual(list(Notification.objects.order_by('id').values_list('count', flat=True)), [1, 1, 1])
+
+    def test_notifications_are_buffered_until_the_request_finishes(self):
+        me, a, _ = self.profiles
+        seen = []
+        with mock.patch('core.notifications.write_notifications', side_effect=lambda n: seen.append(list(n))) as write:
+            self.send(a, me, 'hi')
+        # One write, handed the buffered notification after the view returned
+        write.assert_called_once()
+        self.assertEqual([n.body for n in seen[0]], ['hi'])
+
+
+class BadgeCounterTests(APITestCase):
+    """Test the maintained unread counters behind /api/badges/."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.users = [User.objects.create_user(username=f'badge{i}', password='pass123') for i in range(2)]
+        self.me, self.pal = [Profile.objects.create(user=u, username=u.username) for u in self.users]
+        self.client = APIClient()
+
+    def badges(self):
+        self.client.force_authenticate(user=self.users[0])
+        return self.client.get('/api/badges/').data
+
+    def test_counters_follow_creates_and_reads(self):
+        self.assertEqual(self.badges(), {'notifications': 0, 'messages': 0})
+        self.client.force_authenticate(user=self.users[1])
+        for text in ('one', 'two', 'three'):
+            self.client.post(f'/api/chat/{self.me.id}/send/', {'content': text})
+        self.client.post('/api/connections/request/', {'receiver_id': self.me.id}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.badges(), {'notifications': 2, 'messages': 3})
+        self.assertEqual(len(queries.captured_queries), 1)
+
+        self.client.get(f'/api/chat/{self.pal.id}/')
+        message_row = Notification.objects.get(notification_type='MESSAGE')
+        self.client.post(f'/api/notifications/{message_row.id}/read/')
+        self.client.post(f'/api/notifications/{message_row.id}/read/')
+        self.assertEqual(self.badges(), {'notifications': 1, 'messages': 0})
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.data['unread_count'], 1)
+        self.client.post('/api/notifications/read-all/')
+        self.assertEqual(self.badges(), {'notifications': 0, 'messages': 0})
+
+    def test_missing_row_is_rebuilt_from_tables(self):
+        Notification.objects.create(recipient=self.me, notification_type='COMMENT', title='t', body='b')
+        ConversationService.record_messages([ChatMessage.objects.create(sender=self.pal, receiver=self.me, content='x')])
+        self.assertFalse(UnreadCounts.objects.exists())
+        self.assertEqual(self.badges(), {'notifications': 1, 'messages': 1})
+        self.assertEqual(UnreadCounts.objects.get(profile=self.me).messages, 1)
+
+
+class BadgePushTests(TransactionTestCase):
+    """Test that badge changes are pushed to the profile's sockets."""
+
+    def setUp(self):
+        cache.clear()
+        PartnerService._profiles.clear()
+        self.me = Profile.objects.create(user=User.objects.create_user(username='pushed', password='pass123'), username='pushed')
+        self.pal = Profile.objects.create(user=User.objects.create_user(username='pusher', password='pass123'), username='pusher')
+        BadgeService.counts(self.me.id)
+
+    async def test_new_message_pushes_receiver_badges(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{self.me.id}/')
+        communicator.scope['user'] = await User.objects.aget(username='pushed')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await db_sync_to_async(persist_messages)([(self.pal, self.me, 'ping')])
+        self.assertEqual(
+            await communicator.receive_json_from(timeout=5), {'type': 'badges', 'notifications': 1, 'messages': 1}
+        )
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        await communicator.disconnect()
+
+
+@override_settings(PUSH_PROVIDER='core.push.FakePushProvider')
+class PushDispatchTests(TestCase):
+    """Test the push outbox and its dispatcher."""
+
+    def setUp(self):
+        users = [User.objects.create_user(username=f'push{i}', password='pass123') for i in range(3)]
+        self.with_token, self.other, self.sender = [Profile.objects.create(user=u, username=u.username) for u in users]
+        Profile.objects.filter(id=self.with_token.id).update(fcm_token='device-a')
+        Profile.objects.filter(id=self.other.id).update(fcm_token='device-b')
+        FakePushProvider.sent = []
+        FakePushProvider.outcomes = {}
+
+    def notify(self, recipient, body='hi'):
+        write_notifications([Notification(
+            recipient=recipient, sender=self.sender, notification_type='COMMENT', title='New Comment', body=body
+        )])
+
+    def test_notifications_queue_pushes_and_dispatch_sends_them(self):
+        self.notify(self.with_token)
+        self.notify(self.with_token, body='again')
+        self.notify(self.other)
+        # The coalesced row still pushes once per write, with the digest title
+        self.assertEqual(PushOutbox.objects.count(), 3)
+        self.assertEqual(PushOutbox.objects.order_by('id')[1].title, '2 new comments from push2')
+
+        out = io.StringIO()
+        call_command('dispatch_push', once=True, stdout=out)
+        self.assertEqual([m['token'] for m in FakePushProvider.sent], ['device-a', 'device-a', 'device-b'])
+        self.assertEqual(FakePushProvider.sent[0]['data']['type'], 'COMMENT')
+        self.assertFalse(PushOutbox.objects.exclude(status='SENT').exists())
+        self.assertIn('3 sent', out.getvalue())
+
+    def test_batches_are_split_per_provider_request(self):
+        for _ in range(3):
+            PushOutbox.objects.create(recipient=self.with_token, title='t', body='b')
+        provider = FakePushProvider()
+        provider.max_batch = 2
+        with mock.patch.object(provider, 'send', wraps=provider.send) as send:
+            stats = dispatch_batch(provider)
+        self.assertEqual([len(call.args[0]) for call in send.call_args_list], [2, 1])
+        self.assertEqual(stats['sent'], 3)
+
+    @override_settings(PUSH_MAX_ATTEMPTS=2, PUSH_RETRY_BASE_SECONDS=60)
+    def test_transient_failures_back_off_then_fail(self):
+        FakePushProvider.outcomes = {'device-a': RETRY}
+        row = PushOutbox.objects.create(recipient=self.with_token, title='t', body='b')
+        now = timezone.now()
+        self.assertEqual(dispatch_batch(now=now)['retried'], 1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('PENDING', 1))
+        self.assertGreater(row.next_attempt_at, now + timedelta(seconds=40))
+        # Not due again until the backoff has passed
+        self.assertEqual(dispatch_batch(now=now + timedelta(seconds=10))['claimed'], 0)
+        self.assertEqual(dispatch_batch(now=now + timedelta(minutes=5))['failed'], 1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('FAILED', 2))
+
+    def test_invalid_and_missing_tokens_are_dropped(self):
+        FakePushProvider.outcomes = {'device-a': INVALID_TOKEN}
+        PushOutbox.objects.create(recipient=self.with_token, title='t', body='b')
+        PushOutbox.objects.create(recipient=self.sender, title='t', body='b')
+        self.assertEqual(dispatch_batch()['dropped'], 2)
+        self.assertIsNone(Profile.objects.get(id=self.with_token.id).fcm_token)
+        self.assertFalse(PushOutbox.objects.exclude(status='DROPPED').exists())
+
+    def test_claimed_rows_are_leased(self):
+        PushOutbox.objects.create(recipient=self.with_token, title='t', body='b')
+        now = timezone.now()
+        self.assertEqual(len(claim_batch(10, now)), 1)
+        # A second worker finds nothing until the lease expires
+        self.assertEqual(claim_batch(10, now), [])
+        self.assertEqual(len(claim_batch(10, now + timedelta(hours=1))), 1)
+
+    def test_no_provider_leaves_rows_pending(self):
+        self.notify(self.with_token)
+        with override_settings(PUSH_PROVIDER=''):
+            with self.assertRaises(CommandError):
+                call_command('dispatch_push', once=True, stdout=io.StringIO())
+        self.assertEqual(PushOutbox.objects.get().status, 'PENDING')
+        self.assertEqual(FakePushProvider.sent, [])
+
+    @override_settings(PUSH_OUTBOX_RETENTION_DAYS=7)
+    def test_retention_expires_stale_pending_rows(self):
+        old = [PushOutbox.objects.create(recipient=self.with_token, title='t', body='b', status=s) for s in ('PENDING', 'SENT')]
+        fresh = PushOutbox.objects.create(recipient=self.with_token, title='t', body='b')
+        PushOutbox.objects.filter(id__in=[row.id for row in old]).update(created_at=timezone.now() - timedelta(days=8))
+        RetentionEngine(policies=[PushOutboxPolicy()], pause_ms=0).run()
+        self.assertEqual(list(PushOutbox.objects.values_list('id', flat=True)), [fresh.id])
+
+
 class ModelTests(TestCase):
     """Test model methods and properties."""
     
@@ -241,3 +1765,41 @@ class ModelTests(TestCase):
         Connection.objects.create(sender=profile1, receiver=profile2, status='CONNECTED')
         
         self.assertEqual(profile1.connections_count, 1)
+
+
+class GraphSnapshotTests(TestCase):
+    """Test the CSR graph export and memory-mapped loader."""
+
+    def setUp(self):
+        self.profiles = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'graphuser{i}', password='pass123')
+            self.profiles.append(Profile.objects.create(user=user, username=f'graphuser{i}'))
+        p0, p1, p2, p3 = self.profiles
+        Connection.objects.create(sender=p0, receiver=p1, status='CONNECTED')
+        Connection.objects.create(sender=p2, receiver=p0, status='CONNECTED')
+        Connection.objects.create(sender=p3, receiver=p0, status='PENDING')
+
+    def test_export_and_load_roundtrip(self):
+        """Only CONNECTED edges are exported, in both directions."""
+        p0, p1, p2, p3 = self.profiles
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command('export_graph', output=f'{tmp}/graph', stdout=io.StringIO())
+            with GraphSnapshot.load(f'{tmp}/graph') as graph:
+                self.assertEqual(len(graph), 3)
+                self.assertEqual(graph.num_edges, 2)
+                self.assertEqual(sorted(graph.neighbors(p0.id)), sorted([p1.id, p2.id]))
+                self.assertEqual(graph.neighbors(p1.id), [p0.id])
+                self.assertEqual(graph.degree(p3.id), 0)
+
+    def test_export_only_replaces_earlier_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command('export_graph', output=f'{tmp}/graph', stdout=io.StringIO())
+            call_command('export_graph', output=f'{tmp}/graph', stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(tmp)), ['graph'])
+
+            with open(f'{tmp}/notes.txt', 'w') as fh:
+                fh.write('keep me')
+            with self.assertRaises(CommandError):
+                call_command('export_graph', output=tmp, stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(tmp)), ['graph', 'notes.txt'])
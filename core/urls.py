@@ -6,10 +6,11 @@ from .views import (
     MyProfileView, ProfileDetailView, UpdateProfileView,
     CreatePostView, DeletePostView, LikePostView, CommentPostView, CommentListView, UserStreaksView, UserPostsView,
     ConnectionListView, SendConnectionRequestView, AcceptConnectionView, RejectConnectionView, DisconnectView,
+    BulkSendConnectionRequestsView, BulkAcceptConnectionsView, BulkRejectConnectionsView,
     ConversationListView, ChatMessagesView, SendMessageView,
     BlockUserView, ReportUserView, DeleteAccountView,
     InviteContributorView, ContributeToPostView, CollaborativePostsView, PostContributorsView,
-    RegisterDeviceView, PendingConnectionsView, NotificationListView, MarkNotificationReadView, MarkAllNotificationsReadView,
+    RegisterDeviceView, PendingConnectionsView, NotificationListView, MarkNotificationReadView, MarkAllNotificationsReadView, BadgesView,
     GenerateRecoveryCodesView, InitiateRecoveryView, GuardianApprovalView, ResetPasswordRecoveryView,
     ManageGuardiansView, PendingGuardianRequestsView,
     LeaderboardView, TrendingLocallyView, LikeCommentView
@@ -58,6 +59,9 @@ urlpatterns = [
     path('connections/<int:pk>/accept/', AcceptConnectionView.as_view(), name='accept_connection'),
     path('connections/<int:pk>/reject/', RejectConnectionView.as_view(), name='reject_connection'),
     path('connections/<int:pk>/disconnect/', DisconnectView.as_view(), name='disconnect_connection'),
+    path('connections/bulk/request/', BulkSendConnectionRequestsView.as_view(), name='bulk_send_connections'),
+    path('connections/bulk/accept/', BulkAcceptConnectionsView.as_view(), name='bulk_accept_connections'),
+    path('connections/bulk/reject/', BulkRejectConnectionsView.as_view(), name='bulk_reject_connections'),
     
     # Chat
     path('chat/conversations/', ConversationListView.as_view(), name='conversations'),
@@ -79,6 +83,7 @@ urlpatterns = [
     path('notifications/<int:pk>/read/', MarkNotificationReadView.as_view(), name='mark_notification_read'),
     path('notifications/read-all/', MarkAllNotificationsReadView.as_view(), name='mark_all_notifications_read'),
     path('notifications/register-device/', RegisterDeviceView.as_view(), name='register_device'),
+    path('badges/', BadgesView.as_view(), name='badges'),
     path('connections/pending/', PendingConnectionsView.as_view(), name='pending_connections'),
     
     # Account
@@ -1,25 +1,36 @@
+import heapq
 import secrets
 import string
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 from rest_framework import views, response, status, permissions
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework_simplejwt.views import TokenObtainPairView as SimpleJWTTokenObtainPairView
-from django.db.models import Q, Max
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Max, OuterRef, Subquery
 from .serializers import (
     RegistrationSerializer, ProfileSerializer, PostSerializer, 
     LocationRoomSerializer, ConnectionSerializer, ChatMessageSerializer,
     CommentSerializer, LikeSerializer, StreakSerializer, NotificationSerializer,
-    RecoverySerializer, PasswordResetSerializer
+    RecoverySerializer, PasswordResetSerializer, RowPlan, card_picture_url
 )
 from .models import (
     Profile, Post, LocationRoom, Interest, Connection, ChatMessage, 
     Like, Comment, Streak, Notification, RecoveryCode, RecoveryGuardian, RecoveryRequest, Report
 )
-from .services import MatchService, FeedService, ProximityService, StreakService
+from .services import (
+    MatchService, FeedService, ProximityService, StreakService, BlocklistService, FriendService, PartnerService,
+    ConversationService, ProfileCardService, BadgeService
+)
+from .delivery import deliver_to_post_sync
+from .notifications import notify
+from .signals import deferred_gravity_refresh, mark_for_gravity_refresh
 from .throttles import AuthThrottle, RecoveryThrottle
 
+MAX_BULK_CONNECTIONS = 100
+
 
 class TokenObtainPairView(SimpleJWTTokenObtainPairView):
     throttle_classes = [AuthThrottle]
@@ -52,6 +63,9 @@ class MyProfileView(views.APIView):
 class ProfileDetailView(views.APIView):
     def get(self, request, pk):
         try:
+            # Blocked in either direction looks the same as a missing profile
+            if pk in BlocklistService.get_blocked_ids(request.user.profile):
+                raise Profile.DoesNotExist
             profile = Profile.objects.get(pk=pk)
             serializer = ProfileSerializer(profile, context={'request': request})
             return response.Response(serializer.data)
@@ -63,11 +77,14 @@ class UpdateProfileView(views.APIView):
     parser_classes = [MultiPartParser, FormParser]
     
     def put(self, request):
-        profile = request.user.profile
-        serializer = ProfileSerializer(profile, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return response.Response(serializer.data)
+        with transaction.atomic():
+            # request.user.profile can be a cached copy; saving it whole would write
+            # back stale counters and tokens, so edit the locked row instead
+            profile = Profile.objects.select_for_update().get(pk=request.user.profile.pk)
+            serializer = ProfileSerializer(profile, data=request.data, partial=True)
+            if serializer.is_valid():
+                serializer.save()
+                return response.Response(serializer.data)
         return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -80,7 +97,9 @@ class FeedView(views.APIView):
         profile = request.user.profile
         posts = FeedService.get_local_feed(user_profile=profile, page=page, page_size=page_size, shuffle=shuffle)
         
-        serializer = PostSerializer(posts, many=True, context={'request': request})
+        serializer = PostSerializer(
+            posts, many=True, context={'request': request}, fields=request.query_params.get('fields')
+        )
         return response.Response({
             'results': serializer.data,
             'has_next': len(posts) == page_size
@@ -93,9 +112,13 @@ class TrendingFeedView(views.APIView):
         page_size = 20
         shuffle = request.query_params.get('random') == 'true'
         
-        posts = FeedService.get_trending_feed(page=page, page_size=page_size, shuffle=shuffle)
+        posts = FeedService.get_trending_feed(
+            page=page, page_size=page_size, shuffle=shuffle, user_profile=request.user.profile
+        )
         
-        serializer = PostSerializer(posts, many=True, context={'request': request})
+        serializer = PostSerializer(
+            posts, many=True, context={'request': request}, fields=request.query_params.get('fields')
+        )
         return response.Response({
             'results': serializer.data,
             'has_next': len(posts) == page_size
@@ -174,13 +197,13 @@ class CommentPostView(views.APIView):
             # Notify post author or parent comment author
             recipient = parent.user if parent else post.author
             if recipient != profile:
-                Notification.objects.create(
+                notify(Notification(
                     recipient=recipient,
                     sender=profile,
                     notification_type='COMMENT',
                     title='New interaction' if parent else 'New Comment',
                     body=f'{profile.username} replied to your comment' if parent else f'{profile.username} commented on your post'
-                )
+                ))
 
             serializer = CommentSerializer(comment, context={'request': request})
             return response.Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -195,6 +218,9 @@ class CommentListView(views.APIView):
             # Only get top-level comments; replies can be fetched or included
             # For simplicity, let's include all and let the frontend thread them
             comments = post.comments.all().order_by('-created_at')
+            blocked_ids = BlocklistService.get_blocked_ids(request.user.profile)
+            if blocked_ids:
+                comments = [c for c in comments if c.user_id not in blocked_ids]
             serializer = CommentSerializer(comments, many=True, context={'request': request})
             return response.Response(serializer.data)
         except Post.DoesNotExist:
@@ -229,8 +255,10 @@ class UserPostsView(views.APIView):
         if user_id:
             try:
                 profile = Profile.objects.get(pk=user_id)
-            except Profile.DoesNotExist:
+            except (Profile.DoesNotExist, ValueError):
                 return response.Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+            if profile.id in BlocklistService.get_blocked_ids(request.user.profile):
+                return response.Response([])
         else:
             profile = request.user.profile
             
@@ -254,9 +282,15 @@ class SuggestedPeopleView(views.APIView):
             
         paginated_suggestions = suggestions[:page_size]
         
-        serializer = ProfileSerializer(paginated_suggestions, many=True, context={'request': request})
+        fields = request.query_params.get('fields')
+        if fields == 'card':
+            results = ProfileSerializer.render_cards([p.id for p in paginated_suggestions], {'request': request})
+        else:
+            results = ProfileSerializer(
+                paginated_suggestions, many=True, context={'request': request}, fields=fields
+            ).data
         return response.Response({
-            'results': serializer.data,
+            'results': results,
             'has_next': len(suggestions) > page_size
         })
 
@@ -311,7 +345,7 @@ class ConnectionListView(views.APIView):
         connections = Connection.objects.filter(
             Q(sender=profile, status='CONNECTED') | Q(receiver=profile, status='CONNECTED')
         ).select_related('sender', 'receiver')
-        serializer = ConnectionSerializer(connections, many=True)
+        serializer = ConnectionSerializer(connections, many=True, fields=request.query_params.get('fields'))
         return response.Response(serializer.data)
 
 
@@ -342,13 +376,13 @@ class SendConnectionRequestView(views.APIView):
         connection = Connection.objects.create(sender=profile, receiver=receiver, status='PENDING')
         
         # Log Notification
-        Notification.objects.create(
+        notify(Notification(
             recipient=receiver,
             sender=profile,
             notification_type='CONNECTION_REQUEST',
             title='New Connection Request',
             body=f'{profile.username} wants to connect with you!'
-        )
+        ))
         
         serializer = ConnectionSerializer(connection)
         return response.Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -363,13 +397,13 @@ class AcceptConnectionView(views.APIView):
             connection.save()
             
             # Log Notification
-            Notification.objects.create(
+            notify(Notification(
                 recipient=connection.sender,
                 sender=profile,
                 notification_type='CONNECTION_ACCEPTED',
                 title='Request Accepted',
                 body=f'{profile.username} accepted your connection request!'
-            )
+            ))
             
             serializer = ConnectionSerializer(connection)
             return response.Response(serializer.data)
@@ -388,77 +422,277 @@ class RejectConnectionView(views.APIView):
             return response.Response({"error": "Connection request not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+def parse_profile_ids(request):
+    """Returns (ids, error_response) for bulk endpoints taking `profile_ids`."""
+    if hasattr(request.data, 'getlist'):
+        raw_ids = request.data.getlist('profile_ids')
+    else:
+        raw_ids = request.data.get('profile_ids')
+
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return None, response.Response({"error": "profile_ids must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw_ids))
+    except (TypeError, ValueError):
+        return None, response.Response({"error": "profile_ids must contain integers"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > MAX_BULK_CONNECTIONS:
+        return None, response.Response({"error": f"At most {MAX_BULK_CONNECTIONS} profiles per request"}, status=status.HTTP_400_BAD_REQUEST)
+    return ids, None
+
+
+class BulkSendConnectionRequestsView(views.APIView):
+    def post(self, request):
+        """Send connection requests to many profiles at once."""
+        profile = request.user.profile
+        ids, error = parse_profile_ids(request)
+        if error:
+            return error
+
+        # Validate every target and find existing connections in one query
+        existing_status = Connection.objects.filter(
+            Q(sender=profile, receiver=OuterRef('pk')) | Q(sender=OuterRef('pk'), receiver=profile)
+        ).values('status')[:1]
+        targets = dict(
+            Profile.objects.filter(id__in=ids)
+            .annotate(existing_status=Subquery(existing_status))
+            .values_list('id', 'existing_status')
+        )
+
+        sent, skipped = [], {}
+        for target_id in ids:
+            if target_id == profile.id:
+                skipped[target_id] = 'SELF'
+            elif target_id not in targets:
+                skipped[target_id] = 'NOT_FOUND'
+            elif targets[target_id]:
+                skipped[target_id] = targets[target_id]
+            else:
+                sent.append(target_id)
+
+        # PENDING requests don't change connection counts, so no gravity refresh is needed
+        with transaction.atomic():
+            # Locking the sender serializes its bulk sends, so rows a racing
+            # request inserted since the check above are seen here and neither
+            # inserted again nor notified twice
+            Profile.objects.select_for_update().values_list('pk', flat=True).get(pk=profile.pk)
+            raced = dict(Connection.objects.filter(sender=profile, receiver_id__in=sent).values_list('receiver_id', 'status'))
+            skipped.update(raced)
+            sent = [target_id for target_id in sent if target_id not in raced]
+            Connection.objects.bulk_create([
+                Connection(sender=profile, receiver_id=target_id, status='PENDING')
+                for target_id in sent
+            ], ignore_conflicts=True)
+            notify(*[
+                Notification(
+                    recipient_id=target_id,
+                    sender=profile,
+                    notification_type='CONNECTION_REQUEST',
+                    title='New Connection Request',
+                    body=f'{profile.username} wants to connect with you!'
+                ) for target_id in sent
+            ])
+
+        return response.Response({"sent": sent, "skipped": skipped}, status=status.HTTP_201_CREATED if sent else status.HTTP_200_OK)
+
+
+class BulkAcceptConnectionsView(views.APIView):
+    def post(self, request):
+        """Accept pending requests from many senders at once."""
+        profile = request.user.profile
+        ids, error = parse_profile_ids(request)
+        if error:
+            return error
+
+        with transaction.atomic(), deferred_gravity_refresh():
+            # Locked, so a racing accept or reject of the same request waits
+            # and then no longer finds it PENDING: only rows updated here notify
+            pending = list(
+                Connection.objects.select_for_update().filter(receiver=profile, sender_id__in=ids, status='PENDING')
+            )
+            now = timezone.now()
+            for connection in pending:
+                connection.status = 'CONNECTED'
+                connection.updated_at = now  # bulk_update bypasses auto_now
+            accepted = [c.sender_id for c in pending]
+            Connection.objects.bulk_update(pending, ['status', 'updated_at'])
+            notify(*[
+                Notification(
+                    recipient_id=sender_id,
+                    sender=profile,
+                    notification_type='CONNECTION_ACCEPTED',
+                    title='Request Accepted',
+                    body=f'{profile.username} accepted your connection request!'
+                ) for sender_id in accepted
+            ])
+            if accepted:
+                mark_for_gravity_refresh(profile.id, *accepted)
+                FriendService.invalidate(profile.id, *accepted)
+
+        accepted_ids = set(accepted)
+        skipped = {i: 'NOT_FOUND' for i in ids if i not in accepted_ids}
+        return response.Response({"accepted": accepted, "skipped": skipped})
+
+
+class BulkRejectConnectionsView(views.APIView):
+    def post(self, request):
+        """Reject pending requests from many senders at once."""
+        profile = request.user.profile
+        ids, error = parse_profile_ids(request)
+        if error:
+            return error
+
+        pending = Connection.objects.filter(receiver=profile, sender_id__in=ids, status='PENDING')
+        rejected = list(pending.values_list('sender_id', flat=True))
+        with transaction.atomic(), deferred_gravity_refresh():
+            pending.delete()
+
+        rejected_ids = set(rejected)
+        skipped = {i: 'NOT_FOUND' for i in ids if i not in rejected_ids}
+        return response.Response({"rejected": rejected, "skipped": skipped})
+
+
 # Chat Views
-from django.db.models import OuterRef, Subquery, IntegerField, CharField, DateTimeField, Count, Case, When, Value
+from django.db.models import Count
 
 class ConversationListView(views.APIView):
+    page_size = 50
+
     def get(self, request):
+        """
+        The inbox, read from maintained Conversation rows in activity order.
+
+        Without `?page=` every conversation is returned as a list (what the
+        app expects); with it, pages of `page_size` come back as
+        {'results': [...], 'has_next': bool} like the other paginated lists.
+        """
         profile = request.user.profile
-        
-        # Subquery to get the last message content for each conversation partner
-        last_msg_subquery = ChatMessage.objects.filter(
-            Q(sender=profile, receiver=OuterRef('pk')) | Q(sender=OuterRef('pk'), receiver=profile)
-        ).order_by('-timestamp')
-
-        # Subquery to get unread count from the partner
-        unread_count_subquery = ChatMessage.objects.filter(
-            sender=OuterRef('pk'), 
-            receiver=profile, 
-            is_read=False
-        ).values('receiver').annotate(cnt=Count('pk')).values('cnt')
-
-        # Main query: Fetch partners and annotate with subquery data
-        partners = Profile.objects.filter(
-            Q(sent_messages__receiver=profile) | Q(received_messages__sender=profile)
-        ).distinct().annotate(
-            last_msg_content=Subquery(last_msg_subquery.values('content')[:1], output_field=CharField()),
-            last_msg_timestamp=Subquery(last_msg_subquery.values('timestamp')[:1], output_field=DateTimeField()),
-            unread_count=Subquery(unread_count_subquery, output_field=IntegerField())
-        )
-        
-        conversations = []
-        for partner in partners:
-            conversations.append({
-                'partner_id': partner.id,
-                'partner_name': partner.username,
-                'partner_pic': partner.profile_picture.url if partner.profile_picture else None,
-                'last_message': partner.last_msg_content or '',
-                'last_timestamp': partner.last_msg_timestamp,
-                'unread_count': partner.unread_count or 0
+        conversations = ConversationService.inbox(profile)
+
+        page = request.query_params.get('page')
+        if page is not None:
+            start = (int(page) - 1) * self.page_size
+            # One extra row tells us whether another page exists
+            conversations = list(conversations[start:start + self.page_size + 1])
+            has_next = len(conversations) > self.page_size
+            conversations = conversations[:self.page_size]
+        else:
+            conversations = list(conversations)
+
+        partner_ids = [
+            c.participant_b_id if c.participant_a_id == profile.id else c.participant_a_id
+            for c in conversations
+        ]
+        # Partner names and pictures come from the profile card cache
+        cards = ProfileCardService.get_cards(partner_ids)
+        results = []
+        for conversation, partner_id in zip(conversations, partner_ids):
+            card = cards.get(partner_id)
+            if card is None:
+                continue
+            results.append({
+                'partner_id': partner_id,
+                'partner_name': card['username'],
+                'partner_pic': card_picture_url(card),
+                'last_message': conversation.last_message_preview,
+                'last_timestamp': conversation.last_timestamp,
+                'unread_count': getattr(conversation, ConversationService.unread_field(
+                    (conversation.participant_a_id, conversation.participant_b_id), profile.id
+                )),
             })
-        
-        conversations.sort(key=lambda x: x['last_timestamp'] or timezone.now() - timedelta(days=365), reverse=True)
-        return response.Response(conversations)
+
+        if page is not None:
+            return response.Response({'results': results, 'has_next': has_next})
+        return response.Response(results)
 
 
 class ChatMessagesView(views.APIView):
+    page_size = 20
+
     def get(self, request, user_id):
+        """
+        One page of the conversation with `user_id`, oldest first.
+
+        `?before_id=` returns the messages just older than that message and
+        `?after_id=` the ones just newer (delta sync after a reconnect); with
+        neither, the latest page. Each direction of the pair is a separate
+        range scan on the (sender, receiver, -timestamp) index capped at one
+        page, so the cost doesn't grow with the history. The user's read
+        watermark moves up to the newest partner message in the returned
+        page. `?page=N` (N > 1) keeps the old OFFSET paging for older clients.
+
+        `has_next` says whether more messages exist in the requested
+        direction; `oldest_id`/`newest_id` are the cursors for the next call.
+        """
         profile = request.user.profile
         try:
             other_user = Profile.objects.get(pk=user_id)
         except Profile.DoesNotExist:
             return response.Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        page = int(request.query_params.get('page', 1))
-        page_size = 20
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        # Get messages in reverse order for pagination, then flip back for display
-        messages = ChatMessage.objects.filter(
-            Q(sender=profile, receiver=other_user) | Q(sender=other_user, receiver=profile)
-        ).select_related('sender', 'receiver').order_by('-timestamp')[start:end]
-        
-        # Mark messages as read
-        ChatMessage.objects.filter(sender=other_user, receiver=profile, is_read=False).update(is_read=True)
-        
-        # Re-order to chronological for the frontend
-        msg_list = sorted(list(messages), key=lambda x: x.timestamp)
-        serializer = ChatMessageSerializer(msg_list, many=True)
-        
+
+        try:
+            page = int(request.query_params.get('page', 1))
+            after_id = request.query_params.get('after_id')
+            before_id = request.query_params.get('before_id')
+            anchor_id = int(after_id or before_id) if (after_id or before_id) else None
+        except ValueError:
+            return response.Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        newer = after_id is not None
+
+        plan = RowPlan.for_serializer(ChatMessageSerializer()) if settings.FAST_SERIALIZATION else None
+        if plan is not None:
+            # Flat rows straight from the database, no model instances
+            columns = list(dict.fromkeys([*plan.columns, 'id', 'timestamp', 'sender', 'is_read']))
+            fetch = lambda qs, start, stop: list(qs.values(*columns)[start:stop])
+            read, write, sender_field = dict.__getitem__, dict.__setitem__, 'sender'
+        else:
+            plan = None
+            fetch = lambda qs, start, stop: list(qs.select_related('sender', 'receiver')[start:stop])
+            read, write, sender_field = getattr, setattr, 'sender_id'
+        key = lambda m: (read(m, 'timestamp'), read(m, 'id'))
+
+        limit = self.page_size + 1  # one extra row tells us whether more exist
+        if anchor_id is None and page > 1:
+            start = (page - 1) * self.page_size
+            conversation = ChatMessage.objects.with_read_state().filter(
+                Q(sender=profile, receiver=other_user) | Q(sender=other_user, receiver=profile)
+            ).order_by('-timestamp', '-id')
+            messages = fetch(conversation, start, start + limit)
+        else:
+            cursor = Q()
+            if anchor_id is not None:
+                anchor_ts = ChatMessage.objects.filter(pk=anchor_id).values_list('timestamp', flat=True).first()
+                op = 'gt' if newer else 'lt'
+                if anchor_ts is None:
+                    # Anchor expired or deleted: ids still increase with time
+                    cursor = Q(**{f'id__{op}': anchor_id})
+                else:
+                    cursor = Q(**{f'timestamp__{op}': anchor_ts}) | Q(timestamp=anchor_ts, **{f'id__{op}': anchor_id})
+            ordering = ('timestamp', 'id') if newer else ('-timestamp', '-id')
+            pages = [
+                fetch(
+                    ChatMessage.objects.with_read_state()
+                    .filter(cursor, sender=sender, receiver=receiver).order_by(*ordering), 0, limit
+                )
+                for sender, receiver in ((profile, other_user), (other_user, profile))
+            ]
+            messages = list(heapq.merge(*pages, key=key, reverse=not newer))
+
+        has_next = len(messages) > self.page_size
+        messages = sorted(messages[:self.page_size], key=key)
+
+        # Read up to the newest partner message the user is actually shown
+        unread = [m for m in messages if read(m, sender_field) == other_user.id and not read(m, 'is_read')]
+        if unread:
+            ConversationService.mark_read(profile.id, other_user.id, up_to=max(read(m, 'id') for m in unread))
+            for m in unread:
+                write(m, 'is_read', True)
+
+        results = plan.render_values(messages) if plan else ChatMessageSerializer(messages, many=True).data
         return response.Response({
-            'results': serializer.data,
-            'has_next': len(msg_list) == page_size
+            'results': results,
+            'has_next': has_next,
+            'oldest_id': results[0]['id'] if results else None,
+            'newest_id': results[-1]['id'] if results else None,
         })
 
 
@@ -467,10 +701,11 @@ class SendMessageView(views.APIView):
 
     def post(self, request, user_id):
         profile = request.user.profile
-        try:
-            receiver = Profile.objects.get(pk=user_id)
-        except Profile.DoesNotExist:
+        receiver = PartnerService.get_partner(user_id)
+        if receiver is None:
             return response.Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        if PartnerService.is_blocked(profile, receiver.id):
+            return response.Response({"error": "You can't message this user"}, status=status.HTTP_403_FORBIDDEN)
         
         content = request.data.get('content', '')
         image = request.FILES.get('image')
@@ -480,20 +715,27 @@ class SendMessageView(views.APIView):
         if not content and not image and not video:
             return response.Response({"error": "Message content, image, or video required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        message = ChatMessage.objects.create(
-            sender=profile, receiver=receiver,
-            content=content, image=image, video=video, thumbnail=thumbnail
-        )
-        
-        # Log Notification
-        preview = content[:50] if content else ('📷 Image' if image else '🎥 Video')
-        Notification.objects.create(
-            recipient=receiver,
-            sender=profile,
-            notification_type='MESSAGE',
-            title=f'New message from {profile.username}',
-            body=preview + ('...' if len(content) > 50 else '')
-        )
+        try:
+            with transaction.atomic():
+                message = ChatMessage.objects.create(
+                    sender=profile, receiver=receiver,
+                    content=content, image=image, video=video, thumbnail=thumbnail
+                )
+                
+                # Log Notification
+                preview = content[:50] if content else ('📷 Image' if image else '🎥 Video')
+                notify(Notification(
+                    recipient=receiver,
+                    sender=profile,
+                    notification_type='MESSAGE',
+                    title=f'New message from {profile.username}',
+                    body=preview + ('...' if len(content) > 50 else '')
+                ))
+                ConversationService.record_messages([message])
+        except IntegrityError:
+            # The cached receiver was deleted since it was cached
+            PartnerService.forget(receiver.id)
+            return response.Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
         serializer = ChatMessageSerializer(message)
         return response.Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -651,13 +893,13 @@ class InviteContributorView(views.APIView):
         post.contributors.add(contributor)
         
         # Log Notification
-        Notification.objects.create(
+        notify(Notification(
             recipient=contributor,
             sender=profile,
             notification_type='COLLABORATION',
             title='Collaboration Invite',
             body=f'{profile.username} invited you to collaborate on a moment!'
-        )
+        ))
         
         return response.Response({
             "message": f"{contributor.username} has been invited to contribute",
@@ -702,6 +944,8 @@ class ContributeToPostView(views.APIView):
             post.image = image
         
         post.save()
+        # One group_send reaches every collaborator following the post
+        deliver_to_post_sync(post.id, {"type": "post.updated", "post_id": post.id, "contributor_id": profile.id})
         
         return response.Response({
             "message": "Contribution added successfully",
@@ -714,6 +958,9 @@ class CollaborativePostsView(views.APIView):
         """Get posts where user is a contributor (not author)."""
         profile = request.user.profile
         posts = Post.objects.filter(contributors=profile).order_by('-created_at')
+        blocked_ids = BlocklistService.get_blocked_ids(profile)
+        if blocked_ids:
+            posts = posts.exclude(author_id__in=blocked_ids)
         serializer = PostSerializer(posts, many=True)
         return response.Response(serializer.data)
 
@@ -742,7 +989,7 @@ class RegisterDeviceView(views.APIView):
         
         profile = request.user.profile
         profile.fcm_token = fcm_token
-        profile.save()
+        profile.save(update_fields=['fcm_token', 'last_active'])
         return response.Response({"message": "Device registered successfully"})
 
 
@@ -755,43 +1002,87 @@ class PendingConnectionsView(views.APIView):
 
 
 class NotificationListView(views.APIView):
+    # Cursors count microseconds from here, so they stay plain URL-safe digits
+    CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    max_page_size = 100
+
+    @classmethod
+    def encode_cursor(cls, notification):
+        micros = (notification.created_at - cls.CURSOR_EPOCH) // timedelta(microseconds=1)
+        return f'{micros}.{notification.id}'
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        micros, pk = cursor.split('.')
+        return cls.CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
     def get(self, request):
+        """
+        Newest first. `?cursor=` continues from the `next_cursor` of the
+        previous page: a keyset on (created_at, id) that is one range scan
+        on the (recipient, -created_at, -id) index however deep the page.
+        The cursor carries the timestamp itself because merging a burst
+        (core/notifications.py) moves a row's created_at. `?page=N` keeps
+        the old OFFSET paging for older clients. `page` and `page_size` are
+        clamped to 1 and 1..max_page_size.
+        """
         profile = request.user.profile
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 30))
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        notifications = Notification.objects.filter(recipient=profile).order_by('-created_at')
-        total = notifications.count()
-        paginated = notifications[start:end]
-        serializer = NotificationSerializer(paginated, many=True)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 30)), 1), self.max_page_size)
+            cursor = request.query_params.get('cursor')
+            anchor = self.decode_cursor(cursor) if cursor else None
+        except (ValueError, OverflowError):
+            return response.Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        notifications = Notification.objects.filter(recipient=profile).order_by('-created_at', '-id')
+        if anchor is not None:
+            anchor_ts, anchor_id = anchor
+            notifications = notifications.filter(Q(created_at__lt=anchor_ts) | Q(created_at=anchor_ts, id__lt=anchor_id))
+            start = 0
+        else:
+            start = (page - 1) * page_size
+        # One extra row tells whether there is a next page; the badge is a counter
+        page_rows = list(notifications[start:start + page_size + 1])
+        has_next = len(page_rows) > page_size
+        page_rows = page_rows[:page_size]
+        serializer = NotificationSerializer(page_rows, many=True)
         return response.Response({
             'results': serializer.data,
-            'has_next': total > end,
-            'unread_count': notifications.filter(is_read=False).count()
+            'has_next': has_next,
+            'next_cursor': self.encode_cursor(page_rows[-1]) if has_next else None,
+            'unread_count': BadgeService.counts(profile.id)['notifications']
         })
 
 
 class MarkNotificationReadView(views.APIView):
     def post(self, request, pk):
         profile = request.user.profile
-        try:
-            notification = Notification.objects.get(pk=pk, recipient=profile)
-            notification.is_read = True
-            notification.save()
-            return response.Response({"message": "Notification marked as read"})
-        except Notification.DoesNotExist:
-            return response.Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        notifications = Notification.objects.filter(pk=pk, recipient=profile)
+        with transaction.atomic():
+            # Only an unread -> read transition moves the badge
+            if notifications.filter(is_read=False).update(is_read=True):
+                BadgeService.add('notifications', {profile.id: -1})
+            elif not notifications.exists():
+                return response.Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        return response.Response({"message": "Notification marked as read"})
 
 
 class MarkAllNotificationsReadView(views.APIView):
     def post(self, request):
         profile = request.user.profile
-        updated = Notification.objects.filter(recipient=profile, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            updated = Notification.objects.filter(recipient=profile, is_read=False).update(is_read=True)
+            BadgeService.add('notifications', {profile.id: -updated})
         return response.Response({"message": f"{updated} notifications marked as read"})
 
 
+class BadgesView(views.APIView):
+    """Unread notification and chat message counts for the app's badges."""
+    def get(self, request):
+        return response.Response(BadgeService.counts(request.user.profile.id))
+
+
 # Password Recovery Views
 class GenerateRecoveryCodesView(views.APIView):
     def post(self, request):
@@ -838,13 +1129,13 @@ class InitiateRecoveryView(views.APIView):
         # Notify guardians
         guardians = RecoveryGuardian.objects.filter(profile=profile)
         for g in guardians:
-            Notification.objects.create(
+            notify(Notification(
                 recipient=g.guardian,
                 sender=profile,
                 notification_type='RECOVERY_VOUCH',
                 title='Vouch Requested',
                 body=f'{profile.username} needs a security vouch to recover their account.'
-            )
+            ))
         
         return response.Response({
             "message": "Recovery initiated",
@@ -980,8 +1271,15 @@ class PendingGuardianRequestsView(views.APIView):
 class LeaderboardView(views.APIView):
     def get(self, request):
         """Top 10 users ranked by social gravity."""
+        fields = request.query_params.get('fields')
+        if fields == 'card':
+            # Ids only; the cards themselves come from the profile card cache
+            profile_ids = list(Profile.objects.order_by('-social_gravity').values_list('id', flat=True)[:10])
+            return response.Response(ProfileSerializer.render_cards(profile_ids, {'request': request}))
+
+        # Users/interests are prefetched by the serializer only if the requested fields need them
         profiles = Profile.objects.order_by('-social_gravity')[:10]
-        serializer = ProfileSerializer(profiles, many=True, context={'request': request})
+        serializer = ProfileSerializer(profiles, many=True, context={'request': request}, fields=fields)
         return response.Response(serializer.data)
 
 class TrendingLocallyView(views.APIView):
@@ -994,6 +1292,9 @@ class TrendingLocallyView(views.APIView):
         region = profile.current_location.region if profile.current_location else None
         
         posts = Post.objects.filter(created_at__gt=day_ago)
+        blocked_ids = BlocklistService.get_blocked_ids(profile)
+        if blocked_ids:
+            posts = posts.exclude(author_id__in=blocked_ids)
         if region:
             posts = posts.filter(location__region=region)
             
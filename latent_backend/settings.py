@@ -99,6 +99,65 @@ else:
         },
     }
 
+# WebSocket chat messages are written in small batches per process:
+# collected for CHAT_BATCH_WINDOW_MS, at most CHAT_BATCH_MAX_SIZE per insert,
+# and refused with a backpressure error beyond CHAT_BATCH_MAX_PENDING queued.
+CHAT_BATCH_WINDOW_MS = int(os.getenv('CHAT_BATCH_WINDOW_MS', '5'))
+CHAT_BATCH_MAX_SIZE = int(os.getenv('CHAT_BATCH_MAX_SIZE', '100'))
+CHAT_BATCH_MAX_PENDING = int(os.getenv('CHAT_BATCH_MAX_PENDING', '1000'))
+
+# Chat partitioning (see core/partitions.py). On PostgreSQL messages are stored
+# in one partition per CHAT_PARTITION_DAYS of expires_at (1 = daily, 7 = weekly),
+# created CHAT_PARTITIONS_AHEAD days in advance.
+CHAT_PARTITION_DAYS = int(os.getenv('CHAT_PARTITION_DAYS', '1'))
+CHAT_PARTITIONS_AHEAD = int(os.getenv('CHAT_PARTITIONS_AHEAD', '14'))
+
+# Retention engine behind `cleanup_data` (see core/retention.py): rows are
+# removed RETENTION_BATCH_SIZE per transaction with RETENTION_PAUSE_MS between
+# batches, and a run stops after RETENTION_MAX_SECONDS so it fits a per-minute
+# schedule.
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+RETENTION_PAUSE_MS = int(os.getenv('RETENTION_PAUSE_MS', '50'))
+RETENTION_MAX_SECONDS = int(os.getenv('RETENTION_MAX_SECONDS', '45'))
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '30'))
+RECOVERY_REQUEST_RETENTION_DAYS = int(os.getenv('RECOVERY_REQUEST_RETENTION_DAYS', '30'))
+
+# Notifications from the same sender and of the same type within this many
+# seconds are merged into one unread row with a count (see core/notifications.py).
+NOTIFICATION_COALESCE_SECONDS = int(os.getenv('NOTIFICATION_COALESCE_SECONDS', '600'))
+
+# Push notifications (see core/push.py). Notifications queue PushOutbox rows;
+# `manage.py dispatch_push` sends them through PUSH_PROVIDER, up to
+# PUSH_BATCH_SIZE per claim, retrying with exponential backoff from
+# PUSH_RETRY_BASE_SECONDS up to PUSH_MAX_ATTEMPTS. Without FCM_PROJECT_ID (or
+# an explicit PUSH_PROVIDER) there is no provider: dispatch_push refuses to
+# start and queued rows stay PENDING until retention expires them. Tests
+# select core.push.FakePushProvider with override_settings.
+FCM_PROJECT_ID = os.getenv('FCM_PROJECT_ID', '')
+FCM_ACCESS_TOKEN = os.getenv('FCM_ACCESS_TOKEN', '')
+PUSH_PROVIDER = os.getenv('PUSH_PROVIDER', 'core.push.FCMPushProvider' if FCM_PROJECT_ID else '')
+PUSH_BATCH_SIZE = int(os.getenv('PUSH_BATCH_SIZE', '100'))
+PUSH_MAX_ATTEMPTS = int(os.getenv('PUSH_MAX_ATTEMPTS', '5'))
+PUSH_RETRY_BASE_SECONDS = int(os.getenv('PUSH_RETRY_BASE_SECONDS', '30'))
+PUSH_LEASE_SECONDS = int(os.getenv('PUSH_LEASE_SECONDS', '120'))
+PUSH_OUTBOX_RETENTION_DAYS = int(os.getenv('PUSH_OUTBOX_RETENTION_DAYS', '7'))
+
+# Cache - shared via Redis when available so per-profile caches
+# (blocklists, friend sets) stay consistent across workers
+if _redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': _redis_url,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -136,6 +195,12 @@ else:
             }
         }
 
+# Threads for the chat consumer's remaining synchronous DB calls (see
+# core/executors.py); each thread holds its own connection. 0 keeps Django's
+# single thread-sensitive executor, which SQLite needs for its writers.
+_default_db_threads = '0' if DATABASES['default']['ENGINE'].endswith('sqlite3') else '8'
+CHAT_DB_THREADS = int(os.getenv('CHAT_DB_THREADS', _default_db_threads))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -208,7 +273,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
@@ -222,6 +291,10 @@ REST_FRAMEWORK = {
     }
 }
 
+# Serve chat history from `.values()` rows through a precompiled RowPlan
+# instead of per-field DRF serialization. Output is identical either way.
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', 'True') == 'True'
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
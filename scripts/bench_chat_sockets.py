@@ -0,0 +1,148 @@
+"""
+Load benchmark for ChatConsumer: how many concurrent sockets one worker
+process sustains with CHAT_DB_THREADS=0 (everything on Django's single
+thread-sensitive executor) versus a thread pool.
+
+Every socket repeatedly sends a chat message and marks its inbox read,
+waiting for each ack. A socket count is "sustained" while the p95 ack
+latency stays under --slo-ms. --db-latency-ms adds a sleep to every query
+to stand in for the network round trip to a real database server.
+
+Runs in-process against a throwaway test database:
+
+    python scripts/bench_chat_sockets.py [--sockets 10,25,50,100,200] [--threads 8]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.append(os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'latent_backend.settings')
+django.setup()
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends import utils as db_utils
+from django.test import override_settings
+from django.test.utils import setup_test_environment
+
+from core.consumers import ChatConsumer
+from core.models import Profile
+
+
+def add_query_latency(seconds):
+    execute, executemany = db_utils.CursorWrapper.execute, db_utils.CursorWrapper.executemany
+
+    def slow_execute(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    def slow_executemany(self, *args, **kwargs):
+        time.sleep(seconds)
+        return executemany(self, *args, **kwargs)
+
+    db_utils.CursorWrapper.execute = slow_execute
+    db_utils.CursorWrapper.executemany = slow_executemany
+
+
+def seed(count):
+    users = User.objects.bulk_create([User(username=f'load{i}') for i in range(count)])
+    Profile.objects.bulk_create([Profile(user=u, username=u.username) for u in users])
+    return list(User.objects.select_related('profile').order_by('id'))
+
+
+async def expect(communicator, reply_type):
+    while True:
+        data = await communicator.receive_json_from(timeout=60)
+        if data.get('type') == reply_type or 'error' in data:
+            return data
+
+
+async def run_socket(communicator, partner_id, rounds, latencies):
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await communicator.send_json_to({'type': 'chat_message', 'receiver_id': partner_id, 'content': 'load'})
+        await expect(communicator, 'message_sent')
+        await communicator.send_json_to({'type': 'mark_read', 'sender_id': partner_id})
+        await expect(communicator, 'messages_read')
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run_level(users, sockets, rounds):
+    cache.clear()
+    communicators = []
+    for i in range(sockets):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{users[i].profile.id}/')
+        communicator.scope['user'] = users[i]
+        connected, _ = await communicator.connect(timeout=60)
+        assert connected, 'socket refused'
+        communicators.append(communicator)
+
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_socket(communicator, users[(i + 1) % sockets].profile.id, rounds, latencies)
+        for i, communicator in enumerate(communicators)
+    ))
+    elapsed = time.perf_counter() - started
+    for communicator in communicators:
+        await communicator.disconnect()
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'rate': len(latencies) / elapsed,
+    }
+
+
+def bench(users, levels, threads, rounds, slo_ms):
+    print(f"CHAT_DB_THREADS={threads}:")
+    sustained = 0
+    with override_settings(CHAT_DB_THREADS=threads):
+        for sockets in levels:
+            # Each level gets a new event loop; the batcher restarts on it
+            result = asyncio.run(run_level(users, sockets, rounds))
+            ok = result['p95'] <= slo_ms
+            sustained = sockets if ok else sustained
+            print(f"  {sockets:>5} sockets  p50 {result['p50']:8.1f} ms  p95 {result['p95']:8.1f} ms"
+                  f"  {result['rate']:8.1f} round trips/s  {'ok' if ok else 'over SLO'}")
+    print(f"  sustained: {sustained} sockets under p95 {slo_ms} ms")
+    return sustained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sockets', default='10,25,50,100,200', help='Comma-separated socket counts to try')
+    parser.add_argument('--rounds', type=int, default=5, help='Send + mark_read round trips per socket')
+    parser.add_argument('--threads', type=int, default=8, help='CHAT_DB_THREADS for the pooled run')
+    parser.add_argument('--db-latency-ms', type=float, default=2.0, help='Simulated per-query round trip')
+    parser.add_argument('--slo-ms', type=float, default=500.0, help='p95 ack latency a level must meet')
+    args = parser.parse_args()
+    levels = [int(n) for n in args.sockets.split(',')]
+
+    if connection.vendor == 'sqlite':
+        # Pool threads need a file database to share; the default test DB is in-memory
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        users = seed(max(levels))
+        if args.db_latency_ms:
+            add_query_latency(args.db_latency_ms / 1000)
+        before = bench(users, levels, 0, args.rounds, args.slo_ms)
+        after = bench(users, levels, args.threads, args.rounds, args.slo_ms)
+        print(f"sustained sockets: {before} -> {after}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()